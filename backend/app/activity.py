@@ -0,0 +1,120 @@
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from db.models import ActivityCounter, Appointment, Patient, RatingRollup
+from db.upsert import upsert_increment
+from app.snapshots import statistics_snapshots
+
+# Appointment categories containing one of these words count as emergency admissions
+EMERGENCY_WORDS = ("emergency", "urgent", "urgence")
+# Length of the current and the previous period compared by the hospital statistics
+DELTA_PERIOD_DAYS = 30
+
+def admission_kind(category: Optional[str]) -> str:
+    category = (category or "").lower()
+    return "emergency" if any(word in category for word in EMERGENCY_WORDS) else "scheduled"
+
+def _appointment_rows(appointments: Iterable[Tuple[date, Optional[str], Optional[str]]], sign: int) -> list:
+    rows = []
+    for day, category, status in appointments:
+        rows.append({"metric": "admissions", "day": day, "key": admission_kind(category), "value": sign})
+        rows.append({"metric": "appointment_status", "day": day, "key": status or "scheduled", "value": sign})
+    return rows
+
+def record_appointments(db: Session, added: Iterable[Tuple[date, Optional[str], Optional[str]]] = (), removed: Iterable[Tuple[date, Optional[str], Optional[str]]] = ()):
+    """Count added and uncount removed (date, category, status) appointments
+
+    An update is the old values removed and the new ones added. Call inside
+    the transaction that writes the appointments.
+    """
+    rows = _appointment_rows(added, 1) + _appointment_rows(removed, -1)
+    upsert_increment(db, ActivityCounter, rows, ["metric", "day", "key"], ["value"])
+    # Each appointment adds two counter rows
+    statistics_snapshots.record_writes(len(rows) // 2)
+
+def record_patients(db: Session, days: Iterable[date]):
+    """Count patients registered on the given days"""
+    rows = [{"metric": "patients", "day": day, "key": "", "value": 1} for day in days]
+    upsert_increment(db, ActivityCounter, rows, ["metric", "day", "key"], ["value"])
+    statistics_snapshots.record_writes(len(rows))
+
+def rebuild_activity_counters(db: Session):
+    """Recompute the activity counters from the appointments and patients tables"""
+    db.query(ActivityCounter).delete(synchronize_session=False)
+    counts: Dict[Tuple[str, date, str], int] = {}
+    rows = (
+        db.query(Appointment.date, Appointment.category, Appointment.status, func.count())
+        .group_by(Appointment.date, Appointment.category, Appointment.status)
+    )
+    for day, category, status, count in rows:
+        for row in _appointment_rows([(day, category, status)], count):
+            key = (row["metric"], row["day"], row["key"])
+            counts[key] = counts.get(key, 0) + row["value"]
+    registered = func.date(Patient.created_at)
+    for day, count in db.query(registered, func.count()).filter(Patient.created_at.isnot(None)).group_by(registered):
+        # SQLite returns date() as text
+        counts[("patients", date.fromisoformat(str(day)), "")] = count
+    if counts:
+        db.execute(ActivityCounter.__table__.insert(), [
+            {"metric": metric, "day": day, "key": key, "value": value}
+            for (metric, day, key), value in counts.items()
+        ])
+
+def counter_totals(db: Session, metric: str, first: Optional[date] = None, last: Optional[date] = None) -> Dict[str, int]:
+    """Sum of a metric's counters per key between two days (inclusive)"""
+    query = db.query(ActivityCounter.key, func.sum(ActivityCounter.value)).filter(ActivityCounter.metric == metric)
+    if first:
+        query = query.filter(ActivityCounter.day >= first)
+    if last:
+        query = query.filter(ActivityCounter.day <= last)
+    return {key: int(total or 0) for key, total in query.group_by(ActivityCounter.key)}
+
+def monthly_admissions(db: Session, months: int, today: date) -> list:
+    """Emergency and scheduled admissions for the last `months` calendar months, oldest first"""
+    starts = [today.replace(day=1)]
+    for _ in range(months - 1):
+        starts.insert(0, (starts[0] - timedelta(days=1)).replace(day=1))
+    next_month = (starts[-1] + timedelta(days=32)).replace(day=1)
+    totals = {start: {"emergency": 0, "scheduled": 0} for start in starts}
+    rows = (
+        db.query(ActivityCounter.day, ActivityCounter.key, ActivityCounter.value)
+        .filter(ActivityCounter.metric == "admissions", ActivityCounter.day >= starts[0], ActivityCounter.day < next_month)
+    )
+    for day, kind, value in rows:
+        totals[day.replace(day=1)][kind] += value
+    return [{"name": start.strftime("%b"), **totals[start]} for start in starts]
+
+def period_deltas(db: Session, today: date) -> Dict[str, Tuple[float, float]]:
+    """(current, previous) values of the last DELTA_PERIOD_DAYS days and the period before
+
+    Patients are new registrations, appointments are appointments falling in
+    the period and satisfaction is the mean rating as a percentage.
+    """
+    current_start = today - timedelta(days=DELTA_PERIOD_DAYS - 1)
+    previous_start = current_start - timedelta(days=DELTA_PERIOD_DAYS)
+    previous_end = current_start - timedelta(days=1)
+    deltas = {}
+    for name, metric in (("patients", "patients"), ("appointments", "admissions")):
+        deltas[name] = (
+            float(sum(counter_totals(db, metric, current_start, today).values())),
+            float(sum(counter_totals(db, metric, previous_start, previous_end).values())),
+        )
+
+    # Ratings come from the daily rating rollups (see app/rollups.py), which
+    # are kept for longer than two periods
+    ratings = {"current": [0, 0], "previous": [0, 0]}
+    rows = (
+        db.query(RatingRollup.bucket_start, func.sum(RatingRollup.feedback_count), func.sum(RatingRollup.rating_sum))
+        .filter(RatingRollup.granularity == "day", RatingRollup.bucket_start >= previous_start, RatingRollup.bucket_start <= today)
+        .group_by(RatingRollup.bucket_start)
+    )
+    for day, count, total in rows:
+        totals = ratings["current" if day >= current_start else "previous"]
+        totals[0] += count or 0
+        totals[1] += total or 0
+    deltas["satisfaction"] = tuple(
+        total / count * 20 if count else 0.0
+        for count, total in (ratings["current"], ratings["previous"])
+    )
+    return deltas
@@ -0,0 +1,169 @@
+import math
+import sys
+from datetime import datetime
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import func, literal, select, union
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from db.models import Appointment, DoctorAggregate, DoctorCategoryAggregate, DoctorPatientLink, Feedback
+from db.upsert import dialect_insert, upsert_increment
+from app.rollups import rebuild_rating_rollups, record_ratings
+from app.activity import rebuild_activity_counters
+from app.snapshots import statistics_snapshots
+
+RATING_COUNTERS = ["feedback_count", "rating_sum", "rating_sum_sq"]
+
+def average(aggregate) -> float:
+    """Mean rating of an aggregate row (0 when it has no feedback)"""
+    if aggregate is None or not aggregate.feedback_count:
+        return 0.0
+    return aggregate.rating_sum / aggregate.feedback_count
+
+def stddev(aggregate) -> float:
+    """Population standard deviation of the ratings of an aggregate row"""
+    if aggregate is None or not aggregate.feedback_count:
+        return 0.0
+    mean = average(aggregate)
+    return math.sqrt(max(aggregate.rating_sum_sq / aggregate.feedback_count - mean * mean, 0.0))
+
+def record_patient_links(db: Session, pairs: Iterable[Tuple[int, int]]):
+    """Remember (doctor_id, patient_id) pairs and count the new ones per doctor
+
+    Call inside the transaction that creates the appointment or feedback.
+    """
+    rows = [{"doctor_id": doctor_id, "patient_id": patient_id} for doctor_id, patient_id in set(pairs)]
+    if not rows:
+        return
+    stmt = (
+        dialect_insert(db, DoctorPatientLink)
+        .on_conflict_do_nothing(index_elements=["doctor_id", "patient_id"])
+        .returning(DoctorPatientLink.doctor_id)
+    )
+    new_links = Counter(db.execute(stmt, rows).scalars().all())
+    upsert_increment(
+        db,
+        DoctorAggregate,
+        [
+            {"doctor_id": doctor_id, "feedback_count": 0, "rating_sum": 0, "rating_sum_sq": 0, "patient_count": count}
+            for doctor_id, count in new_links.items()
+        ],
+        ["doctor_id"],
+        ["patient_count"],
+    )
+
+def record_feedback(db: Session, entries: Iterable[Tuple[int, int, int, int, datetime]]):
+    """Add (doctor_id, patient_id, category_id, rating, created_at) feedback to the aggregates
+
+    Call inside the transaction that inserts the feedback rows.
+    """
+    entries = list(entries)
+    if not entries:
+        return
+    upsert_increment(
+        db,
+        DoctorAggregate,
+        [
+            {"doctor_id": doctor_id, "feedback_count": 1, "rating_sum": rating, "rating_sum_sq": rating * rating, "patient_count": 0}
+            for doctor_id, _, _, rating, _ in entries
+        ],
+        ["doctor_id"],
+        RATING_COUNTERS,
+    )
+    upsert_increment(
+        db,
+        DoctorCategoryAggregate,
+        [
+            {"doctor_id": doctor_id, "category_id": category_id, "feedback_count": 1, "rating_sum": rating, "rating_sum_sq": rating * rating}
+            for doctor_id, _, category_id, rating, _ in entries
+        ],
+        ["doctor_id", "category_id"],
+        RATING_COUNTERS,
+    )
+    record_patient_links(db, [(doctor_id, patient_id) for doctor_id, patient_id, _, _, _ in entries])
+    record_ratings(db, [(doctor_id, category_id, rating, created_at) for doctor_id, _, category_id, rating, created_at in entries])
+    statistics_snapshots.record_writes(len(entries))
+
+def doctor_aggregates(db: Session, doctor_ids: Iterable[int]) -> Dict[int, DoctorAggregate]:
+    doctor_ids = list(doctor_ids)
+    if not doctor_ids:
+        return {}
+    return {
+        aggregate.doctor_id: aggregate
+        for aggregate in db.query(DoctorAggregate).filter(DoctorAggregate.doctor_id.in_(doctor_ids))
+    }
+
+def rebuild_doctor_aggregates(db: Session):
+    """Recompute every doctor aggregate, rating rollup and activity counter from the feedback, appointments and patients tables"""
+    db.query(DoctorCategoryAggregate).delete(synchronize_session=False)
+    db.query(DoctorAggregate).delete(synchronize_session=False)
+    db.query(DoctorPatientLink).delete(synchronize_session=False)
+
+    rated = Feedback.doctor_id.isnot(None) & Feedback.rating.isnot(None)
+    db.execute(DoctorCategoryAggregate.__table__.insert().from_select(
+        ["doctor_id", "category_id", "feedback_count", "rating_sum", "rating_sum_sq"],
+        select(
+            Feedback.doctor_id,
+            Feedback.category_id,
+            func.count(),
+            func.sum(Feedback.rating),
+            func.sum(Feedback.rating * Feedback.rating),
+        ).where(rated, Feedback.category_id.isnot(None)).group_by(Feedback.doctor_id, Feedback.category_id),
+    ))
+    db.execute(DoctorPatientLink.__table__.insert().from_select(
+        ["doctor_id", "patient_id"],
+        union(
+            select(Feedback.doctor_id, Feedback.patient_id).where(Feedback.doctor_id.isnot(None), Feedback.patient_id.isnot(None)),
+            select(Appointment.doctor_id, Appointment.patient_id),
+        ),
+    ))
+
+    ratings = (
+        select(
+            Feedback.doctor_id.label("doctor_id"),
+            func.count().label("feedback_count"),
+            func.sum(Feedback.rating).label("rating_sum"),
+            func.sum(Feedback.rating * Feedback.rating).label("rating_sum_sq"),
+        ).where(rated).group_by(Feedback.doctor_id).subquery()
+    )
+    patients = (
+        select(DoctorPatientLink.doctor_id.label("doctor_id"), func.count().label("patient_count"))
+        .group_by(DoctorPatientLink.doctor_id).subquery()
+    )
+    doctors = union(select(ratings.c.doctor_id), select(patients.c.doctor_id)).subquery()
+    db.execute(DoctorAggregate.__table__.insert().from_select(
+        ["doctor_id", "feedback_count", "rating_sum", "rating_sum_sq", "patient_count"],
+        select(
+            doctors.c.doctor_id,
+            func.coalesce(ratings.c.feedback_count, literal(0)),
+            func.coalesce(ratings.c.rating_sum, literal(0)),
+            func.coalesce(ratings.c.rating_sum_sq, literal(0)),
+            func.coalesce(patients.c.patient_count, literal(0)),
+        )
+        .select_from(doctors)
+        .outerjoin(ratings, ratings.c.doctor_id == doctors.c.doctor_id)
+        .outerjoin(patients, patients.c.doctor_id == doctors.c.doctor_id),
+    ))
+    rebuild_rating_rollups(db)
+    rebuild_activity_counters(db)
+
+def main(argv: Optional[list] = None):
+    """Rebuild the aggregate tables: python -m app.aggregates rebuild"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv != ["rebuild"]:
+        print("Usage: python -m app.aggregates rebuild")
+        return 2
+    db = SessionLocal()
+    try:
+        rebuild_doctor_aggregates(db)
+        db.commit()
+        print(f"Rebuilt aggregates for {db.query(DoctorAggregate).count()} doctors")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
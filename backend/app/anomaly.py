@@ -0,0 +1,262 @@
+import asyncio
+import math
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, Iterable, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from db.models import PendingRating, PipelineWatermark, RatingAlert, RatingDetectorState
+from db.upsert import insert_ignore, upsert
+
+ANOMALY_BATCH_SIZE = int(os.environ.get("ANOMALY_BATCH_SIZE", "2000"))
+ANOMALY_POLL_SECONDS = float(os.environ.get("ANOMALY_POLL_SECONDS", "5"))
+WATERMARK_NAME = "rating_anomaly"
+
+# Ratings used to learn a baseline before any drop can be flagged
+WARMUP = 20
+# Weight of each new rating in the slow baseline and in the fast EWMA
+BASELINE_ALPHA = 0.02
+EWMA_LAMBDA = 0.1
+# One-sided CUSUM on standardised ratings: slack per rating and alarm threshold.
+# A stable doctor raises about one false alarm per 15000 ratings; a drop of
+# one and a half stars is flagged after about five ratings
+CUSUM_K = 0.5
+CUSUM_H = 8.0
+CUSUM_FREEZE = CUSUM_H / 2
+# A single rating moves the CUSUM by at most this many standard deviations,
+# so one angry review is never enough to raise an alert
+Z_CLIP = 2.5
+MIN_STD = 0.75
+WINDOW_SIZE = 20
+# An open alert is closed as recovered once the EWMA is back this close to the baseline
+RECOVERY_STDS = 0.5
+ALL_CATEGORIES = 0
+
+@dataclass
+class DetectorState:
+    """Running statistics of one doctor's (or doctor and category's) ratings
+
+    Every update is O(1): the baseline and the EWMA are exponentially
+    weighted, the CUSUM is a single number and the window is a bounded deque.
+    """
+    count: int = 0
+    baseline_mean: float = 0.0
+    baseline_var: float = 0.0
+    ewma: float = 0.0
+    cusum: float = 0.0
+    window: Deque[int] = field(default_factory=lambda: deque(maxlen=WINDOW_SIZE))
+    open_alert_id: Optional[int] = None
+
+    @property
+    def baseline_std(self) -> float:
+        return max(math.sqrt(self.baseline_var), MIN_STD)
+
+    @property
+    def window_mean(self) -> float:
+        return sum(self.window) / len(self.window) if self.window else 0.0
+
+    def update(self, rating: int) -> bool:
+        """Add a rating; return True when it completes a significant drop"""
+        self.count += 1
+        self.window.append(rating)
+        if self.count == 1:
+            self.baseline_mean = self.ewma = float(rating)
+            return False
+        self.ewma += EWMA_LAMBDA * (rating - self.ewma)
+        if self.count <= WARMUP:
+            # Plain running mean and variance until the baseline is established
+            delta = rating - self.baseline_mean
+            self.baseline_mean += delta / self.count
+            self.baseline_var += (delta * (rating - self.baseline_mean) - self.baseline_var) / self.count
+            return False
+
+        z = max(min((rating - self.baseline_mean) / self.baseline_std, Z_CLIP), -Z_CLIP)
+        self.cusum = max(0.0, self.cusum - z - CUSUM_K)
+        if self.cusum <= CUSUM_FREEZE:
+            # Stop learning while a drop is building up, so it is not absorbed into the baseline
+            delta = rating - self.baseline_mean
+            self.baseline_mean += BASELINE_ALPHA * delta
+            self.baseline_var = (1 - BASELINE_ALPHA) * (self.baseline_var + BASELINE_ALPHA * delta * delta)
+        return self.cusum > CUSUM_H
+
+    def recovered(self) -> bool:
+        return self.ewma >= self.baseline_mean - RECOVERY_STDS * self.baseline_std
+
+def queue_ratings(db: Session, ratings: Iterable[Tuple[int, int, int, int]]):
+    """Queue (feedback_id, doctor_id, category_id, rating) for the detector in the caller's transaction"""
+    rows = [
+        {"feedback_id": feedback_id, "doctor_id": doctor_id, "category_id": category_id, "rating": rating}
+        for feedback_id, doctor_id, category_id, rating in ratings
+    ]
+    if rows:
+        db.execute(insert(PendingRating), rows)
+
+class RatingAnomalyDetector:
+    """Flags significant rating drops per doctor and per doctor and category
+
+    Feedback routes queue each rating in pending_ratings in the feedback's
+    own transaction. The detector drains the queue in feedback id order,
+    under a lock on its watermark row, so each rating is seen exactly once
+    across all workers. A transaction that commits late, such as a large
+    batch upload, is only drained later. Detector state stays in memory and
+    is checkpointed in the same transaction that deletes the drained
+    ratings. The watermark records the last rating drained, and a worker
+    that finds it changed by another worker reloads the checkpoint first.
+    """
+    def __init__(self, batch_size: int = ANOMALY_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._states: Dict[Tuple[int, int], DetectorState] = {}
+        self._last_id: Optional[int] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def notify(self):
+        """Wake the detector after committing new feedback (safe from any thread)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _load(self, db):
+        self._states = {}
+        for row in db.query(RatingDetectorState):
+            self._states[(row.doctor_id, row.category_id)] = DetectorState(
+                count=row.count,
+                baseline_mean=row.baseline_mean,
+                baseline_var=row.baseline_var,
+                ewma=row.ewma,
+                cusum=row.cusum,
+                window=deque((int(r) for r in row.window.split(",") if r) if row.window else (), maxlen=WINDOW_SIZE),
+                open_alert_id=row.open_alert_id,
+            )
+
+    def _raise_alert(self, db, key: Tuple[int, int], state: DetectorState, feedback_id: int, now: datetime):
+        values = {
+            "baseline_mean": round(state.baseline_mean, 3),
+            "recent_mean": round(state.window_mean, 3),
+            "ewma": round(state.ewma, 3),
+            "cusum": round(state.cusum, 3),
+            "last_feedback_id": feedback_id,
+            "updated_at": now,
+        }
+        # A drop that continues updates its open alert instead of raising another
+        if state.open_alert_id is not None:
+            updated = db.query(RatingAlert).filter(
+                RatingAlert.id == state.open_alert_id, RatingAlert.status == "open"
+            ).update(values, synchronize_session=False)
+            if updated:
+                state.cusum = 0.0
+                return
+        doctor_id, category_id = key
+        alert = RatingAlert(
+            doctor_id=doctor_id,
+            category_id=category_id if category_id != ALL_CATEGORIES else None,
+            status="open",
+            detected_at=now,
+            **values,
+        )
+        db.add(alert)
+        db.flush()
+        state.open_alert_id = alert.id
+        state.cusum = 0.0
+
+    def process_batch(self) -> int:
+        """Feed the next batch of queued ratings to the detectors and return how many were processed"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        with self._lock:
+            try:
+                insert_ignore(db, PipelineWatermark, [{"name": WATERMARK_NAME, "last_id": 0, "updated_at": now}], ["name"])
+                watermark = (
+                    db.query(PipelineWatermark)
+                    .filter(PipelineWatermark.name == WATERMARK_NAME)
+                    .with_for_update(skip_locked=True)
+                    .first()
+                )
+                if watermark is None:
+                    db.rollback()
+                    return 0
+                if watermark.last_id != self._last_id:
+                    # Another worker advanced the detectors since this one last ran
+                    self._load(db)
+                    self._last_id = watermark.last_id
+                rows = (
+                    db.query(PendingRating.feedback_id, PendingRating.doctor_id, PendingRating.category_id, PendingRating.rating)
+                    .order_by(PendingRating.feedback_id)
+                    .limit(self.batch_size)
+                    .all()
+                )
+                if not rows:
+                    db.commit()
+                    return 0
+
+                touched = set()
+                for feedback_id, doctor_id, category_id, rating in rows:
+                    if doctor_id is None or rating is None:
+                        continue
+                    keys = [(doctor_id, ALL_CATEGORIES)]
+                    if category_id is not None:
+                        keys.append((doctor_id, category_id))
+                    for key in keys:
+                        state = self._states.setdefault(key, DetectorState())
+                        touched.add(key)
+                        if state.update(rating):
+                            self._raise_alert(db, key, state, feedback_id, now)
+                        elif state.open_alert_id is not None and state.recovered():
+                            db.query(RatingAlert).filter(
+                                RatingAlert.id == state.open_alert_id, RatingAlert.status == "open"
+                            ).update({"status": "recovered", "closed_at": now, "updated_at": now}, synchronize_session=False)
+                            state.open_alert_id = None
+
+                upsert(db, RatingDetectorState, [
+                    {
+                        "doctor_id": doctor_id,
+                        "category_id": category_id,
+                        "count": state.count,
+                        "baseline_mean": state.baseline_mean,
+                        "baseline_var": state.baseline_var,
+                        "ewma": state.ewma,
+                        "cusum": state.cusum,
+                        "window": ",".join(str(r) for r in state.window),
+                        "open_alert_id": state.open_alert_id,
+                        "updated_at": now,
+                    }
+                    for (doctor_id, category_id), state in ((key, self._states[key]) for key in sorted(touched))
+                ], ["doctor_id", "category_id"])
+                db.query(PendingRating).filter(
+                    PendingRating.feedback_id.in_([row.feedback_id for row in rows])
+                ).delete(synchronize_session=False)
+                watermark.last_id = rows[-1].feedback_id
+                watermark.updated_at = now
+                db.commit()
+                self._last_id = rows[-1].feedback_id
+                return len(rows)
+            except Exception:
+                db.rollback()
+                # The in-memory state may be ahead of the checkpoint; reload it next time
+                self._last_id = None
+                raise
+            finally:
+                db.close()
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            try:
+                if await asyncio.to_thread(self.process_batch) >= self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Rating anomaly detector error: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=ANOMALY_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+anomaly_detector = RatingAnomalyDetector()
@@ -0,0 +1,82 @@
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta
+from db.database import SessionLocal
+from db.models import Appointment, Doctor, Patient
+from app.outbox import enqueue_many, outbox_relay
+
+# Local time of day at which tomorrow's appointment reminders are queued
+APPOINTMENT_REMINDER_TIME = os.environ.get("APPOINTMENT_REMINDER_TIME", "18:00")
+# Rows streamed from the database and outbox rows inserted per round trip
+FANOUT_CHUNK_SIZE = int(os.environ.get("APPOINTMENT_REMINDER_CHUNK_SIZE", "1000"))
+
+def appointment_message(first_name: str, doctor_name: str, day: date, at: time) -> str:
+    greeting = f"Hello {first_name}, " if first_name else ""
+    with_doctor = f" with Dr. {doctor_name}" if doctor_name else ""
+    return f"{greeting}reminder: you have an appointment{with_doctor} on {day:%d/%m/%Y} at {at:%H:%M}. - Douala General Hospital"
+
+def fan_out_appointment_reminders(day: date) -> int:
+    """Queue one SMS per scheduled appointment on `day` and return how many were rendered
+
+    Appointments are streamed with a single query over the (date) part of the
+    appointment indexes and written to the outbox in chunks. Outbox keys are
+    derived from the appointment and day, so re-running the job for the same
+    day never queues a second message.
+    """
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Appointment.id, Appointment.date, Appointment.time, Patient.first_name, Patient.phone_number, Doctor.name)
+            .join(Patient, Patient.id == Appointment.patient_id)
+            .outerjoin(Doctor, Doctor.id == Appointment.doctor_id)
+            .filter(
+                Appointment.date == day,
+                Appointment.status == "scheduled",
+                Patient.phone_number.isnot(None),
+                Patient.phone_number != "",
+            )
+            .yield_per(FANOUT_CHUNK_SIZE)
+        )
+        rendered = 0
+        chunk = []
+        for appointment_id, appointment_date, at, first_name, phone_number, doctor_name in rows:
+            chunk.append({
+                "idempotency_key": f"appointment-reminder:{appointment_id}:{appointment_date.isoformat()}",
+                "recipient": phone_number,
+                "body": appointment_message(first_name, doctor_name, appointment_date, at),
+            })
+            if len(chunk) >= FANOUT_CHUNK_SIZE:
+                enqueue_many(db, chunk)
+                rendered += len(chunk)
+                chunk = []
+        enqueue_many(db, chunk)
+        rendered += len(chunk)
+        # One commit at the end: committing would close the streaming cursor
+        db.commit()
+        return rendered
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_appointment_reminders():
+    """Queue tomorrow's appointment reminders every day at APPOINTMENT_REMINDER_TIME
+
+    A worker that starts after today's run time catches up immediately; the
+    outbox keys make the extra run harmless.
+    """
+    run_at = time.fromisoformat(APPOINTMENT_REMINDER_TIME)
+    next_run = datetime.combine(date.today(), run_at)
+    if next_run <= datetime.now():
+        next_run = datetime.now()
+    while True:
+        await asyncio.sleep(max((next_run - datetime.now()).total_seconds(), 0))
+        tomorrow = date.today() + timedelta(days=1)
+        try:
+            queued = await asyncio.to_thread(fan_out_appointment_reminders, tomorrow)
+            outbox_relay.notify()
+            print(f"Queued {queued} appointment reminders for {tomorrow.isoformat()}")
+        except Exception as e:
+            print(f"Appointment reminder fan-out failed: {str(e)}")
+        next_run = datetime.combine(date.today() + timedelta(days=1), run_at)
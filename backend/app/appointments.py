@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import BaseModel, ValidationError, field_serializer
 from db.database import get_db
 from db.models import Appointment, Doctor, Patient
 from app.auth import get_current_user
-from datetime import datetime
+from app.pagination import PageParams, paginate, project, render_page
+from app.availability import availability_index, lock_slots, FREE_STATUSES, SLOT_MINUTES
+from app.aggregates import record_patient_links
+from app.activity import record_appointments
+from app.ingest import read_records
+from datetime import datetime, date as date_type, time as time_type, timedelta
 
 router = APIRouter()
 public_router = APIRouter()
@@ -13,12 +20,16 @@ public_router = APIRouter()
 class AppointmentBase(BaseModel):
     patient_id: int
     doctor_id: int
-    date: str
-    time: str
+    date: date_type
+    time: time_type
     category: Optional[str] = None
     description: Optional[str] = None
     status: Optional[str] = "scheduled"
 
+    @field_serializer("time")
+    def serialize_time(self, value: time_type) -> str:
+        return value.strftime("%H:%M")
+
 class AppointmentCreate(AppointmentBase):
     pass
 
@@ -31,6 +42,80 @@ class AppointmentResponse(AppointmentBase):
     class Config:
         orm_mode = True
 
+class AvailabilityResponse(BaseModel):
+    doctor_id: int
+    doctor_name: Optional[str] = None
+    specialty: Optional[str] = None
+    slot_minutes: int
+    slots: Dict[str, List[str]]
+
+class BulkAppointmentResult(BaseModel):
+    index: int
+    status: str  # created or error
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BulkAppointmentResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkAppointmentResult]
+
+# Longest window the availability endpoint will search in one request
+MAX_AVAILABILITY_DAYS = 62
+
+def _check_slot(db: Session, appointment: AppointmentBase, exclude_id: Optional[int] = None):
+    """Reject slots overlapping another booking of the same doctor"""
+    if appointment.status in FREE_STATUSES:
+        return
+    lock_slots(db, [(appointment.doctor_id, appointment.date)])
+    conflict_id = availability_index.find_conflict(db, appointment.doctor_id, appointment.date, appointment.time, exclude_id)
+    if conflict_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Doctor {appointment.doctor_id} already has appointment {conflict_id} overlapping {appointment.date} {appointment.time:%H:%M}"
+        )
+
+def _with_names(db: Session):
+    """Query appointments together with the doctor and patient names in one round trip"""
+    return (
+        db.query(Appointment, Doctor.name, Patient.first_name, Patient.last_name)
+        .outerjoin(Doctor, Doctor.id == Appointment.doctor_id)
+        .outerjoin(Patient, Patient.id == Appointment.patient_id)
+    )
+
+def _attach_names(row):
+    """Copy the joined doctor and patient names onto the appointment for the response"""
+    appointment, doctor_name, first_name, last_name = row
+    appointment.doctor_name = doctor_name
+    if first_name is not None or last_name is not None:
+        appointment.patient_name = f"{first_name} {last_name}"
+    return appointment
+
+def appointment_filters(patient_id, doctor_id, date, date_from, date_to, status) -> list:
+    """SQL conditions shared by the appointment list and export endpoints"""
+    conditions = []
+    if patient_id:
+        conditions.append(Appointment.patient_id == patient_id)
+    if doctor_id:
+        conditions.append(Appointment.doctor_id == doctor_id)
+    if date:
+        conditions.append(Appointment.date == date)
+    if date_from:
+        conditions.append(Appointment.date >= date_from)
+    if date_to:
+        conditions.append(Appointment.date <= date_to)
+    if status:
+        conditions.append(Appointment.status == status)
+    return conditions
+
+def _list_appointments(db: Session, page: PageParams, response: Response, patient_id, doctor_id, date, date_from, date_to, status):
+    page.validate_fields(AppointmentResponse)
+    query = project(_with_names(db), Appointment, page).filter(*appointment_filters(patient_id, doctor_id, date, date_from, date_to, status))
+    
+    rows, next_cursor = paginate(query, Appointment.id, page)
+    items = [page.build_from(AppointmentResponse, _attach_names(row)) for row in rows]
+    return render_page(items, next_cursor, page, response)
+
 @router.post("/", response_model=AppointmentResponse, status_code=status.HTTP_201_CREATED)
 def create_appointment(appointment: AppointmentCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     """Create a new appointment"""
@@ -45,13 +130,14 @@ def create_appointment(appointment: AppointmentCreate, db: Session = Depends(get
         raise HTTPException(status_code=404, detail=f"Doctor with ID {appointment.doctor_id} not found")
     
     # Validate appointment date is not in the past
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    if appointment.date < current_date:
+    if appointment.date < date_type.today():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot schedule appointments for past dates"
         )
     
+    _check_slot(db, appointment)
+    
     # Create appointment
     db_appointment = Appointment(
         patient_id=appointment.patient_id,
@@ -64,8 +150,12 @@ def create_appointment(appointment: AppointmentCreate, db: Session = Depends(get
     )
     
     db.add(db_appointment)
+    record_patient_links(db, [(appointment.doctor_id, appointment.patient_id)])
+    record_appointments(db, added=[(appointment.date, appointment.category, appointment.status)])
     db.commit()
     db.refresh(db_appointment)
+    if db_appointment.status not in FREE_STATUSES:
+        availability_index.add(db_appointment.doctor_id, db_appointment.date, db_appointment.time, db_appointment.id)
     
     # Add doctor and patient names for the response
     db_appointment.doctor_name = doctor.name
@@ -73,47 +163,151 @@ def create_appointment(appointment: AppointmentCreate, db: Session = Depends(get
     
     return db_appointment
 
+def _bulk_create(db: Session, records: List[dict]) -> BulkAppointmentResponse:
+    results: List[Optional[BulkAppointmentResult]] = [None] * len(records)
+    valid = []
+    today = date_type.today()
+    
+    # Validate every record before touching the database
+    for index, record in enumerate(records):
+        try:
+            appointment = AppointmentCreate(**record)
+        except ValidationError as e:
+            results[index] = BulkAppointmentResult(index=index, status="error", detail=str(e))
+            continue
+        if appointment.date < today:
+            results[index] = BulkAppointmentResult(index=index, status="error", detail="Cannot schedule appointments for past dates")
+            continue
+        valid.append((index, appointment))
+    
+    # One IN query per referenced table
+    patient_ids = {a.patient_id for _, a in valid}
+    doctor_ids = {a.doctor_id for _, a in valid}
+    known_patients = {row.id for row in db.query(Patient.id).filter(Patient.id.in_(patient_ids))} if patient_ids else set()
+    known_doctors = {row.id for row in db.query(Doctor.id).filter(Doctor.id.in_(doctor_ids))} if doctor_ids else set()
+    
+    checked = []
+    for index, appointment in valid:
+        if appointment.patient_id not in known_patients:
+            results[index] = BulkAppointmentResult(index=index, status="error", detail=f"Patient with ID {appointment.patient_id} not found")
+        elif appointment.doctor_id not in known_doctors:
+            results[index] = BulkAppointmentResult(index=index, status="error", detail=f"Doctor with ID {appointment.doctor_id} not found")
+        else:
+            checked.append((index, appointment))
+    
+    # Slot conflicts against existing bookings and earlier rows of the batch, in memory
+    booking = [(index, a) for index, a in checked if a.status not in FREE_STATUSES]
+    lock_slots(db, [(a.doctor_id, a.date) for _, a in booking])
+    conflicts = availability_index.find_batch_conflicts(db, [(a.doctor_id, a.date, a.time) for _, a in booking])
+    rejected = set()
+    for (index, appointment), conflict in zip(booking, conflicts):
+        if conflict is None:
+            continue
+        rejected.add(index)
+        other = f"appointment {conflict}" if conflict > 0 else f"row {booking[-conflict - 1][0]}"
+        results[index] = BulkAppointmentResult(
+            index=index,
+            status="error",
+            detail=f"Doctor {appointment.doctor_id} already has {other} overlapping {appointment.date} {appointment.time:%H:%M}"
+        )
+    to_insert = [(index, a) for index, a in checked if index not in rejected]
+    
+    if to_insert:
+        # executemany in a single transaction, ids returned in parameter order
+        ids = db.execute(
+            insert(Appointment).returning(Appointment.id, sort_by_parameter_order=True),
+            [a.dict() for _, a in to_insert]
+        ).scalars().all()
+        record_patient_links(db, [(a.doctor_id, a.patient_id) for _, a in to_insert])
+        record_appointments(db, added=[(a.date, a.category, a.status) for _, a in to_insert])
+        db.commit()
+        for (index, appointment), appointment_id in zip(to_insert, ids):
+            results[index] = BulkAppointmentResult(index=index, status="created", id=appointment_id)
+            if appointment.status not in FREE_STATUSES:
+                availability_index.add(appointment.doctor_id, appointment.date, appointment.time, appointment_id)
+    
+    return BulkAppointmentResponse(
+        created=len(to_insert),
+        failed=len(records) - len(to_insert),
+        results=results
+    )
+
+@router.post("/bulk", response_model=BulkAppointmentResponse)
+async def bulk_create_appointments(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Create many appointments at once from a JSON array, NDJSON or CSV body
+    
+    Rows are validated together and inserted in one transaction; the response
+    reports the outcome of every row by its position in the request.
+    """
+    records = await read_records(request)
+    return await run_in_threadpool(_bulk_create, db, records)
+
 @router.get("/", response_model=List[AppointmentResponse])
 def get_appointments(
+    response: Response,
     patient_id: Optional[int] = None, 
     doctor_id: Optional[int] = None, 
-    date: Optional[str] = None,
+    date: Optional[date_type] = None,
+    date_from: Optional[date_type] = Query(None, alias="from"),
+    date_to: Optional[date_type] = Query(None, alias="to"),
     status: Optional[str] = None,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Get appointments with optional filters"""
     
-    query = db.query(Appointment)
-    
-    # Apply filters if provided
-    if patient_id:
-        query = query.filter(Appointment.patient_id == patient_id)
+    return _list_appointments(db, page, response, patient_id, doctor_id, date, date_from, date_to, status)
+
+@router.get("/availability", response_model=AvailabilityResponse)
+def get_availability(
+    doctor_id: Optional[int] = None,
+    specialty: Optional[str] = None,
+    start: Optional[date_type] = None,
+    end: Optional[date_type] = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get free slots for a doctor, or for the first available doctor in a specialty"""
     
-    if doctor_id:
-        query = query.filter(Appointment.doctor_id == doctor_id)
-        
-    if date:
-        query = query.filter(Appointment.date == date)
-        
-    if status:
-        query = query.filter(Appointment.status == status)
+    if not doctor_id and not specialty:
+        raise HTTPException(status_code=400, detail="Either doctor_id or specialty is required")
     
-    # Get appointments
-    appointments = query.all()
+    first = start or date_type.today()
+    last = end or first + timedelta(days=6)
+    if last < first or (last - first).days >= MAX_AVAILABILITY_DAYS:
+        raise HTTPException(status_code=400, detail=f"The window must cover 1 to {MAX_AVAILABILITY_DAYS} days")
     
-    # Add doctor and patient names for the response
-    for appointment in appointments:
-        doctor = db.query(Doctor).filter(Doctor.id == appointment.doctor_id).first()
-        patient = db.query(Patient).filter(Patient.id == appointment.patient_id).first()
-        
-        if doctor:
-            appointment.doctor_name = doctor.name
-        
-        if patient:
-            appointment.patient_name = f"{patient.first_name} {patient.last_name}"
-    
-    return appointments
+    query = db.query(Doctor.id, Doctor.name, Doctor.specialty).filter(Doctor.is_active == True)
+    if doctor_id:
+        query = query.filter(Doctor.id == doctor_id)
+    else:
+        query = query.filter(Doctor.specialty.ilike(specialty))
+    doctors = query.order_by(Doctor.id).all()
+    if not doctors:
+        raise HTTPException(status_code=404, detail="No active doctor found")
+    
+    free = availability_index.free_slots(db, [doctor.id for doctor in doctors], first, last)
+    
+    # Pick the doctor with the earliest free slot in the window
+    def earliest(doctor):
+        return min(
+            (f"{day} {slots[0]}" for day, slots in free[doctor.id].items() if slots),
+            default="~"
+        )
+    chosen = min(doctors, key=earliest)
+    
+    return AvailabilityResponse(
+        doctor_id=chosen.id,
+        doctor_name=chosen.name,
+        specialty=chosen.specialty,
+        slot_minutes=SLOT_MINUTES,
+        slots=free[chosen.id]
+    )
 
 @router.get("/{appointment_id}", response_model=AppointmentResponse)
 def get_appointment(
@@ -123,66 +317,31 @@ def get_appointment(
 ):
     """Get a specific appointment by ID"""
     
-    appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+    row = _with_names(db).filter(Appointment.id == appointment_id).first()
     
-    if not appointment:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Appointment with ID {appointment_id} not found"
         )
     
-    # Add doctor and patient names for the response
-    doctor = db.query(Doctor).filter(Doctor.id == appointment.doctor_id).first()
-    patient = db.query(Patient).filter(Patient.id == appointment.patient_id).first()
-    
-    if doctor:
-        appointment.doctor_name = doctor.name
-    
-    if patient:
-        appointment.patient_name = f"{patient.first_name} {patient.last_name}"
-    
-    return appointment
+    return _attach_names(row)
 
 @public_router.get("/", response_model=List[AppointmentResponse])
 def get_appointments_public(
+    response: Response,
     patient_id: Optional[int] = None,
     doctor_id: Optional[int] = None,
-    date: Optional[str] = None,
+    date: Optional[date_type] = None,
+    date_from: Optional[date_type] = Query(None, alias="from"),
+    date_to: Optional[date_type] = Query(None, alias="to"),
     status: Optional[str] = None,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db)
 ):
     """Get appointments with optional filters - public endpoint without authentication"""
     
-    query = db.query(Appointment)
-    
-    # Apply filters if provided
-    if patient_id:
-        query = query.filter(Appointment.patient_id == patient_id)
-    
-    if doctor_id:
-        query = query.filter(Appointment.doctor_id == doctor_id)
-        
-    if date:
-        query = query.filter(Appointment.date == date)
-        
-    if status:
-        query = query.filter(Appointment.status == status)
-    
-    # Get appointments
-    appointments = query.all()
-    
-    # Add doctor and patient names for the response
-    for appointment in appointments:
-        doctor = db.query(Doctor).filter(Doctor.id == appointment.doctor_id).first()
-        patient = db.query(Patient).filter(Patient.id == appointment.patient_id).first()
-        
-        if doctor:
-            appointment.doctor_name = doctor.name
-        
-        if patient:
-            appointment.patient_name = f"{patient.first_name} {patient.last_name}"
-    
-    return appointments
+    return _list_appointments(db, page, response, patient_id, doctor_id, date, date_from, date_to, status)
 
 @router.put("/{appointment_id}", response_model=AppointmentResponse)
 def update_appointment(
@@ -201,24 +360,27 @@ def update_appointment(
             detail=f"Appointment with ID {appointment_id} not found"
         )
     
+    _check_slot(db, appointment, exclude_id=appointment_id)
+    previous_slot = (db_appointment.doctor_id, db_appointment.date)
+    record_appointments(
+        db,
+        added=[(appointment.date, appointment.category, appointment.status)],
+        removed=[(db_appointment.date, db_appointment.category, db_appointment.status)]
+    )
+    
     # Update appointment fields
     for key, value in appointment.dict().items():
         setattr(db_appointment, key, value)
+    # Links are never removed: the doctor has still seen the previous patient
+    record_patient_links(db, [(appointment.doctor_id, appointment.patient_id)])
     
     db.commit()
-    db.refresh(db_appointment)
-    
-    # Add doctor and patient names for the response
-    doctor = db.query(Doctor).filter(Doctor.id == db_appointment.doctor_id).first()
-    patient = db.query(Patient).filter(Patient.id == db_appointment.patient_id).first()
-    
-    if doctor:
-        db_appointment.doctor_name = doctor.name
+    availability_index.remove(*previous_slot, appointment_id)
+    if appointment.status not in FREE_STATUSES:
+        availability_index.add(appointment.doctor_id, appointment.date, appointment.time, appointment_id)
     
-    if patient:
-        db_appointment.patient_name = f"{patient.first_name} {patient.last_name}"
-    
-    return db_appointment
+    # Reload the appointment and the doctor/patient names in a single query
+    return _attach_names(_with_names(db).filter(Appointment.id == appointment_id).one())
 
 @router.delete("/{appointment_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_appointment(
@@ -236,7 +398,10 @@ def delete_appointment(
             detail=f"Appointment with ID {appointment_id} not found"
         )
     
+    previous_slot = (db_appointment.doctor_id, db_appointment.date)
+    record_appointments(db, removed=[(db_appointment.date, db_appointment.category, db_appointment.status)])
     db.delete(db_appointment)
     db.commit()
+    availability_index.remove(*previous_slot, appointment_id)
     
     return None
\ No newline at end of file
@@ -5,10 +5,13 @@ from db.models import Doctor, Patient
 from db.database import SessionLocal
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 from pydantic import BaseModel
 from db.models import Doctor, Patient, Admin
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.concurrency import run_in_threadpool
+from app.activity import record_patients
+from app.identities import add_identity, email_taken, find_account
+from app.passwords import password_pool
 
 # ---------------------- Settings ----------------------
 SECRET_KEY = "your_secret_key"
@@ -16,7 +19,6 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 # ---------------------- Database Dependency ----------------------
@@ -28,9 +30,6 @@ def get_db():
         db.close()
 
 # ---------------------- Utility Functions ----------------------
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
@@ -85,41 +84,36 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
 
 @router.post("/token")
-def login(data: LoginRequest, db: Session = Depends(get_db)):
+async def login(data: LoginRequest, db: Session = Depends(get_db)):
     email = data.email
     password = data.password
 
-    user = db.query(Admin).filter(Admin.email == email).first()
-    user_role = "admin" if user else None
-    
-    if not user:
-        user = db.query(Doctor).filter(Doctor.email == email).first()
-        user_role = "doctor" if user else None
-    
+    # Admins, doctors and patients are found through the identity index in one query
+    user_role, user = await run_in_threadpool(find_account, db, email)
     if not user:
-        user = db.query(Patient).filter(Patient.email == email).first()
-        user_role = "patient" if user else None
+        raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    if not user or not verify_password(password, user.password):
+    # bcrypt runs in the password pool, not on this worker's threads
+    valid, new_hash = await password_pool.verify_and_update(password, user.password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
+    # Read before any commit, which expires the account and would reload it on the event loop
     access_token = create_access_token(data={"sub": str(user.id), "role": user_role})
-    return {
+    result = {
         "access_token": access_token,
         "token_type": "bearer",
         "user_id": user.id,
         "user_role": user_role,
         "name": getattr(user, "name", None) or getattr(user, "first_name", "") + " " + getattr(user, "last_name", "")
     }
+    if new_hash:
+        # Stored with an outdated cost: upgrade it now that we know the password
+        user.password = new_hash
+        await run_in_threadpool(db.commit)
+    return result
 
-@router.post("/patient")
-def register_patient(data: PatientCreate, db: Session = Depends(get_db)):
-    existing = db.query(Patient).filter_by(email=data.email).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-
-    hashed_password = pwd_context.hash(data.password)
-
+def _save_new_patient(db: Session, data: PatientCreate, hashed_password: str):
     new_patient = Patient(
         email=data.email,
         password=hashed_password,
@@ -130,6 +124,9 @@ def register_patient(data: PatientCreate, db: Session = Depends(get_db)):
 
     try:
         db.add(new_patient)
+        db.flush()
+        add_identity(db, "patient", new_patient.id, new_patient.email)
+        record_patients(db, [datetime.utcnow().date()])
         db.commit()
         db.refresh(new_patient)
     except IntegrityError:
@@ -140,3 +137,12 @@ def register_patient(data: PatientCreate, db: Session = Depends(get_db)):
         "message": "Patient registered successfully",
         "patient_id": new_patient.id
     }
+
+@router.post("/patient")
+async def register_patient(data: PatientCreate, db: Session = Depends(get_db)):
+    if await run_in_threadpool(email_taken, db, data.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+
+    # bcrypt runs in the password pool; the session is only used on threadpool threads
+    hashed_password = await password_pool.hash(data.password)
+    return await run_in_threadpool(_save_new_patient, db, data, hashed_password)
@@ -0,0 +1,167 @@
+import os
+import threading
+import time as clock
+from bisect import bisect_left, insort
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from db.models import Appointment
+
+# Every appointment occupies one slot; there is no per-appointment duration yet
+SLOT_MINUTES = int(os.environ.get("APPOINTMENT_SLOT_MINUTES", "30"))
+OPENING_TIME = os.environ.get("CLINIC_OPENING_TIME", "08:00")
+CLOSING_TIME = os.environ.get("CLINIC_CLOSING_TIME", "17:00")
+# How long a loaded day is trusted for availability reads (writes always reload it)
+DAY_TTL_SECONDS = int(os.environ.get("AVAILABILITY_TTL_SECONDS", "60"))
+# Appointments in these states do not block a slot
+FREE_STATUSES = ("cancelled",)
+
+def to_minutes(value: time) -> int:
+    """Convert a time of day to minutes since midnight"""
+    return value.hour * 60 + value.minute
+
+def format_time(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def lock_slots(db: Session, slots: Iterable[tuple]):
+    """Hold the (doctor_id, day) slots until the transaction ends
+
+    On PostgreSQL this takes a transaction scoped advisory lock per doctor and
+    day, in sorted order so overlapping batches cannot deadlock. Bookings of
+    the same day are then checked and inserted one transaction at a time
+    across threads and workers. Call it before checking for conflicts: the
+    check reloads the day, so it sees whatever the previous holder committed.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for doctor_id, day in sorted(set(slots)):
+        db.execute(text("SELECT pg_advisory_xact_lock(:doctor_id, :day)"), {"doctor_id": doctor_id, "day": day.toordinal()})
+
+def _days(first: date, last: date) -> Iterable[date]:
+    day = first
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+class AvailabilityIndex:
+    """Per doctor and day interval index of booked appointment slots
+
+    Each (doctor_id, day) bucket holds the sorted start minutes of the booked
+    appointments, so overlap checks and free-slot searches are bisections
+    instead of table scans. Buckets are filled from the database on demand
+    with one query per window and kept up to date by the appointment routes.
+    """
+    def __init__(self):
+        self._buckets: Dict[tuple, list] = {}
+        self._loaded_at: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session, doctor_ids: List[int], first: date, last: date):
+        rows = (
+            db.query(Appointment.id, Appointment.doctor_id, Appointment.date, Appointment.time)
+            .filter(
+                Appointment.doctor_id.in_(doctor_ids),
+                Appointment.date >= first,
+                Appointment.date <= last,
+                Appointment.status.notin_(FREE_STATUSES),
+            )
+            .all()
+        )
+        buckets = {(doctor_id, day): [] for doctor_id in doctor_ids for day in _days(first, last)}
+        for appointment_id, doctor_id, day, start in rows:
+            buckets[(doctor_id, day)].append((to_minutes(start), appointment_id))
+        now = clock.monotonic()
+        with self._lock:
+            for key, bookings in buckets.items():
+                bookings.sort()
+                self._buckets[key] = bookings
+                self._loaded_at[key] = now
+
+    def _ensure(self, db: Session, doctor_ids: List[int], first: date, last: date, fresh: bool = False):
+        """Load the window for any doctor with a missing or expired day"""
+        now = clock.monotonic()
+        with self._lock:
+            stale = [
+                doctor_id for doctor_id in doctor_ids
+                if fresh or any(
+                    now - self._loaded_at.get((doctor_id, day), float("-inf")) > DAY_TTL_SECONDS
+                    for day in _days(first, last)
+                )
+            ]
+        if stale:
+            self._load(db, stale, first, last)
+
+    def _overlapping(self, bookings: list, start: int, exclude_id: Optional[int] = None) -> Optional[int]:
+        """Return the id of a booking overlapping [start, start + SLOT_MINUTES), if any"""
+        index = bisect_left(bookings, (start - SLOT_MINUTES + 1,))
+        while index < len(bookings) and bookings[index][0] < start + SLOT_MINUTES:
+            if bookings[index][1] != exclude_id:
+                return bookings[index][1]
+            index += 1
+        return None
+
+    def find_conflict(self, db: Session, doctor_id: int, day: date, start: time, exclude_id: Optional[int] = None) -> Optional[int]:
+        """Return the id of an appointment that overlaps the requested slot"""
+        self._ensure(db, [doctor_id], day, day, fresh=True)
+        with self._lock:
+            return self._overlapping(self._buckets[(doctor_id, day)], to_minutes(start), exclude_id)
+
+    def find_batch_conflicts(self, db: Session, slots: List[tuple]) -> List[Optional[int]]:
+        """Check (doctor_id, day, start) slots against the bookings and each other
+
+        Returns one entry per slot: None if it is free, the id of the existing
+        appointment it overlaps, or -(i + 1) if it overlaps slot i of the batch.
+        """
+        if not slots:
+            return []
+        doctor_ids = sorted({doctor_id for doctor_id, _, _ in slots})
+        self._ensure(db, doctor_ids, min(s[1] for s in slots), max(s[1] for s in slots), fresh=True)
+        with self._lock:
+            working = {(doctor_id, day): list(self._buckets[(doctor_id, day)]) for doctor_id, day, _ in slots}
+        conflicts: List[Optional[int]] = []
+        for index, (doctor_id, day, start) in enumerate(slots):
+            bookings = working[(doctor_id, day)]
+            conflict = self._overlapping(bookings, to_minutes(start))
+            if conflict is None:
+                insort(bookings, (to_minutes(start), -(index + 1)))
+            conflicts.append(conflict)
+        return conflicts
+
+    def add(self, doctor_id: int, day: date, start: time, appointment_id: int):
+        key = (doctor_id, day)
+        with self._lock:
+            if key in self._buckets:
+                insort(self._buckets[key], (to_minutes(start), appointment_id))
+
+    def remove(self, doctor_id: int, day: date, appointment_id: int):
+        key = (doctor_id, day)
+        with self._lock:
+            if key in self._buckets:
+                self._buckets[key] = [b for b in self._buckets[key] if b[1] != appointment_id]
+
+    def free_slots(self, db: Session, doctor_ids: List[int], first: date, last: date) -> Dict[int, Dict[str, List[str]]]:
+        """Return the free slots per doctor and day in the window"""
+        self._ensure(db, doctor_ids, first, last)
+        opening = to_minutes(time.fromisoformat(OPENING_TIME))
+        closing = to_minutes(time.fromisoformat(CLOSING_TIME))
+        now = datetime.now()
+        today, now_minutes = now.date(), now.hour * 60 + now.minute
+        result: Dict[int, Dict[str, List[str]]] = {}
+        with self._lock:
+            for doctor_id in doctor_ids:
+                days = {}
+                for day in _days(first, last):
+                    if day < today:
+                        continue
+                    bookings = self._buckets.get((doctor_id, day), [])
+                    days[day.isoformat()] = [
+                        format_time(start)
+                        for start in range(opening, closing - SLOT_MINUTES + 1, SLOT_MINUTES)
+                        if not (day == today and start <= now_minutes)
+                        and self._overlapping(bookings, start) is None
+                    ]
+                result[doctor_id] = days
+        return result
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, PageParams
+from app.snapshots import statistics_snapshots
+from app.doctor import get_all_doctors
+from app.patient import list_patients
+from app.feedback import list_feedback
+from app.statistics import (
+    compute_department_stats, compute_doctor_stats, compute_hospital_stats,
+    compute_patient_admissions, compute_treatment_outcomes,
+)
+
+router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
+
+def _snapshot_section(compute: Callable[[Session], Any]) -> Callable[[Session, PageParams], dict]:
+    """Serve the snapshot of a statistics computation registered in app/statistics.py"""
+    name = statistics_snapshots.name_of(compute)
+    def load(db: Session, page: PageParams) -> dict:
+        snapshot = statistics_snapshots.get(name, db)
+        return {"data": snapshot.payload, "generatedAt": snapshot.generated_at.isoformat() + "Z"}
+    return load
+
+def _page_section(list_route: Callable) -> Callable[[Session, PageParams], dict]:
+    """Run a list route on the first page, returning its items and next cursor"""
+    def load(db: Session, page: PageParams) -> dict:
+        response = Response()
+        items = list_route(response=response, page=page, db=db)
+        return {"data": items, "nextCursor": response.headers.get(NEXT_CURSOR_HEADER)}
+    return load
+
+# The requests the admin dashboard made on load, by section name
+SECTIONS: Dict[str, Callable[[Session, PageParams], dict]] = {
+    "hospital": _snapshot_section(compute_hospital_stats),
+    "departments": _snapshot_section(compute_department_stats),
+    "doctor_stats": _snapshot_section(compute_doctor_stats),
+    "patient_admissions": _snapshot_section(compute_patient_admissions),
+    "treatment_outcomes": _snapshot_section(compute_treatment_outcomes),
+    "doctors": _page_section(lambda response, page, db: get_all_doctors(response=response, specialty=None, page=page, db=db)),
+    "patients": _page_section(list_patients),
+    "feedback": _page_section(lambda response, page, db: list_feedback(
+        response=response, doctor_id=None, patient_id=None, category_id=None, date_from=None, date_to=None, page=page, db=db
+    )),
+}
+
+def _run_section(name: str, page: PageParams):
+    """Load one section in its own session (sessions are not shared between threads)"""
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        return SECTIONS[name](db, page), None, time.perf_counter() - start
+    except HTTPException as e:
+        return None, e.detail, time.perf_counter() - start
+    except Exception as e:
+        print(f"Error loading dashboard section {name}: {str(e)}")
+        return None, str(e), time.perf_counter() - start
+    finally:
+        db.close()
+
+@router.get("/admin")
+async def get_admin_dashboard(
+    sections: Optional[str] = Query(None, description="Comma separated sections (default: all)"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    debug: bool = False
+):
+    """Everything the admin dashboard shows on load, in one response
+
+    Sections are loaded concurrently, each in a worker thread with its own
+    session; a section that fails is reported under `errors` without
+    failing the others. Lists hold their first `limit` rows with the cursor
+    of the next page. With debug=true, `timings` gives each section's
+    duration in milliseconds.
+    """
+    names = [name.strip() for name in sections.split(",") if name.strip()] if sections else list(SECTIONS)
+    unknown = [name for name in names if name not in SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+    names = list(dict.fromkeys(names))
+
+    start = time.perf_counter()
+    page = PageParams(limit=limit, after=None, fields=None)
+    results = await asyncio.gather(*(run_in_threadpool(_run_section, name, page) for name in names))
+
+    dashboard = {"sections": {}, "errors": {}}
+    timings = {}
+    for name, (section, error, elapsed) in zip(names, results):
+        if error is None:
+            dashboard["sections"][name] = section
+        else:
+            dashboard["errors"][name] = error
+        timings[name] = round(elapsed * 1000, 1)
+    if debug:
+        dashboard["timings"] = {**timings, "total": round((time.perf_counter() - start) * 1000, 1)}
+    return dashboard
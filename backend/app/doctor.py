@@ -1,15 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from db.models import Doctor
+from db.models import Doctor, DoctorAggregate
 from db.database import SessionLocal
 from pydantic import BaseModel
-from passlib.context import CryptContext
 from typing import Optional, List
 from app.schemas import DoctorCreate, DoctorResponse
+from app.pagination import PageParams, paginate, project, render_page
+from app.aggregates import average
+from app.refcache import reference_cache
+from app.identities import add_identity, email_taken, update_identity
+from app.passwords import password_pool
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Database Dependency
 def get_db():
@@ -19,58 +24,59 @@ def get_db():
     finally:
         db.close()
 
+def _doctor_response(doctor: Doctor, aggregate: Optional[DoctorAggregate], page: Optional[PageParams] = None) -> DoctorResponse:
+    values = dict(
+        id=doctor.id,
+        name=doctor.name or "Unknown",
+        specialty=doctor.specialty or "N/A",
+        email=doctor.email or "N/A",
+        is_active=doctor.is_active if doctor.is_active is not None else True,
+        patientCount=aggregate.patient_count if aggregate else 0,
+        averageRating=round(average(aggregate), 1)
+    )
+    return page.build(DoctorResponse, **values) if page else DoctorResponse(**values)
+
+def _with_aggregates(db: Session):
+    return db.query(Doctor, DoctorAggregate).outerjoin(DoctorAggregate, DoctorAggregate.doctor_id == Doctor.id)
+
 # Routes
 @router.get("/profile", response_model=DoctorResponse, status_code=status.HTTP_200_OK)
 def get_doctor_profile(email: str, db: Session = Depends(get_db)):
     """Return the profile of the doctor with the specified email"""
     if not email:
         raise HTTPException(status_code=400, detail="Email query parameter is required")
-    doctor = db.query(Doctor).filter(Doctor.email == email.lower()).first()
-    if not doctor:
+    row = _with_aggregates(db).filter(Doctor.email == email.lower()).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Doctor not found")
-    return DoctorResponse(
-        id=doctor.id,
-        name=doctor.name,
-        specialty=doctor.specialty,
-        email=doctor.email,
-        is_active=doctor.is_active,
-        patientCount=0,
-        averageRating=0.0
-    )
+    return _doctor_response(*row)
 
 @router.get("", response_model=List[DoctorResponse], status_code=status.HTTP_200_OK)
-def get_all_doctors(specialty: Optional[str] = None, db: Session = Depends(get_db)):
-    """Return a list of all doctors, optionally filtered by specialty"""
+def get_all_doctors(
+    response: Response,
+    specialty: Optional[str] = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db)
+):
+    """Return a page of doctors ordered by id, optionally filtered by specialty"""
+    page.validate_fields(DoctorResponse)
     try:
-        query = db.query(Doctor)
+        # The aggregate join is only needed for the fields it feeds
+        if page.wants("patientCount") or page.wants("averageRating"):
+            query = _with_aggregates(db)
+        else:
+            query = db.query(Doctor)
+        query = project(query, Doctor, page)
         if specialty:
             query = query.filter(Doctor.specialty.ilike(specialty))
-        doctors = query.all()
-        return [
-            DoctorResponse(
-                id=doctor.id,
-                name=doctor.name or "Unknown",
-                specialty=doctor.specialty or "N/A",
-                email=doctor.email or "N/A",
-                is_active=doctor.is_active if doctor.is_active is not None else True,
-                patientCount=doctor.patientCount if hasattr(doctor, 'patientCount') else 0,
-                averageRating=doctor.averageRating if hasattr(doctor, 'averageRating') else 0.0
-            )
-            for doctor in doctors
-        ]
+        rows, next_cursor = paginate(query, Doctor.id, page)
+        rows = [row if isinstance(row, Row) else (row, None) for row in rows]
+        items = [_doctor_response(doctor, aggregate, page) for doctor, aggregate in rows]
+        return render_page(items, next_cursor, page, response)
     except Exception as e:
         print(f"Error fetching doctors: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch doctors: {str(e)}")
 
-@router.post("", response_model=DoctorResponse, status_code=status.HTTP_201_CREATED)
-def create_doctor(data: DoctorCreate, db: Session = Depends(get_db)):
-    """Create a new doctor"""
-    existing = db.query(Doctor).filter_by(email=data.email).first()
-    if existing:
-        raise HTTPException(status_code=409, detail="Email already registered")
-
-    hashed_password = pwd_context.hash(data.password) if data.password else None
-
+def _save_new_doctor(db: Session, data: DoctorCreate, hashed_password: Optional[str]) -> DoctorResponse:
     new_doctor = Doctor(
         name=data.name,
         specialty=data.specialty,
@@ -81,6 +87,8 @@ def create_doctor(data: DoctorCreate, db: Session = Depends(get_db)):
 
     try:
         db.add(new_doctor)
+        db.flush()
+        add_identity(db, "doctor", new_doctor.id, new_doctor.email)
         db.commit()
         db.refresh(new_doctor)
     except IntegrityError:
@@ -89,70 +97,66 @@ def create_doctor(data: DoctorCreate, db: Session = Depends(get_db)):
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    reference_cache.invalidate_doctors()
 
-    return DoctorResponse(
-        id=new_doctor.id,
-        name=new_doctor.name,
-        specialty=new_doctor.specialty,
-        email=new_doctor.email,
-        is_active=new_doctor.is_active,
-        patientCount=0,
-        averageRating=0.0
-    )
+    return _doctor_response(new_doctor, None)
+
+@router.post("", response_model=DoctorResponse, status_code=status.HTTP_201_CREATED)
+async def create_doctor(data: DoctorCreate, db: Session = Depends(get_db)):
+    """Create a new doctor"""
+    if await run_in_threadpool(email_taken, db, data.email):
+        raise HTTPException(status_code=409, detail="Email already registered")
+
+    # bcrypt runs in the password pool; the session is only used on threadpool threads
+    hashed_password = await password_pool.hash(data.password) if data.password else None
+    return await run_in_threadpool(_save_new_doctor, db, data, hashed_password)
 
 @router.get("/{doctor_id}", response_model=DoctorResponse, status_code=status.HTTP_200_OK)
 def get_doctor(doctor_id: int, db: Session = Depends(get_db)):
     """Return the doctor with the specified ID"""
-    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
-    if not doctor:
+    row = _with_aggregates(db).filter(Doctor.id == doctor_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Doctor not found")
-    return DoctorResponse(
-        id=doctor.id,
-        name=doctor.name,
-        specialty=doctor.specialty,
-        email=doctor.email,
-        is_active=doctor.is_active if doctor.is_active is not None else True,
-        patientCount=0,
-        averageRating=0.0
-    )
+    return _doctor_response(*row)
 
-@router.put("/{doctor_id}", response_model=DoctorResponse, status_code=status.HTTP_200_OK)
-def update_doctor(doctor_id: int, data: DoctorCreate, db: Session = Depends(get_db)):
-    """Update an existing doctor"""
+def _doctor_to_update(db: Session, doctor_id: int, data: DoctorCreate) -> Doctor:
     doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
 
-    existing = db.query(Doctor).filter(Doctor.email == data.email, Doctor.id != doctor_id).first()
-    if existing:
+    if email_taken(db, data.email, "doctor", doctor_id):
         raise HTTPException(status_code=409, detail="Email already registered")
+    return doctor
 
+def _save_doctor_update(db: Session, doctor: Doctor, data: DoctorCreate, hashed_password: Optional[str]) -> DoctorResponse:
     doctor.name = data.name
     doctor.specialty = data.specialty
     doctor.email = data.email
     doctor.is_active = True
-    if data.password:
-        doctor.password = pwd_context.hash(data.password)
+    if hashed_password:
+        doctor.password = hashed_password
 
     try:
+        update_identity(db, "doctor", doctor.id, data.email)
         db.commit()
         db.refresh(doctor)
     except IntegrityError:
         db.rollback()
-        raise HTTPException(status_code=500, detail="Database error during doctor update")
+        # Another account took the email after the check above
+        raise HTTPException(status_code=409, detail="Email already registered")
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    reference_cache.invalidate_doctors()
 
-    return DoctorResponse(
-        id=doctor.id,
-        name=doctor.name,
-        specialty=doctor.specialty,
-        email=doctor.email,
-        is_active=doctor.is_active if doctor.is_active is not None else True,
-        patientCount=0,
-        averageRating=0.0
-    )
+    return _doctor_response(doctor, db.get(DoctorAggregate, doctor.id))
+
+@router.put("/{doctor_id}", response_model=DoctorResponse, status_code=status.HTTP_200_OK)
+async def update_doctor(doctor_id: int, data: DoctorCreate, db: Session = Depends(get_db)):
+    """Update an existing doctor"""
+    doctor = await run_in_threadpool(_doctor_to_update, db, doctor_id, data)
+    hashed_password = await password_pool.hash(data.password) if data.password else None
+    return await run_in_threadpool(_save_doctor_update, db, doctor, data, hashed_password)
 
 @router.patch("/{doctor_id}/status", response_model=DoctorResponse, status_code=status.HTTP_200_OK)
 def update_doctor_status(doctor_id: int, db: Session = Depends(get_db)):
@@ -168,13 +172,6 @@ def update_doctor_status(doctor_id: int, db: Session = Depends(get_db)):
     except IntegrityError:
         db.rollback()
         raise HTTPException(status_code=500, detail="Database error during status update")
+    reference_cache.invalidate_doctors()
 
-    return DoctorResponse(
-        id=doctor.id,
-        name=doctor.name,
-        specialty=doctor.specialty,
-        email=doctor.email,
-        is_active=doctor.is_active if doctor.is_active is not None else True,
-        patientCount=0,
-        averageRating=0.0
-    )
\ No newline at end of file
+    return _doctor_response(doctor, db.get(DoctorAggregate, doctor.id))
\ No newline at end of file
@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date as date_type, datetime, time as time_type
+from typing import Iterator, List, Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from db.database import SessionLocal
+from db.models import Appointment, Doctor, Feedback, FeedbackCategory, Patient
+from app.auth import get_current_user
+from app.appointments import appointment_filters
+from app.feedback import feedback_filters
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+# Rows fetched per round trip from the server-side cursor, and written per chunk
+EXPORT_CHUNK_SIZE = 2000
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+FEEDBACK_COLUMNS = [
+    "id", "created_at", "patient_id", "doctor_id", "doctor_name",
+    "category_id", "category_name", "rating", "comment",
+]
+APPOINTMENT_COLUMNS = [
+    "id", "date", "time", "patient_id", "patient_name", "doctor_id", "doctor_name",
+    "category", "description", "status",
+]
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, time_type):
+        return value.strftime("%H:%M")
+    if isinstance(value, date_type):
+        return value.isoformat()
+    return value
+
+def _encode(rows: Iterator[tuple], columns: List[str], fmt: str) -> Iterator[str]:
+    """Render rows as CSV (with a header) or NDJSON, one text chunk per EXPORT_CHUNK_SIZE rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+    count = 0
+    for row in rows:
+        values = [_value(v) for v in row]
+        if writer:
+            writer.writerow(["" if v is None else v for v in values])
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + "\n")
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _gzip(chunks: Iterator[str]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _stream(build_query, columns: List[str], fmt: str, compress: bool, name: str) -> StreamingResponse:
+    """Stream a query through a server-side cursor without holding the result in memory
+
+    The generator opens its own session: the request's session is closed
+    before a streaming body is sent.
+    """
+    def rows():
+        db = SessionLocal()
+        try:
+            yield from build_query(db).yield_per(EXPORT_CHUNK_SIZE)
+        except Exception as e:
+            # Headers are already sent, so the truncated body is the only signal
+            print(f"Export of {name} failed: {str(e)}")
+            raise
+        finally:
+            db.close()
+
+    body = _encode(rows(), columns, fmt)
+    filename = f"{name}.{fmt}"
+    if compress:
+        body = _gzip(body)
+        filename += ".gz"
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if compress else MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/feedback")
+def export_feedback(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    doctor_id: Optional[int] = None,
+    patient_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    date_from: Optional[date_type] = Query(None, alias="from"),
+    date_to: Optional[date_type] = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Download feedback as CSV or NDJSON, optionally gzipped"""
+    conditions = feedback_filters(doctor_id, patient_id, category_id, date_from, date_to)
+
+    def build_query(db):
+        return (
+            db.query(
+                Feedback.id, Feedback.created_at, Feedback.patient_id, Feedback.doctor_id, Doctor.name,
+                Feedback.category_id, FeedbackCategory.name, Feedback.rating, Feedback.comment,
+            )
+            .outerjoin(Doctor, Doctor.id == Feedback.doctor_id)
+            .outerjoin(FeedbackCategory, FeedbackCategory.id == Feedback.category_id)
+            .filter(*conditions)
+            .order_by(Feedback.id)
+        )
+    return _stream(build_query, FEEDBACK_COLUMNS, format, gzip, "feedback")
+
+@router.get("/appointments")
+def export_appointments(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    patient_id: Optional[int] = None,
+    doctor_id: Optional[int] = None,
+    date: Optional[date_type] = None,
+    date_from: Optional[date_type] = Query(None, alias="from"),
+    date_to: Optional[date_type] = Query(None, alias="to"),
+    status: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Download appointments as CSV or NDJSON, optionally gzipped"""
+    conditions = appointment_filters(patient_id, doctor_id, date, date_from, date_to, status)
+
+    def build_query(db):
+        return (
+            db.query(
+                Appointment.id, Appointment.date, Appointment.time, Appointment.patient_id,
+                (Patient.first_name + " " + Patient.last_name), Appointment.doctor_id, Doctor.name,
+                Appointment.category, Appointment.description, Appointment.status,
+            )
+            .outerjoin(Patient, Patient.id == Appointment.patient_id)
+            .outerjoin(Doctor, Doctor.id == Appointment.doctor_id)
+            .filter(*conditions)
+            .order_by(Appointment.id)
+        )
+    return _stream(build_query, APPOINTMENT_COLUMNS, format, gzip, "appointments")
@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, joinedload
 from db.database import SessionLocal
-from db.models import Feedback, FeedbackCategory, Doctor, Patient
+from db.models import Feedback, DoctorAggregate, Patient
 from app.schemas import FeedbackResponse, FeedbackBase, FeedbackCategoryResponse, DoctorResponse, PatientResponse
 from app.auth import get_current_user
-from pydantic import BaseModel
+from app.pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, PageParams, paginate, project, render_page
+from app.search import search_feedback
+from app.refcache import reference_cache
+from app.aggregates import average, doctor_aggregates, record_feedback
+from app.anomaly import anomaly_detector, queue_ratings
+from app.sentiment import queue_comments
+from app.ingest import read_records
+from db.upsert import dialect_insert
+from pydantic import BaseModel, Field, ValidationError
 import traceback
-from datetime import datetime
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional
 router = APIRouter(redirect_slashes=False)
 
 def get_db():
@@ -32,10 +42,49 @@ class FeedbackResponse(FeedbackBase):
     class Config:
         from_attributes = True
 
+class FeedbackBatchItem(FeedbackBase):
+    client_id: str = Field(..., min_length=1, max_length=64)
+    # When the device recorded the feedback; defaults to the upload time
+    submitted_at: Optional[datetime] = None
+
+class FeedbackBatchResult(BaseModel):
+    index: int
+    client_id: Optional[str] = None
+    status: str  # created, duplicate or error
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class FeedbackBatchResponse(BaseModel):
+    created: int
+    duplicates: int
+    failed: int
+    results: List[FeedbackBatchResult]
+
+class FeedbackSearchResult(FeedbackBase):
+    id: int
+    created_at: str
+    rank: float
+    snippet: str
+
+def feedback_filters(doctor_id, patient_id, category_id, date_from, date_to) -> list:
+    """SQL conditions shared by the feedback list and search endpoints"""
+    conditions = []
+    if doctor_id:
+        conditions.append(Feedback.doctor_id == doctor_id)
+    if patient_id:
+        conditions.append(Feedback.patient_id == patient_id)
+    if category_id:
+        conditions.append(Feedback.category_id == category_id)
+    if date_from:
+        conditions.append(Feedback.created_at >= datetime.combine(date_from, time.min))
+    if date_to:
+        conditions.append(Feedback.created_at < datetime.combine(date_to + timedelta(days=1), time.min))
+    return conditions
+
 @router.get("/feedback_categories", response_model=list[FeedbackCategoryResponse])
 def list_categories(db: Session = Depends(get_db)):
     """Return a list of feedback categories"""
-    categories = db.query(FeedbackCategory).all()
+    categories = sorted(reference_cache.categories(db).values(), key=lambda cat: cat.id)
     if not categories:
         raise HTTPException(status_code=404, detail="No categories found")
     return [
@@ -47,98 +96,273 @@ def list_categories(db: Session = Depends(get_db)):
     ]
 
 @router.get("/", response_model=list[FeedbackResponse])
-def list_feedback(doctor_id: int = None, patient_id: int = None, db: Session = Depends(get_db)):
-    """Return a list of feedback, optionally filtered by doctor_id or patient_id"""
+def list_feedback(
+    response: Response,
+    doctor_id: int = None,
+    patient_id: int = None,
+    category_id: int = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db)
+):
+    """Return a page of feedback ordered by id, optionally filtered by doctor, patient, category and date range"""
+    page.validate_fields(FeedbackResponse)
+    # Category and doctor come back in the same SELECT as the feedback, when requested
     query = db.query(Feedback)
+    if page.wants("category"):
+        query = query.options(joinedload(Feedback.category))
+    if page.wants("doctor"):
+        query = query.options(joinedload(Feedback.doctor))
+    query = project(query, Feedback, page)
     
-    # Apply filters
-    if doctor_id:
-        query = query.filter(Feedback.doctor_id == doctor_id)
-    if patient_id:
-        query = query.filter(Feedback.patient_id == patient_id)
+    query = query.filter(*feedback_filters(doctor_id, patient_id, category_id, date_from, date_to))
     
-    feedback = query.all()
-    if not feedback:
-        # Don't raise 404 error, just return empty list
-        return []
-    return [
-        FeedbackResponse(
+    feedback, next_cursor = paginate(query, Feedback.id, page)
+    aggregates = doctor_aggregates(db, {fb.doctor_id for fb in feedback}) if page.wants("doctor") else {}
+    items = [
+        page.build(
+            FeedbackResponse,
             id=fb.id,
             patient_id=fb.patient_id,
             doctor_id=fb.doctor_id,
             category_id=fb.category_id,
             rating=fb.rating,
             comment=fb.comment,
-            created_at=fb.created_at.isoformat(),
-            category=FeedbackCategoryResponse(id=fb.category.id, name=fb.category.name),
+            created_at=fb.created_at.isoformat() if fb.created_at else None,
+            category=FeedbackCategoryResponse(id=fb.category.id, name=fb.category.name) if page.wants("category") else None,
             doctor=DoctorResponse(
                 id=fb.doctor.id,
                 name=fb.doctor.name or "Unknown",
                 specialty=fb.doctor.specialty or "N/A",
                 email=fb.doctor.email or "N/A",
                 is_active=fb.doctor.is_active if fb.doctor.is_active is not None else True,
-                patientCount=0,
-                averageRating=0.0
-            ),
-            patient=PatientResponse(
-                id=fb.patient.id,
-                first_name=fb.patient.first_name or "Unknown",
-                last_name=fb.patient.last_name or "Unknown",
-                email=fb.patient.email or "N/A",
-                phone_number=fb.patient.phone_number or "N/A",
-                created_at=fb.patient.created_at.isoformat() if fb.patient.created_at else datetime.utcnow().isoformat(),
-                is_active=fb.patient.is_active if fb.patient.is_active is not None else True
-            )
+                patientCount=aggregates[fb.doctor_id].patient_count if fb.doctor_id in aggregates else 0,
+                averageRating=round(average(aggregates.get(fb.doctor_id)), 1)
+            ) if page.wants("doctor") else None
         )
         for fb in feedback
     ]
+    return render_page(items, next_cursor, page, response)
 
 
 
+@router.get("/search", response_model=list[FeedbackSearchResult])
+def search_feedback_comments(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    lang: Optional[str] = Query(None, pattern="^(en|fr)$"),
+    doctor_id: int = None,
+    patient_id: int = None,
+    category_id: int = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Search feedback comments, best matches first, with <mark>-highlighted snippets"""
+    conditions = feedback_filters(doctor_id, patient_id, category_id, date_from, date_to)
+    rows, next_cursor = search_feedback(db, q, lang, conditions, limit, after)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [
+        FeedbackSearchResult(
+            id=fb.id,
+            patient_id=fb.patient_id,
+            doctor_id=fb.doctor_id,
+            category_id=fb.category_id,
+            rating=fb.rating,
+            comment=fb.comment,
+            created_at=fb.created_at.isoformat(),
+            rank=rank,
+            snippet=snippet or ""
+        )
+        for fb, rank, snippet in rows
+    ]
+
+def _utc(value: datetime) -> datetime:
+    """Naive UTC datetime, as stored in created_at"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _batch_create(db: Session, records: List[dict]) -> FeedbackBatchResponse:
+    results: List[Optional[FeedbackBatchResult]] = [None] * len(records)
+    now = datetime.utcnow()
+    valid = []
+    first_index = {}
+    
+    # Validate every record, and collapse client ids repeated within the batch
+    for index, record in enumerate(records):
+        try:
+            item = FeedbackBatchItem(**record)
+        except ValidationError as e:
+            # Echo the client id back even when it is not a string, so the device can match the error
+            client_id = record.get("client_id")
+            results[index] = FeedbackBatchResult(index=index, client_id=None if client_id is None else str(client_id), status="error", detail=str(e))
+            continue
+        if item.client_id in first_index:
+            results[index] = FeedbackBatchResult(index=index, client_id=item.client_id, status="duplicate", detail=f"Same client_id as row {first_index[item.client_id]}")
+            continue
+        first_index[item.client_id] = index
+        valid.append((index, item))
+    
+    # Foreign keys: doctors and categories from the reference cache, patients in one IN query
+    patient_ids = {item.patient_id for _, item in valid}
+    known_patients = {row.id for row in db.query(Patient.id).filter(Patient.id.in_(patient_ids))} if patient_ids else set()
+    known_doctors = {doctor_id for doctor_id in {item.doctor_id for _, item in valid} if reference_cache.doctor(db, doctor_id)}
+    categories = reference_cache.categories(db)
+    
+    # Items uploaded before (a retried upload) are reported with their stored id
+    client_ids = [item.client_id for _, item in valid]
+    stored = dict(db.query(Feedback.client_id, Feedback.id).filter(Feedback.client_id.in_(client_ids))) if client_ids else {}
+    
+    to_insert = []
+    for index, item in valid:
+        if item.client_id in stored:
+            results[index] = FeedbackBatchResult(index=index, client_id=item.client_id, status="duplicate", id=stored[item.client_id])
+        elif item.doctor_id not in known_doctors:
+            results[index] = FeedbackBatchResult(index=index, client_id=item.client_id, status="error", detail="Doctor not found")
+        elif item.patient_id not in known_patients:
+            results[index] = FeedbackBatchResult(index=index, client_id=item.client_id, status="error", detail="Patient not found")
+        elif item.category_id not in categories:
+            results[index] = FeedbackBatchResult(index=index, client_id=item.client_id, status="error", detail="Feedback category not found")
+        else:
+            to_insert.append((index, item))
+    
+    created = {}
+    created_at = {
+        item.client_id: min(_utc(item.submitted_at), now) if item.submitted_at else now
+        for _, item in to_insert
+    }
+    if to_insert:
+        # One multi-row INSERT; a concurrent upload of the same items loses the race silently
+        stmt = (
+            dialect_insert(db, Feedback)
+            .on_conflict_do_nothing(index_elements=["client_id"])
+            .returning(Feedback.client_id, Feedback.id)
+        )
+        created = dict(db.execute(stmt, [
+            {
+                "patient_id": item.patient_id,
+                "doctor_id": item.doctor_id,
+                "category_id": item.category_id,
+                "rating": item.rating,
+                "comment": item.comment,
+                "client_id": item.client_id,
+                "created_at": created_at[item.client_id],
+            }
+            for _, item in to_insert
+        ]).all())
+        record_feedback(db, [
+            (item.doctor_id, item.patient_id, item.category_id, item.rating, created_at[item.client_id])
+            for _, item in to_insert if item.client_id in created
+        ])
+        queue_ratings(db, [
+            (created[item.client_id], item.doctor_id, item.category_id, item.rating)
+            for _, item in to_insert if item.client_id in created
+        ])
+        queue_comments(db, [created[item.client_id] for _, item in to_insert if item.client_id in created])
+        raced = [item.client_id for _, item in to_insert if item.client_id not in created]
+        if raced:
+            stored.update(db.query(Feedback.client_id, Feedback.id).filter(Feedback.client_id.in_(raced)))
+        db.commit()
+        if created:
+            anomaly_detector.notify()
+        for index, item in to_insert:
+            if item.client_id in created:
+                results[index] = FeedbackBatchResult(index=index, client_id=item.client_id, status="created", id=created[item.client_id])
+            else:
+                results[index] = FeedbackBatchResult(index=index, client_id=item.client_id, status="duplicate", id=stored.get(item.client_id))
+    
+    # Repeats within the batch point at the row they repeat
+    for result in results:
+        if result.status == "duplicate" and result.id is None and result.client_id in first_index:
+            result.id = results[first_index[result.client_id]].id
+    
+    statuses = [result.status for result in results]
+    return FeedbackBatchResponse(
+        created=statuses.count("created"),
+        duplicates=statuses.count("duplicate"),
+        failed=statuses.count("error"),
+        results=results
+    )
+
+@router.post("/batch", response_model=FeedbackBatchResponse)
+async def create_feedback_batch(request: Request, db: Session = Depends(get_db)):
+    """Store many feedback entries at once from a JSON array or NDJSON body
+    
+    Every entry carries a device-generated client_id: entries already stored
+    are reported as duplicates instead of being inserted again, so a kiosk
+    can safely retry an upload. Validation uses one query per referenced
+    table and all new entries are inserted in a single transaction.
+    """
+    records = await read_records(request)
+    return await run_in_threadpool(_batch_create, db, records)
+
 @router.post("/", response_model=FeedbackResponse, status_code=status.HTTP_201_CREATED)
 def create_feedback(data: FeedbackBase, db: Session = Depends(get_db)):
     """Create a new feedback entry"""
-    # Validate doctor_id
-    doctor = db.query(Doctor).filter(Doctor.id == data.doctor_id).first()
+    # Doctor and category are validated from the reference cache
+    doctor = reference_cache.doctor(db, data.doctor_id)
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     
     # Validate patient_id
-    patient = db.query(Patient).filter(Patient.id == data.patient_id).first()
+    patient = db.get(Patient, data.patient_id)
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
-
+    patient_response = PatientResponse(
+        id=patient.id,
+        first_name=patient.first_name or "Unknown",
+        last_name=patient.last_name or "Unknown",
+        email=patient.email or "N/A",
+        phone_number=patient.phone_number or "N/A",
+        created_at=patient.created_at.isoformat() if patient.created_at else datetime.utcnow().isoformat(),
+        is_active=patient.is_active if patient.is_active is not None else True
+    )
 
     # Validate category_id
-    category = db.query(FeedbackCategory).filter(FeedbackCategory.id == data.category_id).first()
+    category = reference_cache.category(db, data.category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Feedback category not found")
 
     # Create feedback
+    created_at = datetime.utcnow()
     new_feedback = Feedback(
     patient_id=data.patient_id,
     doctor_id=data.doctor_id,
     category_id=data.category_id,
     rating=data.rating,
-    comment=data.comment
+    comment=data.comment,
+    created_at=created_at
     )
     try:
         db.add(new_feedback)
+        db.flush()
+        feedback_id = new_feedback.id
+        # The doctor's aggregates change in the same transaction as the feedback
+        record_feedback(db, [(data.doctor_id, data.patient_id, data.category_id, data.rating, created_at)])
+        queue_ratings(db, [(feedback_id, data.doctor_id, data.category_id, data.rating)])
+        queue_comments(db, [feedback_id])
         db.commit()
-        db.refresh(new_feedback)
+        anomaly_detector.notify()
     except Exception as e:
         db.rollback()
         # Log the full stack trace for debugging
         print("Error creating feedback:", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Failed to create feedback: {str(e)}") 
+    aggregate = db.get(DoctorAggregate, doctor.id)
+    # Built from the request and the cache: the committed row needs no reload
     return FeedbackResponse(
-        id=new_feedback.id,
-        patient_id=new_feedback.patient_id,
-        doctor_id=new_feedback.doctor_id,
-        category_id=new_feedback.category_id,
-        rating=new_feedback.rating,
-        comment=new_feedback.comment,
-        created_at=new_feedback.created_at.isoformat(),
+        id=feedback_id,
+        patient_id=data.patient_id,
+        doctor_id=data.doctor_id,
+        category_id=data.category_id,
+        rating=data.rating,
+        comment=data.comment,
+        created_at=created_at.isoformat(),
         category=FeedbackCategoryResponse(id=category.id, name=category.name),
         doctor=DoctorResponse(
             id=doctor.id,
@@ -146,16 +370,13 @@ def create_feedback(data: FeedbackBase, db: Session = Depends(get_db)):
             specialty=doctor.specialty or "N/A",
             email=doctor.email or "N/A",
             is_active=doctor.is_active if doctor.is_active is not None else True,
-            patientCount=0,
-            averageRating=0.0
+            patientCount=aggregate.patient_count if aggregate else 0,
+            averageRating=round(average(aggregate), 1)
         ),
-        patient=PatientResponse(
-            id=patient.id,
-            first_name=patient.first_name or "Unknown",
-            last_name=patient.last_name or "Unknown",
-            email=patient.email or "N/A",
-            phone_number=patient.phone_number or "N/A",
-            created_at=patient.created_at.isoformat() if patient.created_at else datetime.utcnow().isoformat(),
-            is_active=patient.is_active if patient.is_active is not None else True
-        )
-    )
\ No newline at end of file
+        patient=patient_response
+    )
+
+@router.get("/reference-cache")
+def get_reference_cache_stats():
+    """Return hit/miss counters of the in-process reference-data cache"""
+    return reference_cache.stats()
@@ -0,0 +1,100 @@
+import sys
+from typing import Optional, Tuple
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from db.models import Admin, Doctor, Identity, Patient
+from db.upsert import insert_ignore
+
+ROLE_MODELS = {"admin": Admin, "doctor": Doctor, "patient": Patient}
+# When the same email exists in several role tables, login has always picked the first of these
+ROLE_PRECEDENCE = ("admin", "doctor", "patient")
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+def _row(role: str, user_id: int, email: str) -> dict:
+    return {
+        "email": normalize_email(email),
+        "role": role,
+        "admin_id": user_id if role == "admin" else None,
+        "doctor_id": user_id if role == "doctor" else None,
+        "patient_id": user_id if role == "patient" else None,
+    }
+
+def email_taken(db: Session, email: str, role: Optional[str] = None, user_id: Optional[int] = None) -> bool:
+    """Whether an account other than (role, user_id) already uses the email"""
+    identity = db.get(Identity, normalize_email(email))
+    if identity is None:
+        return False
+    return not (role == identity.role and user_id is not None and user_id == getattr(identity, f"{role}_id"))
+
+def add_identity(db: Session, role: str, user_id: int, email: str):
+    """Index a new account; call in the transaction that creates it"""
+    db.add(Identity(**_row(role, user_id, email)))
+
+def update_identity(db: Session, role: str, user_id: int, email: str):
+    """Point the account's index entry at its (possibly new) email
+
+    The new entry is a plain insert: if another account took the email since
+    it was checked, the flush raises IntegrityError and the caller's rollback
+    keeps the account's current entry.
+    """
+    email = normalize_email(email)
+    current = db.query(Identity).filter(getattr(Identity, f"{role}_id") == user_id).first()
+    if current is not None and current.email == email:
+        return
+    if current is not None:
+        db.delete(current)
+        # The account column is unique too: remove the old entry before adding the new one
+        db.flush()
+    db.add(Identity(**_row(role, user_id, email)))
+    db.flush()
+
+def find_account(db: Session, email: str) -> Tuple[Optional[str], Optional[object]]:
+    """Return (role, account) for an email in one indexed, joined query"""
+    row = (
+        db.query(Identity.role, Admin, Doctor, Patient)
+        .outerjoin(Admin, Admin.id == Identity.admin_id)
+        .outerjoin(Doctor, Doctor.id == Identity.doctor_id)
+        .outerjoin(Patient, Patient.id == Identity.patient_id)
+        .filter(Identity.email == normalize_email(email))
+        .first()
+    )
+    if row is None:
+        return None, None
+    role, admin, doctor, patient = row
+    return role, {"admin": admin, "doctor": doctor, "patient": patient}[role]
+
+def rebuild_identities(db: Session) -> int:
+    """Recreate the index from the admins, doctors and patients tables and return its size"""
+    db.query(Identity).delete(synchronize_session=False)
+    rows = {}
+    for role in ROLE_PRECEDENCE:
+        model = ROLE_MODELS[role]
+        for user_id, email in db.query(model.id, model.email).filter(model.email.isnot(None)):
+            row = _row(role, user_id, email)
+            rows.setdefault(row["email"], row)
+    # Another worker may be rebuilding at the same time
+    insert_ignore(db, Identity, list(rows.values()), ["email"])
+    return len(rows)
+
+def main(argv: Optional[list] = None):
+    """Rebuild the login index: python -m app.identities rebuild"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv != ["rebuild"]:
+        print("Usage: python -m app.identities rebuild")
+        return 2
+    db = SessionLocal()
+    try:
+        count = rebuild_identities(db)
+        db.commit()
+        print(f"Indexed {count} accounts")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import csv
+import json
+from fastapi import HTTPException, Request
+from typing import Dict, List
+
+# Upper bound on the number of records accepted by one bulk request
+MAX_BULK_RECORDS = 5000
+
+async def _lines(request: Request):
+    """Yield the decoded lines of the request body as it streams in"""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8").rstrip("\r")
+
+def _check_size(records: List[Dict]):
+    if len(records) > MAX_BULK_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_RECORDS} records per request")
+
+async def read_records(request: Request) -> List[Dict]:
+    """Read a bulk request body as a list of dicts
+
+    Accepts a JSON array (application/json), newline-delimited JSON
+    (application/x-ndjson) or CSV with a header row (text/csv). NDJSON and
+    CSV bodies are parsed line by line while they stream in.
+    """
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    records: List[Dict] = []
+    try:
+        if content_type in ("application/x-ndjson", "application/jsonl"):
+            async for line in _lines(request):
+                if line.strip():
+                    records.append(json.loads(line))
+                    _check_size(records)
+        elif content_type == "text/csv":
+            header = None
+            async for line in _lines(request):
+                if not line.strip():
+                    continue
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                # Empty CSV cells mean "not provided"
+                records.append({k: v for k, v in zip(header, values) if v != ""})
+                _check_size(records)
+        else:
+            body = json.loads(await request.body())
+            if not isinstance(body, list):
+                raise HTTPException(status_code=400, detail="Expected a JSON array of records")
+            records = body
+            _check_size(records)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed request body: {str(e)}")
+
+    if not all(isinstance(record, dict) for record in records):
+        raise HTTPException(status_code=400, detail="Every record must be an object")
+    return records
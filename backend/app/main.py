@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
+import os
 from db.database import Base, engine, SessionLocal
-from db.models import FeedbackCategory
+from db.models import FeedbackCategory, Identity
 from app.doctor import router as doctor_router
 from app.patient import router as patient_router
 from app.feedback import router as feedback_router
@@ -11,6 +13,32 @@ from app.reminders import router as reminders_router
 from app.appointments import router as appointments_router, public_router as appointments_public_router
 from app.medications import router as medications_router
 from app.statistics import router as statistics_router
+from app.export import router as export_router
+from app.dashboard import router as dashboard_router
+from app.pagination import NEXT_CURSOR_HEADER
+from app.scheduler import reminder_scheduler
+from app.sms import sms_dispatcher
+from app.outbox import outbox_relay
+from app.appointment_reminders import run_appointment_reminders
+from app.sentiment import run_sentiment_pipeline
+from app.rollups import run_rollup_compaction
+from app.anomaly import anomaly_detector
+from app.snapshots import GENERATED_AT_HEADER, statistics_snapshots
+from app.refcache import reference_cache
+from app.identities import rebuild_identities
+from app.passwords import password_pool
+
+# Set to "false" on API workers that should not fire medication reminders; the
+# workers that do pick up reminders created anywhere within REMINDER_SYNC_SECONDS
+REMINDER_SCHEDULER_ENABLED = os.environ.get("REMINDER_SCHEDULER_ENABLED", "true").lower() == "true"
+# Relays are safe to run on every worker; disable to leave delivery to dedicated workers
+OUTBOX_RELAY_ENABLED = os.environ.get("OUTBOX_RELAY_ENABLED", "true").lower() == "true"
+APPOINTMENT_REMINDERS_ENABLED = os.environ.get("APPOINTMENT_REMINDERS_ENABLED", "true").lower() == "true"
+SENTIMENT_PIPELINE_ENABLED = os.environ.get("SENTIMENT_PIPELINE_ENABLED", "true").lower() == "true"
+ROLLUP_COMPACTION_ENABLED = os.environ.get("ROLLUP_COMPACTION_ENABLED", "true").lower() == "true"
+ANOMALY_DETECTION_ENABLED = os.environ.get("ANOMALY_DETECTION_ENABLED", "true").lower() == "true"
+# Without the refresher, stale statistics snapshots are recomputed by the request that finds them
+STATS_SNAPSHOT_REFRESHER_ENABLED = os.environ.get("STATS_SNAPSHOT_REFRESHER_ENABLED", "true").lower() == "true"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -23,10 +51,39 @@ async def lifespan(app: FastAPI):
             for name in categories:
                 db.add(FeedbackCategory(name=name))
             db.commit()
-        yield
+            reference_cache.invalidate_categories()
+        # Fill the login index on first start (see app/identities.py)
+        if db.query(Identity.email).first() is None:
+            print(f"Indexed {rebuild_identities(db)} accounts for login")
+            db.commit()
     finally:
         db.close()
 
+    await sms_dispatcher.start()
+    tasks = []
+    if OUTBOX_RELAY_ENABLED:
+        tasks.append(asyncio.create_task(outbox_relay.run()))
+    if REMINDER_SCHEDULER_ENABLED:
+        reminder_scheduler.load()
+        tasks.append(asyncio.create_task(reminder_scheduler.run()))
+    if APPOINTMENT_REMINDERS_ENABLED:
+        tasks.append(asyncio.create_task(run_appointment_reminders()))
+    if SENTIMENT_PIPELINE_ENABLED:
+        tasks.append(asyncio.create_task(run_sentiment_pipeline()))
+    if ROLLUP_COMPACTION_ENABLED:
+        tasks.append(asyncio.create_task(run_rollup_compaction()))
+    if ANOMALY_DETECTION_ENABLED:
+        tasks.append(asyncio.create_task(anomaly_detector.run()))
+    if STATS_SNAPSHOT_REFRESHER_ENABLED:
+        tasks.append(asyncio.create_task(statistics_snapshots.run()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await sms_dispatcher.stop()
+        password_pool.shutdown()
+
 app = FastAPI(title="DGH Care API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
@@ -35,6 +92,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, GENERATED_AT_HEADER, "Content-Disposition"],
 )
 Base.metadata.create_all(bind=engine)
 
@@ -47,6 +105,8 @@ app.include_router(appointments_router, prefix="/appointments", tags=["Appointme
 app.include_router(appointments_public_router, prefix="/appointments/public", tags=["Appointments Public"])
 app.include_router(medications_router, prefix="/medications", tags=["Medications"])
 app.include_router(statistics_router)
+app.include_router(export_router)
+app.include_router(dashboard_router)
 
 @app.get("/health")
 def health_check():
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 from db.database import get_db
 from db.models import Medication, Doctor, Patient
 from app.auth import get_current_user
+from app.pagination import PageParams, paginate, project, render_page
 from datetime import datetime
 
 router = APIRouter()
@@ -31,6 +32,22 @@ class MedicationResponse(MedicationBase):
     class Config:
         orm_mode = True
 
+def _with_names(db: Session):
+    """Query medications together with the doctor and patient names in one round trip"""
+    return (
+        db.query(Medication, Doctor.name, Patient.first_name, Patient.last_name)
+        .outerjoin(Doctor, Doctor.id == Medication.doctor_id)
+        .outerjoin(Patient, Patient.id == Medication.patient_id)
+    )
+
+def _attach_names(row):
+    """Copy the joined doctor and patient names onto the medication for the response"""
+    medication, doctor_name, first_name, last_name = row
+    medication.doctor_name = doctor_name
+    if first_name is not None or last_name is not None:
+        medication.patient_name = f"{first_name} {last_name}"
+    return medication
+
 @router.post("/", response_model=MedicationResponse, status_code=status.HTTP_201_CREATED)
 def create_medication(medication: MedicationCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     """Create a new medication record"""
@@ -68,14 +85,17 @@ def create_medication(medication: MedicationCreate, db: Session = Depends(get_db
 
 @router.get("/", response_model=List[MedicationResponse])
 def get_medications(
+    response: Response,
     patient_id: Optional[int] = None, 
     doctor_id: Optional[int] = None,
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Get medications with optional filters"""
     
-    query = db.query(Medication)
+    page.validate_fields(MedicationResponse)
+    query = project(_with_names(db), Medication, page)
     
     # Apply filters if provided
     if patient_id:
@@ -84,21 +104,9 @@ def get_medications(
     if doctor_id:
         query = query.filter(Medication.doctor_id == doctor_id)
     
-    # Get medications
-    medications = query.all()
-    
-    # Add doctor and patient names for the response
-    for medication in medications:
-        doctor = db.query(Doctor).filter(Doctor.id == medication.doctor_id).first()
-        patient = db.query(Patient).filter(Patient.id == medication.patient_id).first()
-        
-        if doctor:
-            medication.doctor_name = doctor.name
-        
-        if patient:
-            medication.patient_name = f"{patient.first_name} {patient.last_name}"
-    
-    return medications
+    rows, next_cursor = paginate(query, Medication.id, page)
+    items = [page.build_from(MedicationResponse, _attach_names(row)) for row in rows]
+    return render_page(items, next_cursor, page, response)
 
 @router.get("/{medication_id}", response_model=MedicationResponse)
 def get_medication(
@@ -108,25 +116,15 @@ def get_medication(
 ):
     """Get a specific medication by ID"""
     
-    medication = db.query(Medication).filter(Medication.id == medication_id).first()
+    row = _with_names(db).filter(Medication.id == medication_id).first()
     
-    if not medication:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Medication with ID {medication_id} not found"
         )
     
-    # Add doctor and patient names for the response
-    doctor = db.query(Doctor).filter(Doctor.id == medication.doctor_id).first()
-    patient = db.query(Patient).filter(Patient.id == medication.patient_id).first()
-    
-    if doctor:
-        medication.doctor_name = doctor.name
-    
-    if patient:
-        medication.patient_name = f"{patient.first_name} {patient.last_name}"
-    
-    return medication
+    return _attach_names(row)
 
 @router.put("/{medication_id}", response_model=MedicationResponse)
 def update_medication(
@@ -150,19 +148,9 @@ def update_medication(
         setattr(db_medication, key, value)
     
     db.commit()
-    db.refresh(db_medication)
     
-    # Add doctor and patient names for the response
-    doctor = db.query(Doctor).filter(Doctor.id == db_medication.doctor_id).first()
-    patient = db.query(Patient).filter(Patient.id == db_medication.patient_id).first()
-    
-    if doctor:
-        db_medication.doctor_name = doctor.name
-    
-    if patient:
-        db_medication.patient_name = f"{patient.first_name} {patient.last_name}"
-    
-    return db_medication
+    # Reload the medication and the doctor/patient names in a single query
+    return _attach_names(_with_names(db).filter(Medication.id == medication_id).one())
 
 @router.delete("/{medication_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_medication(
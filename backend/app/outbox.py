@@ -0,0 +1,218 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from db.models import MedicationReminder, NotificationOutbox
+from db.upsert import insert_ignore
+from app.sms import SmsMessage, backoff_delay, compose_messages, sms_dispatcher
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "5"))
+# A row claimed longer ago than this is assumed to belong to a dead worker
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "600"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "3"))
+# Pending messages for the same recipient due within this many seconds are sent together
+SMS_COALESCE_WINDOW_SECONDS = int(os.environ.get("SMS_COALESCE_WINDOW_SECONDS", "300"))
+# Longest combined message, in SMS segments
+SMS_MAX_SEGMENTS = int(os.environ.get("SMS_MAX_SEGMENTS", "3"))
+
+def enqueue(db: Session, idempotency_key: str, recipient: str, body: str, reminder_id: Optional[int] = None):
+    """Add an SMS to the outbox as part of the caller's transaction"""
+    db.add(NotificationOutbox(
+        idempotency_key=idempotency_key,
+        recipient=recipient,
+        body=body,
+        reminder_id=reminder_id,
+    ))
+
+def enqueue_many(db: Session, messages: List[dict]):
+    """Add many SMS to the outbox, skipping idempotency keys that are already there
+
+    Each message is a dict with idempotency_key, recipient, body and
+    optionally reminder_id and available_at.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "idempotency_key": m["idempotency_key"],
+            "channel": "sms",
+            "recipient": m["recipient"],
+            "body": m["body"],
+            "reminder_id": m.get("reminder_id"),
+            "status": "pending",
+            "attempts": 0,
+            "available_at": m.get("available_at") or now,
+            "created_at": now,
+        }
+        for m in messages
+    ]
+    insert_ignore(db, NotificationOutbox, rows, ["idempotency_key"])
+
+class OutboxRelay:
+    """Delivers outbox rows through the SMS dispatcher
+
+    Batches are claimed with SELECT ... FOR UPDATE SKIP LOCKED and marked
+    'sending' before delivery, so several API workers can run a relay without
+    sending the same row twice. Rows whose claim outlives the lease (the
+    worker died mid-delivery) are claimed again.
+
+    Rows for the same recipient are combined into as few SMS as fit in
+    SMS_MAX_SEGMENTS, and a claim also pulls in that recipient's rows due
+    within SMS_COALESCE_WINDOW_SECONDS, so a patient taking several
+    medications at once gets one message. The reminder scheduler queues
+    doses that far ahead of their time for this. Rows waiting to be retried
+    are never pulled in early, so their backoff holds.
+    """
+    def __init__(self, dispatcher=sms_dispatcher, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.dispatcher = dispatcher
+        self.batch_size = batch_size
+        self.metrics = {"rows_delivered": 0, "rows_failed": 0, "sms_sent": 0, "sms_saved": 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def notify(self):
+        """Wake the relay after committing new outbox rows (safe from any thread)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _claim(self) -> List[dict]:
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(NotificationOutbox)
+                .filter(or_(
+                    and_(NotificationOutbox.status == "pending", NotificationOutbox.available_at <= now),
+                    and_(NotificationOutbox.status == "sending", NotificationOutbox.claimed_at < now - timedelta(seconds=OUTBOX_LEASE_SECONDS)),
+                ))
+                .order_by(NotificationOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            recipients = {row.recipient for row in rows}
+            if recipients and SMS_COALESCE_WINDOW_SECONDS > 0:
+                rows += (
+                    db.query(NotificationOutbox)
+                    .filter(
+                        NotificationOutbox.status == "pending",
+                        NotificationOutbox.attempts == 0,
+                        NotificationOutbox.recipient.in_(recipients),
+                        NotificationOutbox.available_at <= now + timedelta(seconds=SMS_COALESCE_WINDOW_SECONDS),
+                        NotificationOutbox.id.notin_([row.id for row in rows]),
+                    )
+                    .with_for_update(skip_locked=True)
+                    .all()
+                )
+            claimed = []
+            for row in rows:
+                row.status = "sending"
+                row.claimed_at = now
+                row.attempts += 1
+                claimed.append({
+                    "id": row.id,
+                    "recipient": row.recipient,
+                    "body": row.body,
+                    "reminder_id": row.reminder_id,
+                    "attempts": row.attempts,
+                })
+            db.commit()
+            return claimed
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _complete(self, claimed: List[dict], outcomes: List[tuple]):
+        """Record (delivered, provider_id, error) outcomes on the outbox rows and their reminders"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            for row, (delivered, provider_id, error) in zip(claimed, outcomes):
+                values = {"last_error": error, "provider_id": provider_id}
+                if delivered:
+                    values.update(status="sent", sent_at=now)
+                elif row["attempts"] < OUTBOX_MAX_ATTEMPTS:
+                    values.update(status="pending", available_at=now + timedelta(seconds=backoff_delay(row["attempts"])))
+                else:
+                    values.update(status="failed")
+                # Only the claim that is still current may complete the row
+                db.query(NotificationOutbox).filter(
+                    NotificationOutbox.id == row["id"],
+                    NotificationOutbox.status == "sending",
+                    NotificationOutbox.attempts == row["attempts"],
+                ).update(values, synchronize_session=False)
+                if row["reminder_id"] is not None and values["status"] != "pending":
+                    db.query(MedicationReminder).filter(MedicationReminder.id == row["reminder_id"]).update({
+                        MedicationReminder.last_delivery_status: values["status"],
+                        MedicationReminder.last_delivery_at: now,
+                        MedicationReminder.last_delivery_error: error,
+                        MedicationReminder.last_delivery_attempts: row["attempts"],
+                    }, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _relay_batch(self) -> int:
+        claimed = await asyncio.to_thread(self._claim)
+        if not claimed:
+            return 0
+
+        by_recipient: Dict[str, List[int]] = {}
+        for position, row in enumerate(claimed):
+            by_recipient.setdefault(row["recipient"], []).append(position)
+
+        # Each SMS carries one or more claimed rows
+        carried, futures = [], []
+        for recipient, positions in by_recipient.items():
+            for text, indexes in compose_messages([claimed[p]["body"] for p in positions], SMS_MAX_SEGMENTS):
+                rows = [positions[i] for i in indexes]
+                reminder_id = claimed[rows[0]]["reminder_id"] if len(rows) == 1 else None
+                carried.append(rows)
+                futures.append(await self.dispatcher.submit(SmsMessage(to=recipient, body=text, reminder_id=reminder_id)))
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        # A row is delivered once every SMS carrying (part of) it went out
+        outcomes = [(True, None, None)] * len(claimed)
+        for rows, result in zip(carried, results):
+            if isinstance(result, Exception):
+                delivered, provider_id, error = False, None, str(result)
+            else:
+                delivered, provider_id, error = result.delivered, result.provider_id, result.error
+            for position in rows:
+                if outcomes[position][0]:
+                    outcomes[position] = (delivered, provider_id, error)
+
+        await asyncio.to_thread(self._complete, claimed, outcomes)
+        delivered_rows = sum(1 for outcome in outcomes if outcome[0])
+        self.metrics["rows_delivered"] += delivered_rows
+        self.metrics["rows_failed"] += len(claimed) - delivered_rows
+        self.metrics["sms_sent"] += len(futures)
+        self.metrics["sms_saved"] += max(len(claimed) - len(futures), 0)
+        return len(claimed)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self._relay_batch():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Outbox relay error: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+outbox_relay = OutboxRelay()
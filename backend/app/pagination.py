@@ -0,0 +1,110 @@
+from fastapi import HTTPException, Query, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import inspect
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Optional
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class PageParams:
+    """Keyset pagination and field projection shared by the list endpoints
+
+    `after` is the id of the last row of the previous page (taken from the
+    X-Next-Cursor response header) and `fields` is a comma separated list of
+    response fields to return. Without `limit` or `after` the whole list is
+    returned, as before pagination existed; `after` alone pages by
+    DEFAULT_PAGE_SIZE.
+    """
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[int] = Query(None, ge=0),
+        fields: Optional[str] = Query(None),
+    ):
+        self.limit = limit
+        self.after = after
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    def validate_fields(self, model):
+        """Reject projections naming fields the response model does not have"""
+        if self.fields:
+            unknown = [f for f in self.fields if f not in model.model_fields]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    def wants(self, field: str) -> bool:
+        """Whether the response includes `field`"""
+        return not self.fields or field in self.fields
+
+    def build(self, model, **values):
+        """Build a response item; under a projection, only from the requested fields
+
+        Projected items are not validated: the columns behind the other
+        fields were not loaded (see `project`).
+        """
+        if not self.fields:
+            return model(**values)
+        return model.model_construct(**{name: value for name, value in values.items() if name in self.fields})
+
+    def build_from(self, model, source):
+        """Build a response item from an object's attributes, like `build`"""
+        if not self.fields:
+            return model.model_validate(source, from_attributes=True)
+        return model.model_construct(**{name: getattr(source, name) for name in self.fields})
+
+
+def project(query, entity, page: PageParams, *needed: str):
+    """Load only the entity columns behind the requested fields, its primary key and `needed`"""
+    if not page.fields:
+        return query
+    columns = [
+        getattr(entity, attribute.key)
+        for attribute in inspect(entity).column_attrs
+        if attribute.key in page.fields or attribute.key in needed or attribute.columns[0].primary_key
+    ]
+    return query.options(load_only(*columns))
+
+def _unload_to_none(entity):
+    """Make the columns `project` left out read as None instead of lazy loading them one row at a time"""
+    state = inspect(entity)
+    for key in state.unloaded & set(state.mapper.column_attrs.keys()):
+        set_committed_value(entity, key, None)
+
+
+def paginate(query, key, page: PageParams):
+    """Apply the cursor to a query ordered by `key` and return (rows, next_cursor)
+
+    `key` must be a unique, indexed column (the primary key for every list
+    endpoint) so the ordering is stable and each page is an index range scan.
+    """
+    if page.after is not None:
+        query = query.filter(key > page.after)
+    query = query.order_by(key)
+    limit = page.limit or (DEFAULT_PAGE_SIZE if page.after is not None else None)
+    rows = query.all() if limit is None else query.limit(limit + 1).all()
+    # Joined queries return rows whose first element is the entity
+    entities = [row[0] if isinstance(row, Row) else row for row in rows]
+    if page.fields:
+        for entity in entities:
+            _unload_to_none(entity)
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    return rows[:limit], getattr(entities[limit - 1], key.key)
+
+def render_page(items, next_cursor, page: PageParams, response: Response):
+    """Return the page, projected to the requested fields, with the next cursor header
+
+    `items` are response models so projected output is serialised exactly
+    like the full response.
+    """
+    headers = {NEXT_CURSOR_HEADER: str(next_cursor)} if next_cursor is not None else {}
+    if not page.fields:
+        response.headers.update(headers)
+        return items
+    include = set(page.fields)
+    content = [item.model_dump(mode="json", include=include) for item in items]
+    return JSONResponse(content=content, headers=headers)
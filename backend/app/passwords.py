@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# bcrypt cost; hashes made with any other cost are replaced on the next successful login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# Each API worker process (uvicorn/gunicorn --workers, read from WEB_CONCURRENCY)
+# runs its own pool, so by default the CPUs are shared out between them
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+PASSWORD_POOL_WORKERS = int(os.environ.get("PASSWORD_POOL_WORKERS", str(max((os.cpu_count() or 2) // WEB_CONCURRENCY, 1))))
+# Password operations allowed to wait for a worker; beyond this requests get a 503
+PASSWORD_QUEUE_LIMIT = int(os.environ.get("PASSWORD_QUEUE_LIMIT", "32"))
+PASSWORD_RETRY_AFTER_SECONDS = 1
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# Run in the worker processes
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed)
+
+class PasswordPool:
+    """Runs bcrypt in a bounded pool of worker processes
+
+    bcrypt is deliberately slow, so hashing in request handlers lets a burst
+    of logins occupy every thread of the API's threadpool. Here at most
+    `workers` operations run at once, up to `queue_limit` more wait, and
+    anything beyond that is rejected at once with a 503 and Retry-After
+    rather than queued behind the burst.
+    """
+    def __init__(self, workers: int = PASSWORD_POOL_WORKERS, queue_limit: int = PASSWORD_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.metrics = {"completed": 0, "failed": 0, "rejected": 0}
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_limit:
+                self.metrics["rejected"] += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many sign-ins in progress, please retry shortly",
+                    headers={"Retry-After": str(PASSWORD_RETRY_AFTER_SECONDS)},
+                )
+            if self._executor is None:
+                # Spawned, not forked: the API process has threads and open connections
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release(failed=True)
+            raise
+        future.add_done_callback(lambda done: self._release(failed=done.cancelled() or done.exception() is not None))
+        return future
+
+    def _release(self, failed: bool):
+        with self._lock:
+            self._in_flight -= 1
+            self.metrics["failed" if failed else "completed"] += 1
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(_hash, password))
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Check a password; the second item is a new hash when the stored one uses another cost"""
+        return await asyncio.wrap_future(self._submit(_verify_and_update, password, hashed))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.metrics, "in_flight": self._in_flight, "workers": self.workers, "queue_limit": self.queue_limit}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+password_pool = PasswordPool()
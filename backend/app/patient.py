@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends,HTTPException,status
+from fastapi import APIRouter, Depends,HTTPException,status,Response
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from db.database import SessionLocal
 from db.models import Patient
 from app.schemas import PatientResponse
+from app.pagination import PageParams, paginate, project, render_page
 
 router = APIRouter()
 
@@ -16,12 +17,14 @@ def get_db():
         db.close()
 
 @router.get("/", response_model=list[PatientResponse])
-def list_patients(db: Session = Depends(get_db)):
-    """Return a list of all patients"""
+def list_patients(response: Response, page: PageParams = Depends(), db: Session = Depends(get_db)):
+    """Return a page of patients ordered by id"""
+    page.validate_fields(PatientResponse)
     try:
-        patients = db.query(Patient).all()
-        return [
-            PatientResponse(
+        patients, next_cursor = paginate(project(db.query(Patient), Patient, page), Patient.id, page)
+        items = [
+            page.build(
+                PatientResponse,
                 id=patient.id,
                 first_name=patient.first_name or "Unknown",
                 last_name=patient.last_name or "Unknown",
@@ -32,6 +35,7 @@ def list_patients(db: Session = Depends(get_db)):
             )
             for patient in patients
         ]
+        return render_page(items, next_cursor, page, response)
     except Exception as e:
         print(f"Error fetching patients: {str(e)}")  # Log to console for debugging
         raise HTTPException(status_code=500, detail=f"Failed to fetch patients: {str(e)}")
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from sqlalchemy.orm import Session
+from db.models import Doctor, FeedbackCategory
+
+# How long cached reference data is trusted before it is reloaded; changes made
+# through another worker become visible here after at most this long
+REFCACHE_TTL_SECONDS = float(os.environ.get("REFCACHE_TTL_SECONDS", "300"))
+
+@dataclass(frozen=True)
+class CachedCategory:
+    id: int
+    name: str
+
+@dataclass(frozen=True)
+class CachedDoctor:
+    id: int
+    name: Optional[str]
+    specialty: Optional[str]
+    email: Optional[str]
+    is_active: Optional[bool]
+
+class ReferenceCache:
+    """In-process cache of the feedback categories and the doctor directory
+
+    Both tables are small and read on every feedback request, so each is kept
+    whole in memory as immutable snapshots and reloaded after `ttl` seconds
+    or when invalidated. Doctor writes on this worker invalidate the
+    directory; a doctor id that is not cached yet (created through another
+    worker) is looked up once and added, so new doctors are never rejected.
+    Queries run outside the lock, which only guards swapping the snapshots
+    in. A load that an invalidation overtook is returned to its caller but
+    not kept.
+    """
+    def __init__(self, ttl: float = REFCACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._categories: Optional[Dict[int, CachedCategory]] = None
+        self._categories_loaded_at = 0.0
+        self._categories_generation = 0
+        self._doctors: Optional[Dict[int, CachedDoctor]] = None
+        self._doctors_loaded_at = 0.0
+        self._doctors_generation = 0
+        self.metrics = {"hits": 0, "misses": 0, "reloads": 0, "invalidations": 0}
+
+    def _fresh(self, loaded_at: float) -> bool:
+        return time.monotonic() - loaded_at < self.ttl
+
+    def categories(self, db: Session) -> Dict[int, CachedCategory]:
+        with self._lock:
+            if self._categories is not None and self._fresh(self._categories_loaded_at):
+                self.metrics["hits"] += 1
+                return self._categories
+            self.metrics["misses"] += 1
+            generation = self._categories_generation
+        categories = {c.id: CachedCategory(id=c.id, name=c.name) for c in db.query(FeedbackCategory.id, FeedbackCategory.name)}
+        with self._lock:
+            self.metrics["reloads"] += 1
+            if self._categories_generation == generation:
+                self._categories = categories
+                self._categories_loaded_at = time.monotonic()
+        return categories
+
+    def category(self, db: Session, category_id: int) -> Optional[CachedCategory]:
+        return self.categories(db).get(category_id)
+
+    def doctor(self, db: Session, doctor_id: int) -> Optional[CachedDoctor]:
+        with self._lock:
+            doctors = self._doctors if self._doctors is not None and self._fresh(self._doctors_loaded_at) else None
+            if doctors is not None and doctor_id in doctors:
+                self.metrics["hits"] += 1
+                return doctors[doctor_id]
+            self.metrics["misses"] += 1
+            generation = self._doctors_generation
+        columns = (Doctor.id, Doctor.name, Doctor.specialty, Doctor.email, Doctor.is_active)
+        if doctors is None:
+            doctors = {
+                row.id: CachedDoctor(id=row.id, name=row.name, specialty=row.specialty, email=row.email, is_active=row.is_active)
+                for row in db.query(*columns)
+            }
+            with self._lock:
+                self.metrics["reloads"] += 1
+                if self._doctors_generation == generation:
+                    self._doctors = doctors
+                    self._doctors_loaded_at = time.monotonic()
+            return doctors.get(doctor_id)
+        row = db.query(*columns).filter(Doctor.id == doctor_id).first()
+        if row is None:
+            return None
+        cached = CachedDoctor(id=row.id, name=row.name, specialty=row.specialty, email=row.email, is_active=row.is_active)
+        with self._lock:
+            # Copy on write: readers may be holding the current snapshot
+            if self._doctors is not None and self._doctors_generation == generation:
+                self._doctors = {**self._doctors, doctor_id: cached}
+        return cached
+
+    def invalidate_doctors(self):
+        with self._lock:
+            self.metrics["invalidations"] += 1
+            self._doctors_generation += 1
+            self._doctors = None
+
+    def invalidate_categories(self):
+        with self._lock:
+            self.metrics["invalidations"] += 1
+            self._categories_generation += 1
+            self._categories = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_ratio": round(self.metrics["hits"] / lookups, 4) if lookups else None,
+                "categories_cached": len(self._categories) if self._categories is not None else 0,
+                "doctors_cached": len(self._doctors) if self._doctors is not None else 0,
+                "ttl_seconds": self.ttl,
+            }
+
+reference_cache = ReferenceCache()
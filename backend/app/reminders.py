@@ -1,23 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from datetime import date, datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from typing import List
-import os
+from typing import List, Optional
 from db.database import SessionLocal
 from db.models import MedicationReminder, Patient
 from app.schemas import MedicationReminderCreate, MedicationReminderResponse
-from twilio.rest import Client
+from app.outbox import enqueue, outbox_relay
+from app.scheduler import reminder_scheduler, reminder_message
+from app.appointment_reminders import fan_out_appointment_reminders
+from app.auth import get_current_user
 
 router = APIRouter()
 
-# Initialize Twilio client
-twilio_account_sid = os.environ.get("TWILIO_ACCOUNT_SID", "AC7364a7087d38dc46748517bf9baa2e03")
-twilio_auth_token = os.environ.get("TWILIO_AUTH_TOKEN", "c460ce484c965a4c20c532ec9acabfe1")
-twilio_phone_number = os.environ.get("TWILIO_PHONE_NUMBER", "+237678574116")  # Your Twilio phone number
-
-client = Client(twilio_account_sid, twilio_auth_token) if twilio_account_sid != "AC7364a7087d38dc46748517bf9baa2e03" else None
-
 def get_db():
     db = SessionLocal()
     try:
@@ -25,67 +21,87 @@ def get_db():
     finally:
         db.close()
 
-def send_sms_reminder(to_phone: str, message: str):
-    """Send SMS reminder using Twilio"""
-    try:
-        if client:
-            message = client.messages.create(
-                body=message,
-                from_=twilio_phone_number,
-                to=to_phone
-            )
-            print(f"Message sent with SID: {message.sid}")
-            return True
-        else:
-            print("Twilio client not configured. SMS not sent.")
-            return False
-    except Exception as e:
-        print(f"Failed to send SMS: {str(e)}")
-        return False
+def _reminder_response(reminder: MedicationReminder) -> MedicationReminderResponse:
+    return MedicationReminderResponse(
+        id=reminder.id,
+        patient_id=reminder.patient_id,
+        medication=reminder.medication,
+        time=reminder.time,
+        frequency=reminder.frequency,
+        is_active=reminder.is_active,
+        created_at=reminder.created_at.isoformat()
+    )
+
+def _replayed_reminder(db: Session, patient_id: int, idempotency_key: Optional[str]) -> Optional[MedicationReminder]:
+    """Return the reminder already created for this patient with this Idempotency-Key, if any"""
+    if not idempotency_key:
+        return None
+    return (
+        db.query(MedicationReminder)
+        .filter(MedicationReminder.patient_id == patient_id, MedicationReminder.idempotency_key == idempotency_key)
+        .first()
+    )
 
 @router.post("/", response_model=MedicationReminderResponse, status_code=status.HTTP_201_CREATED)
 async def create_reminder(
     reminder: MedicationReminderCreate, 
-    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Create a new medication reminder"""
+    """Create a new medication reminder
+    
+    Clients may send an Idempotency-Key header; retrying with the same key
+    for the same patient returns the reminder created by the first request
+    without a second SMS.
+    """
     try:
         # Check if patient exists
         patient = db.query(Patient).filter(Patient.id == reminder.patient_id).first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
+        previous = _replayed_reminder(db, reminder.patient_id, idempotency_key)
+        if previous:
+            return _reminder_response(previous)
+        
         # Create reminder
         new_reminder = MedicationReminder(
             patient_id=reminder.patient_id,
             medication=reminder.medication,
             time=reminder.time,
-            frequency=reminder.frequency
+            frequency=reminder.frequency,
+            idempotency_key=idempotency_key
         )
         
         db.add(new_reminder)
-        db.commit()
-        db.refresh(new_reminder)
+        db.flush()
         
-        # Send SMS reminder if phone number exists
+        # Queue the SMS in the same transaction as the reminder
         if patient.phone_number:
-            message = f"Reminder: Take your {reminder.medication} at {reminder.time} ({reminder.frequency}). - Douala General Hospital"
-            background_tasks.add_task(send_sms_reminder, patient.phone_number, message)
+            enqueue(
+                db,
+                idempotency_key=f"medication-reminder-created:{new_reminder.id}",
+                recipient=patient.phone_number,
+                body=reminder_message(reminder.medication, reminder.time, reminder.frequency),
+                reminder_id=new_reminder.id
+            )
         
-        return MedicationReminderResponse(
-            id=new_reminder.id,
-            patient_id=new_reminder.patient_id,
-            medication=new_reminder.medication,
-            time=new_reminder.time,
-            frequency=new_reminder.frequency,
-            is_active=new_reminder.is_active,
-            created_at=new_reminder.created_at.isoformat()
-        )
+        db.commit()
+        db.refresh(new_reminder)
+        reminder_scheduler.schedule(new_reminder)
+        outbox_relay.notify()
+        
+        return _reminder_response(new_reminder)
         
     except IntegrityError:
         db.rollback()
+        # A concurrent retry with the same Idempotency-Key won the race
+        previous = _replayed_reminder(db, reminder.patient_id, idempotency_key)
+        if previous:
+            return _reminder_response(previous)
         raise HTTPException(status_code=500, detail="Database error during reminder creation")
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         print(f"Error creating reminder: {str(e)}")
@@ -105,22 +121,29 @@ async def get_patient_reminders(patient_id: int, db: Session = Depends(get_db)):
             MedicationReminder.is_active == True
         ).all()
         
-        return [
-            MedicationReminderResponse(
-                id=reminder.id,
-                patient_id=reminder.patient_id,
-                medication=reminder.medication,
-                time=reminder.time,
-                frequency=reminder.frequency,
-                is_active=reminder.is_active,
-                created_at=reminder.created_at.isoformat()
-            )
-            for reminder in reminders
-        ]
+        return [_reminder_response(reminder) for reminder in reminders]
     except Exception as e:
         print(f"Error fetching reminders: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch reminders: {str(e)}")
 
+@router.post("/appointments/run", status_code=status.HTTP_200_OK)
+async def run_appointment_reminders_now(
+    day: Optional[date] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue appointment reminders for a day (tomorrow by default); safe to repeat"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can run the appointment reminder job")
+    day = day or date.today() + timedelta(days=1)
+    rendered = await run_in_threadpool(fan_out_appointment_reminders, day)
+    outbox_relay.notify()
+    return {"day": day.isoformat(), "rendered": rendered}
+
+@router.get("/dispatch-metrics", status_code=status.HTTP_200_OK)
+async def get_dispatch_metrics():
+    """Counters of the SMS relay in this worker, including sends saved by combining messages"""
+    return outbox_relay.metrics
+
 @router.delete("/{reminder_id}", status_code=status.HTTP_200_OK)
 async def delete_reminder(reminder_id: int, db: Session = Depends(get_db)):
     """Delete a medication reminder"""
@@ -132,6 +155,7 @@ async def delete_reminder(reminder_id: int, db: Session = Depends(get_db)):
         # Soft delete
         reminder.is_active = False
         db.commit()
+        reminder_scheduler.cancel(reminder_id)
         
         return {"detail": "Reminder successfully deleted"}
     except Exception as e:
@@ -0,0 +1,181 @@
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from db.models import Doctor, Feedback, RatingRollup
+from db.upsert import upsert_increment
+
+GRANULARITIES = ("day", "week", "month")
+# Daily buckets older than this many days are folded into week and month buckets
+ROLLUP_DAILY_RETENTION_DAYS = int(os.environ.get("ROLLUP_DAILY_RETENTION_DAYS", "92"))
+ROLLUP_COMPACT_INTERVAL_SECONDS = int(os.environ.get("ROLLUP_COMPACT_INTERVAL_SECONDS", "21600"))
+RATING_COUNTERS = ["feedback_count", "rating_sum", "rating_sum_sq"]
+
+def bucket_start(day: date, granularity: str) -> date:
+    """First day of the bucket containing `day` (weeks start on Monday)"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+def _rollup_row(granularity: str, start: date, doctor_id: int, category_id: int, count: int, total: int, total_sq: int) -> dict:
+    return {
+        "granularity": granularity,
+        "bucket_start": start,
+        "doctor_id": doctor_id,
+        "category_id": category_id,
+        "feedback_count": count,
+        "rating_sum": total,
+        "rating_sum_sq": total_sq,
+    }
+
+def record_ratings(db: Session, entries: Iterable[Tuple[int, int, int, datetime]]):
+    """Add (doctor_id, category_id, rating, created_at) feedback to the daily buckets
+
+    Call inside the transaction that inserts the feedback rows.
+    """
+    upsert_increment(
+        db,
+        RatingRollup,
+        [
+            _rollup_row("day", created_at.date(), doctor_id, category_id, 1, rating, rating * rating)
+            for doctor_id, category_id, rating, created_at in entries
+        ],
+        ["granularity", "bucket_start", "doctor_id", "category_id"],
+        RATING_COUNTERS,
+    )
+
+def compact_rollups(today: Optional[date] = None) -> int:
+    """Fold daily buckets older than the retention period into week and month buckets
+
+    Returns the number of daily buckets folded. The daily rows are locked
+    while they are folded, so feedback arriving for those days meanwhile
+    simply recreates a daily row that the next compaction picks up.
+    """
+    cutoff = (today or datetime.utcnow().date()) - timedelta(days=ROLLUP_DAILY_RETENTION_DAYS)
+    db = SessionLocal()
+    try:
+        days = (
+            db.query(RatingRollup)
+            .filter(RatingRollup.granularity == "day", RatingRollup.bucket_start < cutoff)
+            .with_for_update()
+            .all()
+        )
+        if not days:
+            db.commit()
+            return 0
+        for granularity in ("week", "month"):
+            upsert_increment(
+                db,
+                RatingRollup,
+                [
+                    _rollup_row(granularity, bucket_start(row.bucket_start, granularity), row.doctor_id, row.category_id,
+                                row.feedback_count, row.rating_sum, row.rating_sum_sq)
+                    for row in days
+                ],
+                ["granularity", "bucket_start", "doctor_id", "category_id"],
+                RATING_COUNTERS,
+            )
+        db.query(RatingRollup).filter(
+            RatingRollup.granularity == "day", RatingRollup.bucket_start < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return len(days)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def rebuild_rating_rollups(db: Session):
+    """Recompute the daily buckets from the feedback table (compaction folds them again)"""
+    db.query(RatingRollup).delete(synchronize_session=False)
+    day = func.date(Feedback.created_at)
+    rows = (
+        db.query(day, Feedback.doctor_id, Feedback.category_id, func.count(), func.sum(Feedback.rating), func.sum(Feedback.rating * Feedback.rating))
+        .filter(Feedback.doctor_id.isnot(None), Feedback.category_id.isnot(None), Feedback.rating.isnot(None), Feedback.created_at.isnot(None))
+        .group_by(day, Feedback.doctor_id, Feedback.category_id)
+    )
+    buckets = [
+        # SQLite returns date() as text
+        _rollup_row("day", date.fromisoformat(str(bucket)), doctor_id, category_id, count, total, total_sq)
+        for bucket, doctor_id, category_id, count, total, total_sq in rows
+    ]
+    if buckets:
+        db.execute(RatingRollup.__table__.insert(), buckets)
+
+def rating_timeseries(
+    db: Session,
+    granularity: str,
+    first: date,
+    last: date,
+    doctor_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    specialty: Optional[str] = None,
+) -> List[dict]:
+    """Rating count, mean and spread per bucket between `first` and `last`
+
+    Reads the buckets of the requested granularity plus the daily buckets not
+    yet compacted, summed over the selected doctors and categories in SQL,
+    so the work is proportional to the number of buckets, not of feedback.
+    Daily series only reach back as far as the daily retention.
+    """
+    sources = ["day"] if granularity == "day" else ["day", granularity]
+    query = (
+        db.query(
+            RatingRollup.granularity,
+            RatingRollup.bucket_start,
+            func.sum(RatingRollup.feedback_count),
+            func.sum(RatingRollup.rating_sum),
+            func.sum(RatingRollup.rating_sum_sq),
+        )
+        .filter(
+            RatingRollup.granularity.in_(sources),
+            RatingRollup.bucket_start >= bucket_start(first, granularity),
+            RatingRollup.bucket_start <= last,
+        )
+    )
+    if doctor_id:
+        query = query.filter(RatingRollup.doctor_id == doctor_id)
+    if category_id:
+        query = query.filter(RatingRollup.category_id == category_id)
+    if specialty:
+        query = query.filter(RatingRollup.doctor_id.in_(select(Doctor.id).where(Doctor.specialty.ilike(specialty))))
+
+    buckets: Dict[date, List[int]] = {}
+    for _, start, count, total, total_sq in query.group_by(RatingRollup.granularity, RatingRollup.bucket_start):
+        totals = buckets.setdefault(bucket_start(start, granularity), [0, 0, 0])
+        totals[0] += count or 0
+        totals[1] += total or 0
+        totals[2] += total_sq or 0
+
+    series = []
+    for start in sorted(buckets):
+        count, total, total_sq = buckets[start]
+        if not count:
+            continue
+        mean = total / count
+        series.append({
+            "bucket": start.isoformat(),
+            "count": count,
+            "averageRating": round(mean, 2),
+            "stdDev": round(max(total_sq / count - mean * mean, 0.0) ** 0.5, 2),
+        })
+    return series
+
+async def run_rollup_compaction():
+    """Compact the rating rollups every ROLLUP_COMPACT_INTERVAL_SECONDS"""
+    while True:
+        try:
+            folded = await asyncio.to_thread(compact_rollups)
+            if folded:
+                print(f"Folded {folded} daily rating buckets into weeks and months")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Rating rollup compaction failed: {str(e)}")
+        await asyncio.sleep(ROLLUP_COMPACT_INTERVAL_SECONDS)
@@ -0,0 +1,263 @@
+import asyncio
+import heapq
+import math
+import os
+import re
+import threading
+import time as clock
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, or_
+from db.database import SessionLocal
+from db.models import MedicationReminder, Patient
+from app.outbox import SMS_COALESCE_WINDOW_SECONDS, enqueue_many, outbox_relay
+
+# Maximum number of due reminders handled per dispatch round
+BATCH_SIZE = int(os.environ.get("REMINDER_BATCH_SIZE", "500"))
+# Rows fetched per round trip when reloading reminders at startup
+LOAD_CHUNK_SIZE = 1000
+# Longest the scheduler sleeps without re-checking the heap
+MAX_SLEEP_SECONDS = 60
+# Delay before retrying a batch whose dispatch failed
+RETRY_DELAY_SECONDS = 30
+# How often the scheduler picks up reminders created on other workers
+SYNC_INTERVAL_SECONDS = int(os.environ.get("REMINDER_SYNC_SECONDS", "15"))
+# How long ids skipped by a sync are looked for again, in case their transaction had not committed yet
+GAP_TIMEOUT_SECONDS = 600
+
+_COUNT_WORDS = {"once": 1, "twice": 2, "thrice": 3, "one": 1, "two": 2, "three": 3, "four": 4}
+_UNITS = {"h": timedelta(hours=1), "hr": timedelta(hours=1), "hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(days=7)}
+_COUNT = r"(one|two|three|four|\d+)"
+
+def reminder_interval(frequency: str) -> timedelta:
+    """Interpret a free-text frequency ("daily", "twice daily", "3 times a day", "every 8 hours", "every 2 days", "weekly", ...)
+
+    A number is only read as doses per day (or week) when followed by
+    "times"/"x" or directly by "daily"/"a day", so "take 2 tablets daily" is
+    daily. Anything that cannot be understood falls back to once a day.
+    """
+    text = (frequency or "").lower()
+    every = re.search(r"\bevery\s+(\d+\s*|other\s+)?(hour|hr|h|day|week)s?\b", text)
+    if every:
+        count = (every.group(1) or "1").strip()
+        count = 2 if count == "other" else int(count)
+        if count > 0:
+            return _UNITS[every.group(2)] * count
+    period = timedelta(days=7) if "week" in text else timedelta(days=1)
+    times = (
+        re.search(r"\b(once|twice|thrice)\b", text)
+        or re.search(_COUNT + r"\s*(?:times|x)\b", text)
+        or re.search(_COUNT + r"\s+(?:daily|a day|per day)\b", text)
+    )
+    if times:
+        count = _COUNT_WORDS.get(times.group(1)) or int(times.group(1))
+        if count > 0:
+            return period / count
+    return period
+
+def next_fire_time(reminder_time: str, frequency: str, anchor: datetime, after: datetime) -> Optional[datetime]:
+    """Return the first dose time strictly after `after`, or None for an invalid time
+
+    Doses start at `reminder_time` on the day the reminder was created and
+    repeat every `reminder_interval(frequency)`.
+    """
+    try:
+        at = datetime.strptime(reminder_time, "%H:%M").time()
+    except (TypeError, ValueError):
+        return None
+    first = datetime.combine(anchor.date(), at)
+    if first > after:
+        return first
+    interval = reminder_interval(frequency)
+    steps = math.floor((after - first) / interval) + 1
+    return first + steps * interval
+
+def reminder_message(medication: str, time: str, frequency: str) -> str:
+    return f"Reminder: Take your {medication} at {time} ({frequency}). - Douala General Hospital"
+
+class ReminderScheduler:
+    """Fires medication reminders at their dose times
+
+    The next fire time of every active reminder is kept in a min-heap of
+    (timestamp, reminder_id) pairs, so memory stays at one small tuple per
+    reminder. Cancelled or rescheduled reminders are dropped lazily when their
+    stale heap entry surfaces. The heap is rebuilt from medication_reminders
+    on startup, so nothing is lost across restarts, and reminders created on
+    other workers are picked up every SYNC_INTERVAL_SECONDS by id. Ids below
+    the highest seen that were missing (rolled back, or still uncommitted) are
+    looked for again until GAP_TIMEOUT_SECONDS. Reminders deleted elsewhere
+    are dropped when they come due, since dispatch only loads active ones.
+    """
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Dict[int, float] = {}
+        self._last_id = 0
+        self._gaps: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def _push(self, reminder_id: int, fire_at: datetime):
+        timestamp = fire_at.timestamp()
+        with self._lock:
+            self._scheduled[reminder_id] = timestamp
+            heapq.heappush(self._heap, (timestamp, reminder_id))
+            earliest = self._heap[0][1] == reminder_id
+        if earliest and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def schedule(self, reminder: MedicationReminder, after: Optional[datetime] = None):
+        """(Re)schedule a reminder at its next dose time"""
+        if not reminder.is_active:
+            self.cancel(reminder.id)
+            return
+        fire_at = next_fire_time(reminder.time, reminder.frequency, reminder.created_at or datetime.now(), after or datetime.now())
+        if fire_at is None:
+            print(f"Reminder {reminder.id} has an invalid time {reminder.time!r}; not scheduled")
+            return
+        self._push(reminder.id, fire_at)
+
+    def cancel(self, reminder_id: int):
+        with self._lock:
+            self._scheduled.pop(reminder_id, None)
+
+    def load(self):
+        """Rebuild the heap from all active reminders"""
+        now = datetime.now()
+        entries = []
+        db = SessionLocal()
+        try:
+            last_id = db.query(func.max(MedicationReminder.id)).scalar() or 0
+            rows = (
+                db.query(MedicationReminder.id, MedicationReminder.time, MedicationReminder.frequency, MedicationReminder.created_at)
+                .filter(MedicationReminder.is_active == True)
+                .yield_per(LOAD_CHUNK_SIZE)
+            )
+            for reminder_id, time, frequency, created_at in rows:
+                fire_at = next_fire_time(time, frequency, created_at or now, now)
+                if fire_at is not None:
+                    entries.append((fire_at.timestamp(), reminder_id))
+        finally:
+            db.close()
+        heapq.heapify(entries)
+        with self._lock:
+            self._heap = entries
+            self._scheduled = {reminder_id: timestamp for timestamp, reminder_id in entries}
+            self._last_id = last_id
+            self._gaps = {}
+        print(f"Reminder scheduler loaded {len(entries)} active reminders")
+
+    def sync(self):
+        """Schedule reminders committed since the last sync, wherever they were created"""
+        now = clock.monotonic()
+        with self._lock:
+            last_id = self._last_id
+            gaps = {reminder_id for reminder_id, since in self._gaps.items() if now - since < GAP_TIMEOUT_SECONDS}
+        condition = MedicationReminder.id > last_id
+        if gaps:
+            condition = or_(condition, MedicationReminder.id.in_(gaps))
+        db = SessionLocal()
+        try:
+            reminders = db.query(MedicationReminder).filter(condition).all()
+        finally:
+            db.close()
+        found = {reminder.id for reminder in reminders}
+        highest = max(found | {last_id})
+        with self._lock:
+            self._gaps = {reminder_id: since for reminder_id, since in self._gaps.items() if reminder_id in gaps and reminder_id not in found}
+            for reminder_id in range(last_id + 1, highest):
+                if reminder_id not in found:
+                    self._gaps[reminder_id] = now
+            self._last_id = highest
+        for reminder in reminders:
+            self.schedule(reminder)
+
+    def _pop_due(self, now: float) -> List[Tuple[float, int]]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < BATCH_SIZE:
+                timestamp, reminder_id = heapq.heappop(self._heap)
+                # Skip entries superseded by a reschedule or cancellation
+                if self._scheduled.get(reminder_id) == timestamp:
+                    del self._scheduled[reminder_id]
+                    due.append((timestamp, reminder_id))
+        return due
+
+    def _seconds_until_next(self, now: float) -> float:
+        with self._lock:
+            if not self._heap:
+                return MAX_SLEEP_SECONDS
+            return min(max(self._heap[0][0] - now, 0), MAX_SLEEP_SECONDS)
+
+    def _dispatch(self, due: List[Tuple[float, int]]):
+        """Queue one batch of due reminders for delivery and schedule their next doses
+
+        Doses are popped up to SMS_COALESCE_WINDOW_SECONDS early and held in
+        the outbox until their time, so the relay can send a patient's doses
+        that fall close together in one SMS.
+        """
+        fired_at = {reminder_id: datetime.fromtimestamp(timestamp) for timestamp, reminder_id in due}
+        available_at = {reminder_id: datetime.utcfromtimestamp(timestamp) for timestamp, reminder_id in due}
+        # The reminders are read again after the commit, to schedule their next doses
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            rows = (
+                db.query(MedicationReminder, Patient.phone_number)
+                .join(Patient, Patient.id == MedicationReminder.patient_id)
+                .filter(MedicationReminder.id.in_(fired_at), MedicationReminder.is_active == True)
+                .all()
+            )
+            # The key names the dose, so schedulers on several workers queue it only once
+            enqueue_many(db, [
+                {
+                    "idempotency_key": f"medication-reminder:{reminder.id}:{fired_at[reminder.id]:%Y%m%dT%H%M}",
+                    "recipient": phone_number,
+                    "body": reminder_message(reminder.medication, reminder.time, reminder.frequency),
+                    "reminder_id": reminder.id,
+                    "available_at": available_at[reminder.id],
+                }
+                for reminder, phone_number in rows if phone_number
+            ])
+            db.commit()
+        finally:
+            db.close()
+        outbox_relay.notify()
+        for reminder, _ in rows:
+            self.schedule(reminder, after=fired_at[reminder.id])
+
+    async def run(self):
+        """Sleep until the earliest reminder is due, then dispatch due reminders in batches"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        next_sync = clock.monotonic() + SYNC_INTERVAL_SECONDS
+        while True:
+            if clock.monotonic() >= next_sync:
+                try:
+                    await asyncio.to_thread(self.sync)
+                except Exception as e:
+                    print(f"Reminder sync failed: {str(e)}")
+                next_sync = clock.monotonic() + SYNC_INTERVAL_SECONDS
+            # Doses are queued ahead of their time, see _dispatch
+            due = self._pop_due(datetime.now().timestamp() + SMS_COALESCE_WINDOW_SECONDS)
+            if due:
+                try:
+                    await asyncio.to_thread(self._dispatch, due)
+                except Exception as e:
+                    print(f"Reminder dispatch failed: {str(e)}")
+                    # Retry the reminders that were not rescheduled before the failure
+                    retry_at = datetime.now() + timedelta(seconds=RETRY_DELAY_SECONDS)
+                    for _, reminder_id in due:
+                        if reminder_id not in self._scheduled:
+                            self._push(reminder_id, retry_at)
+                continue
+            self._wakeup.clear()
+            try:
+                timeout = min(self._seconds_until_next(datetime.now().timestamp() + SMS_COALESCE_WINDOW_SECONDS), max(next_sync - clock.monotonic(), 0))
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+reminder_scheduler = ReminderScheduler()
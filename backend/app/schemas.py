@@ -9,6 +9,8 @@ class DoctorResponse(DoctorBase):
     id: int
     specialty: str
     email: str
+    patientCount: int = 0
+    averageRating: float = 0.0
     class Config:
         from_attributes = True
 
@@ -0,0 +1,97 @@
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import Double, case, cast, column, func, literal_column, or_, select, table
+from sqlalchemy.orm import Session
+from db.models import Feedback, FEEDBACK_SEARCH_CONFIGS
+
+# Language codes accepted by the search endpoint and their text search configuration
+SEARCH_LANGUAGES = {"en": "english", "fr": "french"}
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+# ts_headline options: up to two fragments of 15-35 words around the matches
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords=35, MinWords=15, MaxFragments=2"
+SNIPPET_TOKENS = 24
+
+feedback_fts = table("feedback_fts", column("rowid"))
+
+def parse_cursor(after: Optional[str]) -> Optional[Tuple[float, int]]:
+    """Decode a "rank,id" search cursor (the X-Next-Cursor of the previous page)"""
+    if after is None:
+        return None
+    try:
+        rank, feedback_id = after.split(",")
+        return float(rank), int(feedback_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid search cursor")
+
+def _after(rank, cursor: Optional[Tuple[float, int]]):
+    """Rows that come after the cursor in (rank desc, id desc) order"""
+    last_rank, last_id = cursor
+    return or_(rank < last_rank, (rank == last_rank) & (Feedback.id < last_id))
+
+def _search_postgresql(db: Session, text: str, configs: List[str], conditions: list, limit: int, cursor):
+    # The document expression must match the index definitions in db/models.py
+    documents = [func.to_tsvector(config, func.coalesce(Feedback.comment, "")) for config in configs]
+    queries = [func.websearch_to_tsquery(config, text) for config in configs]
+    ranks = [func.ts_rank(document, query) for document, query in zip(documents, queries)]
+    # ts_rank is a float4; as a double it survives the cursor's round trip through
+    # Python exactly, so the page boundary compares equal to the row it came from
+    rank = cast(ranks[0] if len(ranks) == 1 else func.greatest(*ranks), Double)
+
+    # Rank and page on ids first, so headlines are only built for the rows returned
+    page = select(Feedback.id.label("id"), rank.label("rank"), *[r.label(f"rank_{i}") for i, r in enumerate(ranks)])
+    page = page.where(or_(*[document.op("@@")(query) for document, query in zip(documents, queries)]), *conditions)
+    if cursor:
+        page = page.where(_after(rank, cursor))
+    page = page.order_by(rank.desc(), Feedback.id.desc()).limit(limit + 1).subquery()
+
+    headlines = [
+        func.ts_headline(config, func.coalesce(Feedback.comment, ""), query, HEADLINE_OPTIONS)
+        for config, query in zip(configs, queries)
+    ]
+    headline = headlines[0]
+    if len(headlines) > 1:
+        headline = case((page.c.rank_0 >= page.c.rank_1, headlines[0]), else_=headlines[1])
+    return db.execute(
+        select(Feedback, page.c.rank, headline)
+        .join(page, page.c.id == Feedback.id)
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+    ).all()
+
+def _search_sqlite(db: Session, text: str, conditions: list, limit: int, cursor):
+    # Quote every term so FTS5 operators in user input are matched literally
+    terms = " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+    fts = literal_column("feedback_fts")
+    # bm25 is lower for better matches; negate it so higher is better as with ts_rank
+    rank = -func.bm25(fts)
+    query = (
+        select(Feedback, rank.label("rank"), func.snippet(fts, 0, HIGHLIGHT_START, HIGHLIGHT_STOP, "...", SNIPPET_TOKENS))
+        .select_from(feedback_fts)
+        .join(Feedback, Feedback.id == feedback_fts.c.rowid)
+        .where(fts.op("MATCH")(terms), *conditions)
+    )
+    if cursor:
+        query = query.where(_after(rank, cursor))
+    return db.execute(query.order_by(rank.desc(), Feedback.id.desc()).limit(limit + 1)).all()
+
+def search_feedback(db: Session, text: str, lang: Optional[str], conditions: list, limit: int, after: Optional[str]):
+    """Full-text search over feedback comments, best matches first
+
+    Returns ((feedback, rank, snippet) rows, next_cursor). `lang` restricts
+    stemming to one language; by default a comment matches if it matches in
+    any of them. SQLite only has the Porter (English) stemmer and ignores it.
+    """
+    text = text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Search text is required")
+    cursor = parse_cursor(after)
+    if db.get_bind().dialect.name == "postgresql":
+        configs = [SEARCH_LANGUAGES[lang]] if lang else list(FEEDBACK_SEARCH_CONFIGS)
+        rows = _search_postgresql(db, text, configs, conditions, limit, cursor)
+    else:
+        rows = _search_sqlite(db, text, conditions, limit, cursor)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    feedback, rank, _ = rows[-1]
+    return rows, f"{rank!r},{feedback.id}"
@@ -0,0 +1,214 @@
+import asyncio
+import os
+import re
+import unicodedata
+from datetime import datetime
+from typing import Iterable, List, Tuple
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from db.models import Feedback, FeedbackSentiment, PendingSentiment, PipelineWatermark
+from db.upsert import insert_ignore
+
+# Feedback rows scored per pass
+SENTIMENT_BATCH_SIZE = int(os.environ.get("SENTIMENT_BATCH_SIZE", "2000"))
+SENTIMENT_POLL_SECONDS = float(os.environ.get("SENTIMENT_POLL_SECONDS", "15"))
+KEYWORDS_PER_COMMENT = 5
+WATERMARK_NAME = "feedback_sentiment"
+
+# Word valences from -3 to 3, English and French (accents stripped)
+LEXICON = {
+    # English
+    "good": 2, "great": 3, "excellent": 3, "amazing": 3, "wonderful": 3, "perfect": 3, "best": 3,
+    "nice": 1.5, "kind": 2, "friendly": 2, "helpful": 2, "caring": 2, "polite": 2, "respectful": 2,
+    "attentive": 2, "gentle": 1.5, "professional": 2, "efficient": 2, "quick": 1.5, "fast": 1.5,
+    "clean": 1.5, "comfortable": 1.5, "organized": 1.5, "clear": 1, "thank": 1.5, "thanks": 1.5,
+    "satisfied": 2, "happy": 2, "love": 2.5, "recommend": 2,
+    "bad": -2, "poor": -2, "terrible": -3, "horrible": -3, "awful": -3, "worst": -3, "rude": -2.5,
+    "unprofessional": -2.5, "disrespectful": -2.5, "careless": -2, "unhelpful": -2, "ignored": -2,
+    "dirty": -2, "unclean": -2, "smelly": -2, "crowded": -1.5, "noisy": -1.5, "slow": -1.5,
+    "late": -1.5, "delay": -1.5, "delayed": -1.5, "waited": -1, "expensive": -1.5, "overpriced": -2,
+    "confusing": -1.5, "confused": -1, "mistake": -2, "error": -1.5, "wrong": -1.5, "problem": -1.5,
+    "complaint": -1.5, "pain": -1, "painful": -1.5, "disappointed": -2, "disappointing": -2,
+    "angry": -2, "hate": -2.5,
+    # French
+    "bon": 2, "bonne": 2, "bien": 1.5, "super": 2, "genial": 3, "parfait": 3, "formidable": 3,
+    "gentil": 2, "gentille": 2, "aimable": 2, "accueillant": 2, "accueillante": 2, "agreable": 2,
+    "attentionne": 2, "attentionnee": 2, "respectueux": 2, "professionnel": 2, "professionnelle": 2,
+    "competent": 2, "competente": 2, "efficace": 2, "rapide": 1.5, "propre": 1.5, "merci": 1.5,
+    "satisfait": 2, "satisfaite": 2, "content": 2, "contente": 2, "recommande": 2,
+    "mauvais": -2, "mauvaise": -2, "nul": -2.5, "nulle": -2.5, "pire": -3, "impoli": -2.5,
+    "impolie": -2.5, "desagreable": -2.5, "irrespectueux": -2.5, "mepris": -2.5, "incompetent": -2.5,
+    "incompetente": -2.5, "sale": -2, "bruyant": -1.5, "lent": -1.5, "lente": -1.5, "retard": -1.5,
+    "attente": -1, "cher": -1.5, "chere": -1.5, "erreur": -1.5, "probleme": -1.5, "douleur": -1,
+    "decu": -2, "decue": -2,
+}
+# A negator up to NEGATION_WINDOW words before a lexicon word flips and damps it
+NEGATORS = {
+    "not", "no", "never", "nothing", "none", "nobody", "without", "cannot", "hardly", "dont",
+    "don't", "didn't", "doesn't", "isn't", "wasn't", "aren't", "weren't", "won't", "wouldn't", "couldn't",
+    "pas", "jamais", "aucun", "aucune", "rien", "sans", "ni",
+}
+NEGATION_WINDOW = 3
+NEGATION_SCALAR = -0.74
+# A booster right before a lexicon word strengthens it
+BOOSTERS = {"very", "really", "extremely", "so", "too", "tres", "vraiment", "trop", "tellement"}
+BOOSTER_SCALAR = 1.3
+# Normalisation constant mapping summed valences to -1..1
+ALPHA = 15
+NEUTRAL_THRESHOLD = 0.05
+
+STOPWORDS = {
+    "the", "and", "was", "were", "are", "for", "with", "that", "this", "you", "your", "they", "them",
+    "their", "his", "her", "she", "him", "had", "has", "have", "but", "all", "our", "out", "not", "very",
+    "from", "there", "what", "when", "who", "which", "been", "would", "could", "should", "will", "just",
+    "about", "after", "before", "into", "than", "then", "also", "more", "most", "some", "any", "did",
+    "does", "its", "it's", "i'm", "can", "too", "because", "over", "only", "even", "much", "really",
+    "les", "des", "une", "est", "pour", "dans", "par", "sur", "avec", "qui", "que", "pas", "plus",
+    "mais", "tres", "sont", "etait", "ete", "avait", "nous", "vous", "ils", "elle", "elles", "leur",
+    "mon", "ton", "son", "mes", "tes", "ses", "aux", "cette", "ces", "tout", "tous", "fait", "comme",
+    "c'est", "j'ai", "n'est", "n'etait", "trop", "vraiment", "meme", "aussi", "encore",
+}
+
+# Words, plus clause punctuation kept as tokens because it ends a negation
+_TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?|[.,;:!?]")
+CLAUSE_BREAKS = set(".,;:!?")
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case words and clause punctuation, accents stripped so French matches the lexicon either way"""
+    text = unicodedata.normalize("NFKD", text.lower().replace("’", "'"))
+    return _TOKEN.findall("".join(c for c in text if not unicodedata.combining(c)))
+
+def label(score: float) -> str:
+    if score >= NEUTRAL_THRESHOLD:
+        return "positive"
+    if score <= -NEUTRAL_THRESHOLD:
+        return "negative"
+    return "neutral"
+
+def score_comments(texts: List[str]) -> Tuple[np.ndarray, List[List[str]]]:
+    """Score a batch of comments at once and extract their keywords
+
+    Every token of the batch goes into one flat array; valences, negation
+    windows and per-comment sums are computed with array operations rather
+    than word by word. Returns (scores in -1..1, keywords per comment).
+    """
+    tokens_per_text = [tokenize(text or "") for text in texts]
+    lengths = np.array([len(tokens) for tokens in tokens_per_text], dtype=np.int64)
+    scores = np.zeros(len(texts))
+    keywords: List[List[str]] = [[] for _ in texts]
+    if not lengths.sum():
+        return scores, keywords
+
+    # Map each distinct word of the batch to an id, then look up per-word features once
+    terms, term_ids = np.unique(np.array([t for tokens in tokens_per_text for t in tokens]), return_inverse=True)
+    valence = np.array([LEXICON.get(term, 0.0) for term in terms])[term_ids]
+    negator = np.array([term in NEGATORS for term in terms])[term_ids]
+    clause_break = np.array([term in CLAUSE_BREAKS for term in terms])[term_ids]
+    booster = np.array([term in BOOSTERS for term in terms])[term_ids]
+    candidate = np.array([len(term) >= 3 and term not in STOPWORDS and term not in NEGATORS for term in terms])[term_ids]
+
+    text_index = np.repeat(np.arange(len(texts)), lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[text_index]
+    positions = np.arange(len(text_index))
+
+    # Negators among the previous NEGATION_WINDOW words of the same comment and clause
+    negators_before = np.concatenate(([0], np.cumsum(negator)))
+    clause_start = np.maximum.accumulate(np.where(clause_break, positions + 1, 0))
+    window_start = np.maximum(np.maximum(positions - NEGATION_WINDOW, starts), clause_start)
+    negated = negators_before[positions] - negators_before[window_start] > 0
+    boosted = np.zeros_like(booster)
+    boosted[1:] = booster[:-1]
+    boosted &= positions > starts
+
+    weighted = valence * np.where(negated, NEGATION_SCALAR, 1.0) * np.where(boosted, BOOSTER_SCALAR, 1.0)
+    totals = np.bincount(text_index, weights=weighted, minlength=len(texts))
+    scores = totals / np.sqrt(totals * totals + ALPHA)
+
+    # Keywords: each comment's most frequent candidate words, earliest first on ties
+    pair_keys = text_index[candidate] * len(terms) + term_ids[candidate]
+    if len(pair_keys):
+        pairs, first_seen, counts = np.unique(pair_keys, return_index=True, return_counts=True)
+        pair_text, pair_term = pairs // len(terms), pairs % len(terms)
+        order = np.lexsort((first_seen, -counts, pair_text))
+        pair_text, pair_term = pair_text[order], pair_term[order]
+        group_start = np.searchsorted(pair_text, pair_text, side="left")
+        keep = np.arange(len(pair_text)) - group_start < KEYWORDS_PER_COMMENT
+        for index, term in zip(pair_text[keep], pair_term[keep]):
+            keywords[index].append(str(terms[term]))
+    return scores, keywords
+
+def queue_comments(db: Session, feedback_ids: Iterable[int]):
+    """Queue feedback for scoring in the caller's transaction"""
+    rows = [{"feedback_id": feedback_id} for feedback_id in feedback_ids]
+    if rows:
+        db.execute(insert(PendingSentiment), rows)
+
+def process_batch(batch_size: int = SENTIMENT_BATCH_SIZE) -> int:
+    """Score the next batch of queued feedback and return how many rows were scored
+
+    Feedback routes queue each new row in pending_sentiment in the
+    feedback's own transaction, so rows are scored whatever their id order,
+    commit order or created_at. The watermark row is locked with SKIP
+    LOCKED, so when several workers run the pipeline only one of them
+    processes a given batch; its last_id only records progress.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        insert_ignore(db, PipelineWatermark, [{"name": WATERMARK_NAME, "last_id": 0, "updated_at": now}], ["name"])
+        watermark = (
+            db.query(PipelineWatermark)
+            .filter(PipelineWatermark.name == WATERMARK_NAME)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if watermark is None:
+            db.rollback()
+            return 0
+        rows = (
+            db.query(PendingSentiment.feedback_id, Feedback.comment)
+            .join(Feedback, Feedback.id == PendingSentiment.feedback_id)
+            .order_by(PendingSentiment.feedback_id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            db.commit()
+            return 0
+        scores, keywords = score_comments([comment for _, comment in rows])
+        insert_ignore(db, FeedbackSentiment, [
+            {
+                "feedback_id": feedback_id,
+                "score": round(float(score), 4),
+                "label": label(score),
+                "keywords": ",".join(words),
+                "scored_at": now,
+            }
+            for (feedback_id, _), score, words in zip(rows, scores, keywords)
+        ], ["feedback_id"])
+        db.query(PendingSentiment).filter(
+            PendingSentiment.feedback_id.in_([row.feedback_id for row in rows])
+        ).delete(synchronize_session=False)
+        watermark.last_id = rows[-1].feedback_id
+        watermark.updated_at = now
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_sentiment_pipeline():
+    """Score new feedback in the background, draining backlogs one batch after another"""
+    while True:
+        try:
+            if await asyncio.to_thread(process_batch) >= SENTIMENT_BATCH_SIZE:
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Sentiment pipeline error: {str(e)}")
+        await asyncio.sleep(SENTIMENT_POLL_SECONDS)
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, List, Optional
+from twilio.base.exceptions import TwilioRestException
+from twilio.rest import Client
+
+# Twilio settings
+twilio_account_sid = os.environ.get("TWILIO_ACCOUNT_SID", "AC7364a7087d38dc46748517bf9baa2e03")
+twilio_auth_token = os.environ.get("TWILIO_AUTH_TOKEN", "c460ce484c965a4c20c532ec9acabfe1")
+twilio_phone_number = os.environ.get("TWILIO_PHONE_NUMBER", "+237678574116")  # Your Twilio phone number
+twilio_configured = twilio_account_sid != "AC7364a7087d38dc46748517bf9baa2e03"
+
+# Dispatch settings
+SMS_TRANSPORT = os.environ.get("SMS_TRANSPORT", "twilio" if twilio_configured else "fake")
+SMS_FILE_PATH = os.environ.get("SMS_FILE_PATH", "sms_outbox.jsonl")
+SMS_WORKERS = int(os.environ.get("SMS_WORKERS", "8"))
+SMS_QUEUE_SIZE = int(os.environ.get("SMS_QUEUE_SIZE", "10000"))
+SMS_RATE_PER_SECOND = float(os.environ.get("SMS_RATE_PER_SECOND", "10"))
+SMS_BURST = int(os.environ.get("SMS_BURST", "10"))
+SMS_MAX_ATTEMPTS = int(os.environ.get("SMS_MAX_ATTEMPTS", "5"))
+SMS_BACKOFF_BASE_SECONDS = float(os.environ.get("SMS_BACKOFF_BASE_SECONDS", "1"))
+SMS_BACKOFF_MAX_SECONDS = float(os.environ.get("SMS_BACKOFF_MAX_SECONDS", "60"))
+
+class PermanentSmsError(Exception):
+    """A delivery failure that retrying will not fix (bad number, rejected body, ...)"""
+
+@dataclass
+class SmsMessage:
+    to: str
+    body: str
+    reminder_id: Optional[int] = None
+
+@dataclass
+class DeliveryResult:
+    message: SmsMessage
+    delivered: bool
+    attempts: int
+    provider_id: Optional[str] = None
+    error: Optional[str] = None
+    finished_at: datetime = field(default_factory=datetime.utcnow)
+
+# ---------------------- Message composition ----------------------
+
+SIGNATURE = " - Douala General Hospital"
+# GSM 03.38 basic characters; anything else forces UCS-2 encoding
+GSM7_CHARS = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# Characters sent as an escape sequence, costing two GSM-7 units
+GSM7_EXTENDED_CHARS = set("^{}\\[~]|€")
+
+def _char_units(text: str) -> tuple:
+    """Encoding cost of every character, plus the single and per-part segment sizes"""
+    if all(c in GSM7_CHARS or c in GSM7_EXTENDED_CHARS for c in text):
+        return [2 if c in GSM7_EXTENDED_CHARS else 1 for c in text], 160, 153
+    return [1] * len(text), 70, 67
+
+def sms_segments(text: str) -> int:
+    """Number of SMS segments the provider will bill for `text`"""
+    units, single, multipart = _char_units(text)
+    total = sum(units)
+    return 1 if total <= single else math.ceil(total / multipart)
+
+def _split_at_segments(text: str, max_segments: int) -> List[str]:
+    """Cut a text too long for one message into pieces of exactly max_segments segments"""
+    units, single, multipart = _char_units(text)
+    capacity = single if max_segments == 1 else multipart * max_segments
+    pieces, start, used = [], 0, 0
+    for index, cost in enumerate(units):
+        if used + cost > capacity:
+            pieces.append(text[start:index])
+            start, used = index, 0
+        used += cost
+    pieces.append(text[start:])
+    return pieces
+
+def compose_messages(bodies: List[str], max_segments: int) -> List[tuple]:
+    """Pack the bodies for one recipient into as few SMS as possible
+
+    Returns (text, indexes) pairs, where indexes are the positions in
+    `bodies` carried by that SMS. Bodies are combined one per line under a
+    single signature as long as the result stays within max_segments; a body
+    that alone is too long is split at segment boundaries.
+    """
+    def render(indexes):
+        if len(indexes) == 1:
+            return bodies[indexes[0]]
+        lines = [bodies[i][:-len(SIGNATURE)] if bodies[i].endswith(SIGNATURE) else bodies[i] for i in indexes]
+        return "\n".join(lines) + "\n" + SIGNATURE.strip()
+
+    messages, current = [], []
+    for index, body in enumerate(bodies):
+        if current and sms_segments(render(current + [index])) <= max_segments:
+            current.append(index)
+            continue
+        if current:
+            messages.append((render(current), current))
+            current = []
+        if sms_segments(body) <= max_segments:
+            current = [index]
+        else:
+            messages.extend((piece, [index]) for piece in _split_at_segments(body, max_segments))
+    if current:
+        messages.append((render(current), current))
+    return messages
+
+# ---------------------- Transports ----------------------
+
+class TwilioTransport:
+    name = "twilio"
+
+    def __init__(self):
+        self.client = Client(twilio_account_sid, twilio_auth_token)
+
+    async def send(self, to: str, body: str) -> str:
+        try:
+            message = await asyncio.to_thread(
+                self.client.messages.create, body=body, from_=twilio_phone_number, to=to
+            )
+        except TwilioRestException as e:
+            # Throttling and server errors are worth retrying, other client errors are not
+            if e.status == 429 or e.status >= 500:
+                raise
+            raise PermanentSmsError(str(e))
+        return message.sid
+
+class FileTransport:
+    """Appends every message as a JSON line to a local file"""
+    name = "file"
+
+    def __init__(self, path: str = SMS_FILE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def _write(self, to: str, body: str) -> str:
+        with self._lock:
+            self._sequence += 1
+            message_id = f"file-{self._sequence}"
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"id": message_id, "to": to, "body": body, "sent_at": datetime.utcnow().isoformat()}) + "\n")
+        return message_id
+
+    async def send(self, to: str, body: str) -> str:
+        return await asyncio.to_thread(self._write, to, body)
+
+class FakeTransport:
+    """Keeps messages in memory, with optional simulated latency and failures, for offline benchmarks"""
+    name = "fake"
+
+    def __init__(self, latency_seconds: float = 0.0, failure_rate: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.sent: List[SmsMessage] = []
+
+    async def send(self, to: str, body: str) -> str:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError("Simulated transport failure")
+        self.sent.append(SmsMessage(to=to, body=body))
+        return f"fake-{len(self.sent)}"
+
+def create_transport(name: str = SMS_TRANSPORT):
+    if name == "twilio":
+        return TwilioTransport()
+    if name == "file":
+        return FileTransport()
+    if name == "fake":
+        return FakeTransport()
+    raise ValueError(f"Unknown SMS transport: {name}")
+
+# ---------------------- Dispatcher ----------------------
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (1-based) failed attempt"""
+    return random.uniform(0, min(SMS_BACKOFF_MAX_SECONDS, SMS_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+
+class SmsDispatcher:
+    """Bounded pool of async workers delivering SMS through a pluggable transport
+
+    Messages wait in a bounded queue (submit blocks when it is full), every
+    attempt takes a token from the transport's rate limiter, and transient
+    failures are retried with jittered exponential backoff. Each message's
+    DeliveryResult resolves the future returned by submit and is passed to
+    `on_result` if one is given.
+    """
+    def __init__(
+        self,
+        transport=None,
+        workers: int = SMS_WORKERS,
+        queue_size: int = SMS_QUEUE_SIZE,
+        rate_per_second: float = SMS_RATE_PER_SECOND,
+        burst: int = SMS_BURST,
+        max_attempts: int = SMS_MAX_ATTEMPTS,
+        on_result: Optional[Callable[[DeliveryResult], None]] = None,
+    ):
+        self.transport = transport
+        self.workers = workers
+        self.queue_size = queue_size
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.on_result = on_result
+        self._queue: Optional[asyncio.Queue] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        if self.transport is None:
+            self.transport = create_transport()
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._bucket = TokenBucket(self.rate_per_second, self.burst)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Give queued messages up to `timeout` seconds to go out, then stop the workers"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"SMS dispatcher stopped with {self._queue.qsize()} messages still queued")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def submit(self, message: SmsMessage) -> "asyncio.Future[DeliveryResult]":
+        if self._queue is None:
+            raise RuntimeError("SMS dispatcher is not running")
+        future = self._loop.create_future()
+        await self._queue.put((message, future))
+        return future
+
+    def submit_threadsafe(self, message: SmsMessage, timeout: Optional[float] = None):
+        """Queue a message from a worker thread, blocking while the queue is full"""
+        if self._loop is None:
+            raise RuntimeError("SMS dispatcher is not running")
+        return asyncio.run_coroutine_threadsafe(self.submit(message), self._loop).result(timeout)
+
+    async def _deliver(self, message: SmsMessage) -> DeliveryResult:
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            await self._bucket.acquire()
+            try:
+                provider_id = await self.transport.send(message.to, message.body)
+                return DeliveryResult(message=message, delivered=True, attempts=attempt, provider_id=provider_id)
+            except PermanentSmsError as e:
+                return DeliveryResult(message=message, delivered=False, attempts=attempt, error=str(e))
+            except Exception as e:
+                error = str(e)
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(backoff_delay(attempt))
+        return DeliveryResult(message=message, delivered=False, attempts=self.max_attempts, error=error)
+
+    async def _worker(self):
+        while True:
+            message, future = await self._queue.get()
+            try:
+                result = await self._deliver(message)
+                if not result.delivered:
+                    print(f"SMS to {message.to} failed after {result.attempts} attempts: {result.error}")
+                if self.on_result:
+                    await asyncio.to_thread(self.on_result, result)
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"SMS worker error: {str(e)}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+sms_dispatcher = SmsDispatcher()
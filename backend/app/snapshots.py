@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+from fastapi import Response
+from sqlalchemy.orm import Session
+from db.database import SessionLocal
+from db.models import StatisticsSnapshot
+from db.upsert import upsert
+
+# A snapshot older than this is served once more while it is recomputed in the background
+STATS_SNAPSHOT_TTL_SECONDS = float(os.environ.get("STATS_SNAPSHOT_TTL_SECONDS", "60"))
+# Feedback, appointment and registration writes on this worker that make snapshots stale early
+STATS_SNAPSHOT_WRITE_THRESHOLD = int(os.environ.get("STATS_SNAPSHOT_WRITE_THRESHOLD", "500"))
+GENERATED_AT_HEADER = "X-Generated-At"
+
+@dataclass(frozen=True)
+class Snapshot:
+    payload: Any
+    generated_at: datetime
+    # Value of the write counter when the payload was computed
+    writes: int
+
+class StatisticsSnapshots:
+    """Serves dashboard statistics from precomputed snapshots
+
+    Each registered payload is computed by a background refresher, stored
+    in statistics_snapshots and kept in memory, so a request costs a dict
+    lookup whatever the size of the tables. A stale snapshot (older than
+    the TTL, or followed by enough writes) is still served, with its
+    X-Generated-At header, and wakes the refresher. Workers share their
+    results through the table: a worker adopts a fresh row written by
+    another one instead of recomputing it.
+    """
+    def __init__(self, ttl: float = STATS_SNAPSHOT_TTL_SECONDS, write_threshold: int = STATS_SNAPSHOT_WRITE_THRESHOLD):
+        self.ttl = ttl
+        self.write_threshold = write_threshold
+        self._computers: Dict[str, Callable[[Session], Any]] = {}
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def register(self, name: str):
+        """Decorator registering a function computing a JSON-serialisable payload from a session"""
+        def decorator(compute: Callable[[Session], Any]):
+            self._computers[name] = compute
+            return compute
+        return decorator
+
+    def name_of(self, compute: Callable[[Session], Any]) -> str:
+        """Return the name a registered function's snapshot is stored under"""
+        return next(name for name, registered in self._computers.items() if registered is compute)
+
+    def record_writes(self, count: int = 1):
+        with self._lock:
+            self._writes += count
+
+    def _stale(self, snapshot: Snapshot, now: datetime) -> bool:
+        return (
+            (now - snapshot.generated_at).total_seconds() >= self.ttl
+            or self._writes - snapshot.writes >= self.write_threshold
+        )
+
+    def _store(self, name: str, payload: Any, generated_at: datetime, writes: int) -> Snapshot:
+        snapshot = Snapshot(payload=payload, generated_at=generated_at, writes=writes)
+        with self._lock:
+            current = self._snapshots.get(name)
+            if current is None or current.generated_at <= generated_at:
+                self._snapshots[name] = snapshot
+        return snapshot
+
+    def _compute(self, db: Session, name: str) -> Snapshot:
+        writes = self._writes
+        generated_at = datetime.utcnow()
+        payload = self._computers[name](db)
+        # Round-trip through JSON so served payloads look the same fresh or reloaded
+        text = json.dumps(payload)
+        upsert(db, StatisticsSnapshot, [{"name": name, "payload": text, "generated_at": generated_at}], ["name"])
+        db.commit()
+        return self._store(name, json.loads(text), generated_at, writes)
+
+    def refresh(self, db: Session, names=None, force: bool = False) -> int:
+        """Recompute the stale snapshots (all of them with force) and return how many were computed"""
+        now = datetime.utcnow()
+        names = list(self._computers) if names is None else list(names)
+        stored = {
+            row.name: row
+            for row in db.query(StatisticsSnapshot).filter(StatisticsSnapshot.name.in_(names))
+        }
+        computed = 0
+        for name in names:
+            snapshot = self._snapshots.get(name)
+            if not force and snapshot is not None and not self._stale(snapshot, now):
+                continue
+            row = stored.get(name)
+            if (
+                not force
+                and row is not None
+                and (snapshot is None or row.generated_at > snapshot.generated_at)
+                and (now - row.generated_at).total_seconds() < self.ttl
+                and (snapshot is None or self._writes - snapshot.writes < self.write_threshold)
+            ):
+                # Another worker refreshed it recently
+                self._store(name, json.loads(row.payload), row.generated_at, self._writes)
+                continue
+            try:
+                self._compute(db, name)
+                computed += 1
+            except Exception as e:
+                db.rollback()
+                print(f"Failed to refresh statistics snapshot {name}: {str(e)}")
+        return computed
+
+    def _refresh_all(self) -> int:
+        # One refresh at a time per worker; requests arriving meanwhile keep the stale payload
+        if not self._refreshing.acquire(blocking=False):
+            return 0
+        db = SessionLocal()
+        try:
+            return self.refresh(db)
+        finally:
+            db.close()
+            self._refreshing.release()
+
+    def get(self, name: str, db: Session) -> Snapshot:
+        """Return the current snapshot of `name`, asking for a refresh when it is stale"""
+        snapshot = self._snapshots.get(name)
+        if snapshot is None:
+            # Cold start: the stored snapshot if there is one, computed here otherwise
+            row = db.get(StatisticsSnapshot, name)
+            if row is not None:
+                snapshot = self._store(name, json.loads(row.payload), row.generated_at, self._writes)
+            else:
+                snapshot = self._compute(db, name)
+        if self._stale(snapshot, datetime.utcnow()):
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            elif self._refreshing.acquire(blocking=False):
+                # No background refresher on this worker: refresh in the request
+                try:
+                    snapshot = self._compute(db, name)
+                finally:
+                    self._refreshing.release()
+        return snapshot
+
+    def serve(self, name: str, db: Session, response: Response):
+        """Return the snapshot payload of `name`, setting the X-Generated-At header"""
+        snapshot = self.get(name, db)
+        response.headers[GENERATED_AT_HEADER] = snapshot.generated_at.isoformat() + "Z"
+        return snapshot.payload
+
+    async def run(self):
+        """Refresh stale snapshots every TTL, or as soon as a request finds one stale"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self._refresh_all)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Statistics snapshot refresher error: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.ttl)
+            except asyncio.TimeoutError:
+                pass
+
+statistics_snapshots = StatisticsSnapshots()
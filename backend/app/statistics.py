@@ -1,13 +1,20 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from db.database import get_db
-from db.models import Doctor, Patient, Appointment, Feedback
-from typing import List, Dict
+from db.models import Doctor, DoctorAggregate, Patient, Appointment, Feedback, FeedbackCategory, FeedbackSentiment, RatingAlert
+from typing import List, Dict, Optional
 from pydantic import BaseModel
-from sqlalchemy import func
+from sqlalchemy import case, func
+from datetime import date, datetime, timedelta
+from app.rollups import rating_timeseries
+from app.activity import counter_totals, monthly_admissions, period_deltas
+from app.auth import get_current_user
+from app.snapshots import statistics_snapshots
 
 router = APIRouter(prefix="/statistics", tags=["Statistics"])
 
+ADMISSION_MONTHS = 7
+
 class DepartmentStats(BaseModel):
     name: str
     avgRating: float
@@ -36,37 +43,98 @@ class PatientAdmissionsData(BaseModel):
     emergency: int
     scheduled: int
 
+class RatingPoint(BaseModel):
+    bucket: str
+    count: int
+    averageRating: float
+    stdDev: float
+
+class RatingAlertStats(BaseModel):
+    id: int
+    doctorId: int
+    doctorName: Optional[str]
+    categoryId: Optional[int]
+    categoryName: Optional[str]
+    status: str
+    baselineRating: float
+    recentRating: float
+    detectedAt: str
+    updatedAt: Optional[str]
+    closedAt: Optional[str]
+
+class SentimentStats(BaseModel):
+    doctorId: Optional[int]
+    doctorName: Optional[str]
+    categoryId: Optional[int]
+    categoryName: Optional[str]
+    feedbackCount: int
+    averageScore: float
+    positive: int
+    neutral: int
+    negative: int
+
 @router.get("/departments", response_model=List[DepartmentStats])
-def get_department_stats(db: Session = Depends(get_db)):
+def get_department_stats(response: Response, db: Session = Depends(get_db)):
     """Get department performance statistics"""
-    # Get all doctors grouped by specialty
-    specialties = db.query(Doctor.specialty, func.count(Doctor.id)).group_by(Doctor.specialty).all()
+    return statistics_snapshots.serve("departments", db, response)
+
+@statistics_snapshots.register("departments")
+def compute_department_stats(db: Session):
+    # We don't have a departments table, so each specialty is a department.
+    # One statement however many there are: doctor counts and ratings (from
+    # the per-doctor aggregates) and distinct appointment patients are each
+    # grouped by specialty once, then joined on the specialty.
+    doctors = (
+        db.query(
+            Doctor.specialty.label("specialty"),
+            func.count(Doctor.id).label("doctors"),
+            func.sum(DoctorAggregate.feedback_count).label("feedback_count"),
+            func.sum(DoctorAggregate.rating_sum).label("rating_sum")
+        )
+        .outerjoin(DoctorAggregate, DoctorAggregate.doctor_id == Doctor.id)
+        .group_by(Doctor.specialty)
+        .cte("department_doctors")
+    )
+    patients = (
+        db.query(
+            Doctor.specialty.label("specialty"),
+            func.count(Appointment.patient_id.distinct()).label("patients")
+        )
+        .join(Doctor, Doctor.id == Appointment.doctor_id)
+        .group_by(Doctor.specialty)
+        .cte("department_patients")
+    )
+    rows = (
+        db.query(doctors.c.specialty, doctors.c.doctors, doctors.c.feedback_count, doctors.c.rating_sum, patients.c.patients)
+        .outerjoin(patients, patients.c.specialty.is_not_distinct_from(doctors.c.specialty))
+        .order_by(doctors.c.specialty)
+        .all()
+    )
     
-    # For now, we'll create mock data based on specialties since we don't have a departments table
     departments = []
-    for specialty, count in specialties:
-        # Get average rating for doctors in this specialty from feedback
-        avg_rating = db.query(func.avg(Feedback.rating)).join(Doctor).filter(Doctor.specialty == specialty).scalar()
-        if avg_rating is None:
-            avg_rating = 0.0
-        else:
-            avg_rating = float(avg_rating)
-        
-        # Get number of patients who had appointments with doctors in this specialty
-        patient_count = db.query(func.count(Appointment.patient_id.distinct())).join(Doctor).filter(Doctor.specialty == specialty).scalar()
-        
+    for specialty, count, feedback_count, rating_sum, patient_count in rows:
+        avg_rating = float(rating_sum) / feedback_count if feedback_count else 0.0
         departments.append({
             "name": specialty,
             "avgRating": round(avg_rating, 1),
-            "patients": patient_count,
+            "patients": patient_count or 0,
             "doctors": count
         })
     
     return departments
 
+def _relative_change(current: float, previous: float):
+    """Change from the previous period as "+12.5%" and its trend (no change without a previous value)"""
+    change = (current - previous) / previous * 100 if previous else 0.0
+    return f"{change:+.1f}%", "up" if change >= 0 else "down"
+
 @router.get("/hospital", response_model=List[HospitalStats])
-def get_hospital_stats(db: Session = Depends(get_db)):
+def get_hospital_stats(response: Response, db: Session = Depends(get_db)):
     """Get overall hospital statistics"""
+    return statistics_snapshots.serve("hospital", db, response)
+
+@statistics_snapshots.register("hospital")
+def compute_hospital_stats(db: Session):
     # Get total patients
     total_patients = db.query(func.count(Patient.id)).scalar()
     
@@ -80,12 +148,19 @@ def get_hospital_stats(db: Session = Depends(get_db)):
     else:
         avg_rating = float(avg_rating)
     
+    # Last 30 days against the 30 days before, from the incremental counters
+    deltas = period_deltas(db, datetime.utcnow().date())
+    patients_change, patients_trend = _relative_change(*deltas["patients"])
+    appointments_change, appointments_trend = _relative_change(*deltas["appointments"])
+    satisfaction_now, satisfaction_before = deltas["satisfaction"]
+    satisfaction_delta = satisfaction_now - satisfaction_before if satisfaction_now and satisfaction_before else 0.0
+    
     stats = [
         {
             "title": "Total Patients",
             "value": f"{total_patients:,}",
-            "change": "+0%",
-            "trend": "up",
+            "change": patients_change,
+            "trend": patients_trend,
             "icon": {
                 "path": "M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z",
                 "bgColor": "bg-blue-500"
@@ -94,8 +169,8 @@ def get_hospital_stats(db: Session = Depends(get_db)):
         {
             "title": "Appointments",
             "value": f"{total_appointments:,}",
-            "change": "+0%",
-            "trend": "up",
+            "change": appointments_change,
+            "trend": appointments_trend,
             "icon": {
                 "path": "M8 7V3m8 4V3m-9 8h10M5 21h14a2 2 0 002-2V7a2 2 0 00-2-2H5a2 2 0 00-2 2v12a2 2 0 002 2z",
                 "bgColor": "bg-green-500"
@@ -114,8 +189,8 @@ def get_hospital_stats(db: Session = Depends(get_db)):
         {
             "title": "Patient Satisfaction",
             "value": f"{round(avg_rating * 20, 1)}%",  # Convert 5-point scale to percentage
-            "change": "+0%",
-            "trend": "up",
+            "change": f"{satisfaction_delta:+.1f}%",  # percentage points
+            "trend": "up" if satisfaction_delta >= 0 else "down",
             "icon": {
                 "path": "M14.828 14.828a4 4 0 01-5.656 0M9 10h.01M15 10h.01M21 12a9 9 0 11-18 0 9 9 0 0118 0z",
                 "bgColor": "bg-indigo-500"
@@ -126,24 +201,40 @@ def get_hospital_stats(db: Session = Depends(get_db)):
     return stats
 
 @router.get("/doctors", response_model=DoctorStats)
-def get_doctor_stats(db: Session = Depends(get_db)):
+def get_doctor_stats(response: Response, db: Session = Depends(get_db)):
     """Get doctor statistics"""
-    # Get total doctors
-    total_doctors = db.query(func.count(Doctor.id)).scalar()
-    
-    # Get average rating from feedback
-    avg_rating = db.query(func.avg(Feedback.rating)).scalar()
-    if avg_rating is None:
-        avg_rating = 0.0
-    else:
-        avg_rating = float(avg_rating)
+    return statistics_snapshots.serve("doctors", db, response)
+
+@statistics_snapshots.register("doctors")
+def compute_doctor_stats(db: Session):
+    # Doctor counts and rating totals per specialty in one grouped query;
+    # the hospital-wide figures are the sums of the groups. Ratings come from
+    # the per-doctor aggregates (see app/aggregates.py), not the feedback table.
+    specialties_query = (
+        db.query(
+            Doctor.specialty,
+            func.count(Doctor.id),
+            func.coalesce(func.sum(DoctorAggregate.feedback_count), 0),
+            func.coalesce(func.sum(DoctorAggregate.rating_sum), 0)
+        )
+        .outerjoin(DoctorAggregate, DoctorAggregate.doctor_id == Doctor.id)
+        .group_by(Doctor.specialty)
+        .order_by(Doctor.specialty)
+        .all()
+    )
+    total_doctors = sum(count for _, count, _, _ in specialties_query)
+    feedback_count = sum(int(feedback) for _, _, feedback, _ in specialties_query)
+    rating_sum = sum(int(ratings) for _, _, _, ratings in specialties_query)
+    avg_rating = float(rating_sum) / feedback_count if feedback_count else 0.0
+    specialties = [{"name": specialty, "count": count} for specialty, count, _, _ in specialties_query]
     
     # Get top performers (doctors with highest average ratings)
+    doctor_avg = DoctorAggregate.rating_sum * 1.0 / DoctorAggregate.feedback_count
     top_performers_query = db.query(
         Doctor.name,
         Doctor.specialty,
-        func.avg(Feedback.rating).label('avg_rating')
-    ).join(Feedback, Feedback.doctor_id == Doctor.id).group_by(Doctor.id).order_by(func.avg(Feedback.rating).desc()).limit(3)
+        doctor_avg.label('avg_rating')
+    ).join(DoctorAggregate, DoctorAggregate.doctor_id == Doctor.id).filter(DoctorAggregate.feedback_count > 0).order_by(doctor_avg.desc()).limit(3)
     
     top_performers = []
     for doctor in top_performers_query:
@@ -153,10 +244,6 @@ def get_doctor_stats(db: Session = Depends(get_db)):
             "rating": round(float(doctor.avg_rating), 1)
         })
     
-    # Get specialties count
-    specialties_query = db.query(Doctor.specialty, func.count(Doctor.id)).group_by(Doctor.specialty).all()
-    specialties = [{"name": specialty, "count": count} for specialty, count in specialties_query]
-    
     return {
         "totalDoctors": total_doctors,
         "averageRating": round(avg_rating, 1),
@@ -165,30 +252,148 @@ def get_doctor_stats(db: Session = Depends(get_db)):
     }
 
 @router.get("/treatment-outcomes", response_model=List[TreatmentOutcomes])
-def get_treatment_outcomes(db: Session = Depends(get_db)):
+def get_treatment_outcomes(response: Response, db: Session = Depends(get_db)):
     """Get treatment outcomes statistics"""
-    # For now, we'll create mock data since we don't have treatment outcome tracking
-    outcomes = [
-        {"name": "Successful", "value": 76},
-        {"name": "Partial Improvement", "value": 15},
-        {"name": "No Change", "value": 6},
-        {"name": "Complications", "value": 3}
+    return statistics_snapshots.serve("treatment_outcomes", db, response)
+
+@statistics_snapshots.register("treatment_outcomes")
+def compute_treatment_outcomes(db: Session):
+    # We don't track treatment outcomes, so these are appointments by status,
+    # read from the activity counters (see app/activity.py)
+    totals = counter_totals(db, "appointment_status")
+    return [
+        {"name": status.replace("_", " ").title(), "value": value}
+        for status, value in sorted(totals.items(), key=lambda item: -item[1])
+        if value > 0
     ]
-    
-    return outcomes
 
 @router.get("/patient-admissions", response_model=List[PatientAdmissionsData])
-def get_patient_admissions(db: Session = Depends(get_db)):
+def get_patient_admissions(response: Response, db: Session = Depends(get_db)):
     """Get patient admissions data"""
-    # For now, we'll create mock data since we don't have monthly admission tracking
-    admissions_data = [
-        {"name": "Jan", "emergency": 124, "scheduled": 185},
-        {"name": "Feb", "emergency": 115, "scheduled": 178},
-        {"name": "Mar", "emergency": 135, "scheduled": 189},
-        {"name": "Apr", "emergency": 128, "scheduled": 195},
-        {"name": "May", "emergency": 144, "scheduled": 203},
-        {"name": "Jun", "emergency": 155, "scheduled": 211},
-        {"name": "Jul", "emergency": 138, "scheduled": 204}
-    ]
+    return statistics_snapshots.serve("patient_admissions", db, response)
+
+@statistics_snapshots.register("patient_admissions")
+def compute_patient_admissions(db: Session):
+    # Appointments per month of the last seven months, emergency ones told
+    # apart by their category, read from the activity counters
+    return monthly_admissions(db, ADMISSION_MONTHS, datetime.utcnow().date())
+
+@router.get("/sentiment", response_model=List[SentimentStats])
+def get_sentiment_stats(
+    doctor_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    group_by: str = Query("doctor_category", pattern="^(doctor|category|doctor_category)$"),
+    db: Session = Depends(get_db)
+):
+    """Get comment sentiment per doctor and/or feedback category"""
+    by_doctor = group_by in ("doctor", "doctor_category")
+    by_category = group_by in ("category", "doctor_category")
+    columns = []
+    if by_doctor:
+        columns += [Feedback.doctor_id, Doctor.name]
+    if by_category:
+        columns += [Feedback.category_id, FeedbackCategory.name]
+    query = db.query(
+        *columns,
+        func.count(FeedbackSentiment.feedback_id),
+        func.avg(FeedbackSentiment.score),
+        func.sum(case((FeedbackSentiment.label == "positive", 1), else_=0)),
+        func.sum(case((FeedbackSentiment.label == "neutral", 1), else_=0)),
+        func.sum(case((FeedbackSentiment.label == "negative", 1), else_=0))
+    ).join(Feedback, Feedback.id == FeedbackSentiment.feedback_id)
+    if by_doctor:
+        query = query.outerjoin(Doctor, Doctor.id == Feedback.doctor_id)
+    if by_category:
+        query = query.outerjoin(FeedbackCategory, FeedbackCategory.id == Feedback.category_id)
+    if doctor_id:
+        query = query.filter(Feedback.doctor_id == doctor_id)
+    if category_id:
+        query = query.filter(Feedback.category_id == category_id)
+    rows = query.group_by(*columns).order_by(*columns).all()
     
-    return admissions_data
\ No newline at end of file
+    stats = []
+    for row in rows:
+        row = list(row)
+        doctor = (row.pop(0), row.pop(0)) if by_doctor else (None, None)
+        category = (row.pop(0), row.pop(0)) if by_category else (None, None)
+        count, average, positive, neutral, negative = row
+        stats.append(SentimentStats(
+            doctorId=doctor[0],
+            doctorName=doctor[1],
+            categoryId=category[0],
+            categoryName=category[1],
+            feedbackCount=count,
+            averageScore=round(float(average or 0), 3),
+            positive=positive or 0,
+            neutral=neutral or 0,
+            negative=negative or 0
+        ))
+    return stats
+
+@router.get("/ratings/timeseries", response_model=List[RatingPoint])
+def get_rating_timeseries(
+    bucket: str = Query("week", pattern="^(day|week|month)$"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    doctor_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    specialty: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get feedback ratings over time for the hospital, a specialty, a doctor or a category (default: the last two years)"""
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=730)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    return rating_timeseries(db, bucket, date_from, date_to, doctor_id, category_id, specialty)
+
+def _alert_stats(alert: RatingAlert, doctor_name: Optional[str], category_name: Optional[str]) -> RatingAlertStats:
+    return RatingAlertStats(
+        id=alert.id,
+        doctorId=alert.doctor_id,
+        doctorName=doctor_name,
+        categoryId=alert.category_id,
+        categoryName=category_name,
+        status=alert.status,
+        baselineRating=round(alert.baseline_mean or 0, 2),
+        recentRating=round(alert.recent_mean or 0, 2),
+        detectedAt=alert.detected_at.isoformat(),
+        updatedAt=alert.updated_at.isoformat() if alert.updated_at else None,
+        closedAt=alert.closed_at.isoformat() if alert.closed_at else None
+    )
+
+@router.get("/alerts", response_model=List[RatingAlertStats])
+def get_rating_alerts(
+    status: str = Query("open", pattern="^(open|recovered|resolved|all)$"),
+    doctor_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """Get significant rating drops flagged by the anomaly detector, newest first"""
+    query = (
+        db.query(RatingAlert, Doctor.name, FeedbackCategory.name)
+        .outerjoin(Doctor, Doctor.id == RatingAlert.doctor_id)
+        .outerjoin(FeedbackCategory, FeedbackCategory.id == RatingAlert.category_id)
+    )
+    if status != "all":
+        query = query.filter(RatingAlert.status == status)
+    if doctor_id:
+        query = query.filter(RatingAlert.doctor_id == doctor_id)
+    rows = query.order_by(RatingAlert.detected_at.desc(), RatingAlert.id.desc()).limit(limit).all()
+    return [_alert_stats(alert, doctor_name, category_name) for alert, doctor_name, category_name in rows]
+
+@router.post("/alerts/{alert_id}/resolve", response_model=RatingAlertStats)
+def resolve_rating_alert(alert_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Mark a rating alert as handled"""
+    alert = db.get(RatingAlert, alert_id)
+    if not alert:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    if alert.status != "resolved":
+        now = datetime.utcnow()
+        alert.status = "resolved"
+        alert.updated_at = now
+        alert.closed_at = alert.closed_at or now
+        db.commit()
+    doctor = db.get(Doctor, alert.doctor_id)
+    category = db.get(FeedbackCategory, alert.category_id) if alert.category_id else None
+    return _alert_stats(alert, doctor.name if doctor else None, category.name if category else None)
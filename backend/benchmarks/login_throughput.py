@@ -0,0 +1,131 @@
+"""Login throughput under concurrency, bcrypt inline versus in the password pool
+
+Fires LOGINS_PER_LEVEL logins at each concurrency level against a throwaway
+database and reports logins per second, rejected (503) logins and the p95
+latency of a trivial threadpool task probed during the burst, which stands
+for every other API call waiting for a thread. "inline" is the previous
+login, run whole in the threadpool with bcrypt in the handler.
+
+Run from the backend directory:
+    python -m benchmarks.login_throughput
+Set BENCHMARK_DATABASE_URL to use an empty PostgreSQL database instead of
+in-memory SQLite (its tables are dropped and recreated).
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from db.database import Base
+from db.models import Patient
+from app.auth import LoginRequest, login
+from app.identities import find_account, rebuild_identities
+from app.passwords import password_pool, pwd_context
+
+BENCHMARK_DATABASE_URL = os.environ.get("BENCHMARK_DATABASE_URL", "sqlite://")
+CONCURRENCY_LEVELS = [1, 8, 32, 64]
+LOGINS_PER_LEVEL = 64
+ACCOUNTS = 100
+PROBE_INTERVAL_SECONDS = 0.01
+
+def inline_login(Session, email: str, password: str):
+    """The login as it was: lookup and bcrypt on a threadpool thread"""
+    db = Session()
+    try:
+        _, user = find_account(db, email)
+        if not user or not pwd_context.verify(password, user.password):
+            raise HTTPException(status_code=401, detail="Invalid email or password")
+    finally:
+        db.close()
+
+async def pooled_login(Session, email: str, password: str):
+    db = Session()
+    try:
+        await login(LoginRequest(email=email, password=password), db)
+    finally:
+        db.close()
+
+async def burst(Session, mode: str, concurrency: int):
+    """Return (logins per second, rejected, p95 probe latency in ms)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    rejected = 0
+
+    async def one(index: int):
+        nonlocal rejected
+        email = f"patient{index % ACCOUNTS}@example.com"
+        async with semaphore:
+            try:
+                if mode == "inline":
+                    await run_in_threadpool(inline_login, Session, email, "password")
+                else:
+                    await pooled_login(Session, email, "password")
+            except HTTPException as e:
+                if e.status_code != 503:
+                    raise
+                rejected += 1
+
+    probes = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await run_in_threadpool(lambda: None)
+            probes.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(LOGINS_PER_LEVEL)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    p95 = statistics.quantiles(probes, n=20)[-1] if len(probes) >= 2 else (probes[0] if probes else 0.0)
+    return (LOGINS_PER_LEVEL - rejected) / elapsed, rejected, p95
+
+def seed(engine):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    hashed = pwd_context.hash("password")
+    with engine.begin() as conn:
+        conn.execute(Patient.__table__.insert(), [
+            {"id": i, "email": f"patient{i}@example.com", "password": hashed, "first_name": "Patient", "last_name": str(i), "is_active": True}
+            for i in range(ACCOUNTS)
+        ])
+
+async def run(Session):
+    # Start the worker processes before timing
+    await asyncio.gather(*(password_pool.hash("warm-up") for _ in range(password_pool.workers)))
+    print(f"password pool: {password_pool.workers} workers, queue limit {password_pool.queue_limit}")
+    print(f"{'mode':<8} {'concurrency':>11} {'logins/s':>9} {'rejected':>9} {'probe p95 ms':>13}")
+    for mode in ("inline", "pool"):
+        for concurrency in CONCURRENCY_LEVELS:
+            rate, rejected, p95 = await burst(Session, mode, concurrency)
+            print(f"{mode:<8} {concurrency:>11} {rate:>9.1f} {rejected:>9} {p95:>13.1f}")
+
+def main():
+    if BENCHMARK_DATABASE_URL.startswith("sqlite"):
+        engine = create_engine(BENCHMARK_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(BENCHMARK_DATABASE_URL, pool_size=20, max_overflow=60)
+    seed(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    db = Session()
+    try:
+        rebuild_identities(db)
+        db.commit()
+    finally:
+        db.close()
+    try:
+        asyncio.run(run(Session))
+    finally:
+        password_pool.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
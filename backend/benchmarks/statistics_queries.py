@@ -0,0 +1,119 @@
+"""Query count and latency of the department and doctor statistics
+
+Seeds a throwaway database with 50, 500 and 5,000 doctors (one specialty
+per ten doctors, with feedback and appointments) and times the
+/statistics/departments and /statistics/doctors computations against it
+(the routes themselves serve snapshots, see app/snapshots.py), next to
+the former per-specialty implementation of the department statistics.
+
+Run from the backend directory:
+    python -m benchmarks.statistics_queries
+Set BENCHMARK_DATABASE_URL to benchmark against an empty PostgreSQL database
+instead of in-memory SQLite (its tables are dropped and recreated).
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as time_type, timedelta
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from db.database import Base
+from db.models import Appointment, Doctor, Feedback, FeedbackCategory, Patient
+from app.aggregates import rebuild_doctor_aggregates
+from app.statistics import compute_department_stats, compute_doctor_stats
+
+BENCHMARK_DATABASE_URL = os.environ.get("BENCHMARK_DATABASE_URL", "sqlite://")
+DOCTOR_COUNTS = [50, 500, 5000]
+DOCTORS_PER_SPECIALTY = 10
+PATIENTS = 2000
+FEEDBACK_PER_DOCTOR = 20
+APPOINTMENTS_PER_DOCTOR = 10
+REPEATS = 5
+
+def legacy_department_stats(db):
+    """The department statistics as they were: two extra queries per specialty"""
+    departments = []
+    for specialty, count in db.query(Doctor.specialty, func.count(Doctor.id)).group_by(Doctor.specialty).all():
+        avg_rating = db.query(func.avg(Feedback.rating)).join(Doctor).filter(Doctor.specialty == specialty).scalar()
+        patient_count = db.query(func.count(Appointment.patient_id.distinct())).join(Doctor).filter(Doctor.specialty == specialty).scalar()
+        departments.append({"name": specialty, "avgRating": round(float(avg_rating or 0), 1), "patients": patient_count, "doctors": count})
+    return departments
+
+def seed(engine, doctors: int):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rng = random.Random(doctors)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(FeedbackCategory.__table__.insert(), [{"id": i, "name": f"Category {i}"} for i in range(1, 7)])
+        conn.execute(Patient.__table__.insert(), [
+            {"id": i, "email": f"patient{i}@example.com", "password": "x", "first_name": "Patient", "last_name": str(i), "is_active": True}
+            for i in range(1, PATIENTS + 1)
+        ])
+        conn.execute(Doctor.__table__.insert(), [
+            {"id": i, "email": f"doctor{i}@example.com", "password": "x", "name": f"Doctor {i}",
+             "specialty": f"Specialty {i % max(doctors // DOCTORS_PER_SPECIALTY, 1)}", "is_active": True}
+            for i in range(1, doctors + 1)
+        ])
+        conn.execute(Feedback.__table__.insert(), [
+            {"patient_id": rng.randint(1, PATIENTS), "doctor_id": doctor_id, "category_id": rng.randint(1, 6),
+             "rating": rng.randint(1, 5), "comment": "", "created_at": now - timedelta(days=rng.randint(0, 365))}
+            for doctor_id in range(1, doctors + 1) for _ in range(FEEDBACK_PER_DOCTOR)
+        ])
+        conn.execute(Appointment.__table__.insert(), [
+            {"patient_id": rng.randint(1, PATIENTS), "doctor_id": doctor_id, "date": date.today() + timedelta(days=rng.randint(-60, 60)),
+             "time": time_type(rng.randint(8, 16)), "status": "scheduled", "created_at": now}
+            for doctor_id in range(1, doctors + 1) for _ in range(APPOINTMENTS_PER_DOCTOR)
+        ])
+
+def measure(Session, handler):
+    """Run the handler REPEATS times; return (statements per call, best latency in ms)"""
+    statements = []
+    def count(*args):
+        statements.append(1)
+    engine = Session.kw["bind"]
+    event.listen(engine, "before_cursor_execute", count)
+    best = None
+    try:
+        for _ in range(REPEATS):
+            db = Session()
+            try:
+                start = time.perf_counter()
+                handler(db)
+                elapsed = time.perf_counter() - start
+            finally:
+                db.close()
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return len(statements) // REPEATS, best * 1000
+
+def main():
+    if BENCHMARK_DATABASE_URL.startswith("sqlite"):
+        engine = create_engine(BENCHMARK_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(BENCHMARK_DATABASE_URL)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    handlers = [
+        ("departments (legacy)", legacy_department_stats),
+        ("departments", compute_department_stats),
+        ("doctors", compute_doctor_stats),
+    ]
+    print(f"{'doctors':>8} {'handler':<22} {'queries':>8} {'ms':>9}")
+    for doctors in DOCTOR_COUNTS:
+        seed(engine, doctors)
+        db = Session()
+        try:
+            rebuild_doctor_aggregates(db)
+            db.commit()
+        finally:
+            db.close()
+        for name, handler in handlers:
+            queries, ms = measure(Session, handler)
+            print(f"{doctors:>8} {name:<22} {queries:>8} {ms:>9.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,15 @@
+-- Convert appointments.date/time from YYYY-MM-DD / HH:MM strings to native
+-- DATE / TIME columns and add the composite indexes used by the calendar
+-- and date-range queries. Base.metadata.create_all only creates missing
+-- tables, so existing databases need this script once (PostgreSQL).
+
+BEGIN;
+
+ALTER TABLE appointments
+    ALTER COLUMN date TYPE DATE USING date::date,
+    ALTER COLUMN time TYPE TIME USING time::time;
+
+CREATE INDEX IF NOT EXISTS ix_appointments_doctor_id_date ON appointments (doctor_id, date);
+CREATE INDEX IF NOT EXISTS ix_appointments_patient_id_date ON appointments (patient_id, date);
+
+COMMIT;
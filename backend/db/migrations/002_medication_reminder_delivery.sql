@@ -0,0 +1,12 @@
+-- Delivery outcome of the last SMS sent for each medication reminder,
+-- written by the SMS dispatcher (PostgreSQL).
+
+BEGIN;
+
+ALTER TABLE medication_reminders
+    ADD COLUMN IF NOT EXISTS last_delivery_status VARCHAR,
+    ADD COLUMN IF NOT EXISTS last_delivery_at TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS last_delivery_error TEXT,
+    ADD COLUMN IF NOT EXISTS last_delivery_attempts INTEGER;
+
+COMMIT;
@@ -0,0 +1,6 @@
+-- Indexes behind the feedback list filters and its id-ordered pages (PostgreSQL).
+
+CREATE INDEX IF NOT EXISTS ix_feedback_doctor_id_id ON feedback (doctor_id, id);
+CREATE INDEX IF NOT EXISTS ix_feedback_patient_id_id ON feedback (patient_id, id);
+CREATE INDEX IF NOT EXISTS ix_feedback_category_id_id ON feedback (category_id, id);
+CREATE INDEX IF NOT EXISTS ix_feedback_created_at ON feedback (created_at);
@@ -0,0 +1,9 @@
+-- Full-text search indexes over feedback comments, one per text search
+-- configuration used by GET /feedback/search (PostgreSQL).
+-- CONCURRENTLY keeps the feedback table writable while the indexes build,
+-- so run this file outside a transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_feedback_comment_english
+    ON feedback USING gin (to_tsvector('english', coalesce(comment, '')));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_feedback_comment_french
+    ON feedback USING gin (to_tsvector('french', coalesce(comment, '')));
@@ -0,0 +1,5 @@
+-- Device-generated ids that deduplicate feedback uploaded through
+-- POST /feedback/batch (PostgreSQL). Run outside a transaction.
+
+ALTER TABLE feedback ADD COLUMN IF NOT EXISTS client_id VARCHAR;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_feedback_client_id ON feedback (client_id);
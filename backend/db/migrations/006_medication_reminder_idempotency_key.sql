@@ -0,0 +1,6 @@
+-- Idempotency-Key of the request that created each medication reminder,
+-- unique per patient (PostgreSQL). Run outside a transaction.
+
+ALTER TABLE medication_reminders ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_medication_reminders_patient_id_idempotency_key
+    ON medication_reminders (patient_id, idempotency_key);
@@ -0,0 +1,20 @@
+-- Queue of ratings not yet seen by the rating anomaly detector (PostgreSQL).
+-- Run before starting this version: it creates the table and queues the
+-- feedback past the detector's former id watermark.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS pending_ratings (
+    feedback_id INTEGER PRIMARY KEY REFERENCES feedback (id) ON DELETE CASCADE,
+    doctor_id INTEGER,
+    category_id INTEGER,
+    rating INTEGER
+);
+
+INSERT INTO pending_ratings (feedback_id, doctor_id, category_id, rating)
+SELECT id, doctor_id, category_id, rating
+FROM feedback
+WHERE id > COALESCE((SELECT last_id FROM pipeline_watermarks WHERE name = 'rating_anomaly'), 0)
+ON CONFLICT (feedback_id) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- Queue of feedback not yet scored by the sentiment pipeline (PostgreSQL).
+-- Run before starting this version: it creates the table and queues every
+-- feedback row without a score, including rows the former id watermark
+-- skipped.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS pending_sentiment (
+    feedback_id INTEGER PRIMARY KEY REFERENCES feedback (id) ON DELETE CASCADE
+);
+
+INSERT INTO pending_sentiment (feedback_id)
+SELECT f.id
+FROM feedback f
+WHERE NOT EXISTS (SELECT 1 FROM feedback_sentiment s WHERE s.feedback_id = f.id)
+ON CONFLICT (feedback_id) DO NOTHING;
+
+COMMIT;
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, DateTime, Time
+from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, Text, Date, DateTime, Time, Index, DDL, event
 from datetime import datetime
 from sqlalchemy.orm import relationship
 from db.database import Base
@@ -46,9 +46,40 @@ class Feedback(Base):
     rating = Column(Integer)
     comment = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Id generated by the submitting device, so re-uploaded batches are not stored twice
+    client_id = Column(String)
     patient = relationship("Patient")
     doctor = relationship("Doctor")
     category = relationship("FeedbackCategory")
+    __table_args__ = (
+        Index("ux_feedback_client_id", "client_id", unique=True),
+        Index("ix_feedback_doctor_id_id", "doctor_id", "id"),
+        Index("ix_feedback_patient_id_id", "patient_id", "id"),
+        Index("ix_feedback_category_id_id", "category_id", "id"),
+        Index("ix_feedback_created_at", "created_at"),
+    )
+
+# Full-text search over feedback comments (app/search.py). PostgreSQL gets one
+# expression GIN index per text search configuration; SQLite, used for local
+# testing, gets an external-content FTS5 table kept in sync by triggers.
+FEEDBACK_SEARCH_CONFIGS = ("english", "french")
+for _config in FEEDBACK_SEARCH_CONFIGS:
+    event.listen(Feedback.__table__, "after_create", DDL(
+        f"CREATE INDEX IF NOT EXISTS ix_feedback_comment_{_config} ON feedback "
+        f"USING gin (to_tsvector('{_config}', coalesce(comment, '')))"
+    ).execute_if(dialect="postgresql"))
+for _statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS feedback_fts USING fts5("
+    "comment, content='feedback', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS feedback_fts_insert AFTER INSERT ON feedback BEGIN "
+    "INSERT INTO feedback_fts (rowid, comment) VALUES (new.id, new.comment); END",
+    "CREATE TRIGGER IF NOT EXISTS feedback_fts_delete AFTER DELETE ON feedback BEGIN "
+    "INSERT INTO feedback_fts (feedback_fts, rowid, comment) VALUES ('delete', old.id, old.comment); END",
+    "CREATE TRIGGER IF NOT EXISTS feedback_fts_update AFTER UPDATE OF comment ON feedback BEGIN "
+    "INSERT INTO feedback_fts (feedback_fts, rowid, comment) VALUES ('delete', old.id, old.comment); "
+    "INSERT INTO feedback_fts (rowid, comment) VALUES (new.id, new.comment); END",
+):
+    event.listen(Feedback.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
 
 class MedicationReminder(Base):
     __tablename__ = "medication_reminders"
@@ -59,7 +90,17 @@ class MedicationReminder(Base):
     frequency = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Outcome of the most recent SMS sent for this reminder
+    last_delivery_status = Column(String)  # sent, failed
+    last_delivery_at = Column(DateTime)
+    last_delivery_error = Column(Text)
+    last_delivery_attempts = Column(Integer)
+    # Idempotency-Key header of the request that created the reminder, unique per patient
+    idempotency_key = Column(String)
     patient = relationship("Patient")
+    __table_args__ = (
+        Index("ux_medication_reminders_patient_id_idempotency_key", "patient_id", "idempotency_key", unique=True),
+    )
 
 # Add new models for appointments and medications
 class Appointment(Base):
@@ -67,14 +108,18 @@ class Appointment(Base):
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
-    date = Column(String, nullable=False)  # Store as string in YYYY-MM-DD format
-    time = Column(String, nullable=False)  # Store as string in HH:MM format
+    date = Column(Date, nullable=False)
+    time = Column(Time, nullable=False)
     category = Column(String)  # Appointment category/type
     description = Column(Text)  # Description or notes
     status = Column(String, default="scheduled")  # scheduled, completed, cancelled
     created_at = Column(DateTime, default=datetime.utcnow)
     patient = relationship("Patient")
     doctor = relationship("Doctor")
+    __table_args__ = (
+        Index("ix_appointments_doctor_id_date", "doctor_id", "date"),
+        Index("ix_appointments_patient_id_date", "patient_id", "date"),
+    )
 
 class Medication(Base):
     __tablename__ = "medications"
@@ -89,4 +134,152 @@ class Medication(Base):
     end_date = Column(String)  # YYYY-MM-DD format
     created_at = Column(DateTime, default=datetime.utcnow)
     patient = relationship("Patient")
-    doctor = relationship("Doctor")
\ No newline at end of file
+    doctor = relationship("Doctor")
+
+class NotificationOutbox(Base):
+    """Outgoing notifications, written in the same transaction as the change that triggers them"""
+    __tablename__ = "notification_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    idempotency_key = Column(String, unique=True, nullable=False)  # One message per key, ever
+    channel = Column(String, nullable=False, default="sms")
+    recipient = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    reminder_id = Column(Integer, ForeignKey("medication_reminders.id"))
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = Column(DateTime)
+    sent_at = Column(DateTime)
+    provider_id = Column(String)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("ix_notification_outbox_status_available_at", "status", "available_at"),
+    )
+
+
+# Running per-doctor feedback totals and distinct patient counts, maintained by app/aggregates.py
+class DoctorAggregate(Base):
+    __tablename__ = "doctor_aggregates"
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), primary_key=True)
+    feedback_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_sum_sq = Column(Integer, nullable=False, default=0)
+    patient_count = Column(Integer, nullable=False, default=0)
+
+class DoctorCategoryAggregate(Base):
+    __tablename__ = "doctor_category_aggregates"
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("feedback_categories.id"), primary_key=True)
+    feedback_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_sum_sq = Column(Integer, nullable=False, default=0)
+
+class DoctorPatientLink(Base):
+    """Every patient who has had an appointment with, or left feedback for, a doctor"""
+    __tablename__ = "doctor_patients"
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), primary_key=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), primary_key=True)
+
+# Sentiment score (-1..1) and keywords of each feedback comment, written by app/sentiment.py
+class FeedbackSentiment(Base):
+    __tablename__ = "feedback_sentiment"
+    feedback_id = Column(Integer, ForeignKey("feedback.id"), primary_key=True)
+    score = Column(Float, nullable=False)
+    label = Column(String, nullable=False)  # positive, neutral or negative
+    keywords = Column(String)  # comma separated, most frequent first
+    scored_at = Column(DateTime, default=datetime.utcnow)
+
+class PipelineWatermark(Base):
+    """Highest source row id a background pipeline has processed"""
+    __tablename__ = "pipeline_watermarks"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class RatingRollup(Base):
+    """Feedback rating totals per time bucket, doctor and category (app/rollups.py)
+
+    Feedback lands in 'day' buckets; old days are folded into 'week' and
+    'month' buckets by compaction.
+    """
+    __tablename__ = "rating_rollups"
+    granularity = Column(String, primary_key=True)  # day, week or month
+    bucket_start = Column(Date, primary_key=True)
+    doctor_id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    feedback_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_sum_sq = Column(Integer, nullable=False, default=0)
+    __table_args__ = (
+        Index("ix_rating_rollups_doctor_id_bucket", "doctor_id", "granularity", "bucket_start"),
+    )
+
+class PendingRating(Base):
+    """Feedback not yet seen by the rating anomaly detector, queued in the feedback's own transaction"""
+    __tablename__ = "pending_ratings"
+    feedback_id = Column(Integer, ForeignKey("feedback.id", ondelete="CASCADE"), primary_key=True)
+    doctor_id = Column(Integer)
+    category_id = Column(Integer)
+    rating = Column(Integer)
+
+class PendingSentiment(Base):
+    """Feedback not yet scored by the sentiment pipeline, queued in the feedback's own transaction"""
+    __tablename__ = "pending_sentiment"
+    feedback_id = Column(Integer, ForeignKey("feedback.id", ondelete="CASCADE"), primary_key=True)
+
+class RatingDetectorState(Base):
+    """Checkpoint of the rating anomaly detector for one doctor (category_id 0) or doctor and category"""
+    __tablename__ = "rating_detector_state"
+    doctor_id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    baseline_mean = Column(Float, nullable=False, default=0.0)
+    baseline_var = Column(Float, nullable=False, default=0.0)
+    ewma = Column(Float, nullable=False, default=0.0)
+    cusum = Column(Float, nullable=False, default=0.0)
+    window = Column(String)  # most recent ratings, comma separated
+    open_alert_id = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class RatingAlert(Base):
+    __tablename__ = "rating_alerts"
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("feedback_categories.id"))  # null: all categories
+    status = Column(String, nullable=False, default="open")  # open, recovered or resolved
+    baseline_mean = Column(Float)
+    recent_mean = Column(Float)
+    ewma = Column(Float)
+    cusum = Column(Float)
+    last_feedback_id = Column(Integer)
+    detected_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    closed_at = Column(DateTime)
+    __table_args__ = (
+        Index("ix_rating_alerts_status_detected_at", "status", "detected_at"),
+    )
+
+class ActivityCounter(Base):
+    """Daily activity counts (admissions by kind, appointment statuses, new patients)"""
+    __tablename__ = "activity_counters"
+    metric = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    key = Column(String, primary_key=True, default="")
+    value = Column(Integer, nullable=False, default=0)
+
+class StatisticsSnapshot(Base):
+    """Last computed payload of a dashboard statistics route, as JSON"""
+    __tablename__ = "statistics_snapshots"
+    name = Column(String, primary_key=True)
+    payload = Column(Text, nullable=False)
+    generated_at = Column(DateTime, nullable=False)
+
+class Identity(Base):
+    """Login index: every admin, doctor and patient by lower-cased email"""
+    __tablename__ = "identities"
+    email = Column(String, primary_key=True)
+    role = Column(String, nullable=False)  # admin, doctor or patient
+    admin_id = Column(Integer, ForeignKey("admins.id", ondelete="CASCADE"), unique=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id", ondelete="CASCADE"), unique=True)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), unique=True)
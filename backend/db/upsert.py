@@ -0,0 +1,51 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+def dialect_insert(db: Session, model):
+    """Dialect-specific INSERT construct supporting ON CONFLICT (PostgreSQL or SQLite)"""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def insert_ignore(db: Session, model, rows: list, index_elements: list):
+    """INSERT the rows, silently skipping any that collide on `index_elements`"""
+    if rows:
+        db.execute(dialect_insert(db, model).on_conflict_do_nothing(index_elements=index_elements), rows)
+
+def upsert_increment(db: Session, model, rows: list, index_elements: list, counters: list):
+    """Add each row's `counters` to the row with the same key, inserting it if missing
+
+    Rows sharing a key are summed first, since one statement may not update
+    the same row twice. The increments are applied atomically by the
+    database, so concurrent writers never lose an update.
+    """
+    merged = {}
+    for row in rows:
+        key = tuple(row[column] for column in index_elements)
+        if key in merged:
+            for counter in counters:
+                merged[key][counter] += row[counter]
+        else:
+            merged[key] = dict(row)
+    if not merged:
+        return
+    stmt = dialect_insert(db, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={counter: getattr(model, counter) + getattr(stmt.excluded, counter) for counter in counters},
+    )
+    db.execute(stmt, list(merged.values()))
+
+def upsert(db: Session, model, rows: list, index_elements: list):
+    """INSERT the rows, overwriting every other column of rows that already exist"""
+    if not rows:
+        return
+    stmt = dialect_insert(db, model)
+    columns = [column for column in rows[0] if column not in index_elements]
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: getattr(stmt.excluded, column) for column in columns},
+        ),
+        rows,
+    )
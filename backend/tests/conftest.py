@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from db.database import Base
+from db.models import Doctor, FeedbackCategory, Patient
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine, autoflush=False)
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def count_queries(engine):
+    """Context manager collecting the SQL statements run inside it"""
+    @contextmanager
+    def counting():
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+    return counting
+
+def seed_people(db, doctors=3, patients=3, categories=2):
+    db.add_all([Doctor(id=i, name=f"Doctor {i}", email=f"doctor{i}@example.com", password="x", specialty="General", is_active=True) for i in range(1, doctors + 1)])
+    db.add_all([Patient(id=i, first_name=f"Patient{i}", last_name="Test", email=f"patient{i}@example.com", password="x") for i in range(1, patients + 1)])
+    db.add_all([FeedbackCategory(id=i, name=f"Category {i}") for i in range(1, categories + 1)])
+    db.commit()
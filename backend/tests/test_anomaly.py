@@ -0,0 +1,40 @@
+import app.anomaly as anomaly
+from db.models import Feedback, PendingRating, RatingDetectorState
+from conftest import seed_people
+
+def add_feedback(db, feedback_id, rating):
+    db.add(Feedback(id=feedback_id, patient_id=1, doctor_id=1, category_id=1, rating=rating, comment=""))
+    db.flush()
+    anomaly.queue_ratings(db, [(feedback_id, 1, 1, rating)])
+    db.commit()
+
+def test_ratings_committed_out_of_id_order_are_all_seen(db, session_factory, monkeypatch):
+    monkeypatch.setattr(anomaly, "SessionLocal", session_factory)
+    seed_people(db)
+    detector = anomaly.RatingAnomalyDetector()
+
+    add_feedback(db, 2, 5)
+    assert detector.process_batch() == 1
+    # A batch upload holding a lower id commits after the higher one was processed
+    add_feedback(db, 1, 4)
+    assert detector.process_batch() == 1
+    assert detector.process_batch() == 0
+
+    state = db.get(RatingDetectorState, (1, anomaly.ALL_CATEGORIES))
+    assert state.count == 2
+    assert db.query(PendingRating).count() == 0
+
+def test_sustained_drop_raises_one_alert(db, session_factory, monkeypatch):
+    monkeypatch.setattr(anomaly, "SessionLocal", session_factory)
+    seed_people(db)
+    detector = anomaly.RatingAnomalyDetector()
+
+    for feedback_id in range(1, 61):
+        add_feedback(db, feedback_id, 5 if feedback_id <= 40 or feedback_id % 2 else 4)
+    for feedback_id in range(61, 81):
+        add_feedback(db, feedback_id, 1)
+    detector.process_batch()
+
+    alerts = db.query(anomaly.RatingAlert).filter(anomaly.RatingAlert.category_id.is_(None)).all()
+    assert len(alerts) == 1
+    assert alerts[0].status == "open"
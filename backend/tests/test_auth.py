@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from passlib.context import CryptContext
+from fastapi import HTTPException
+from db.models import Patient
+from app.auth import LoginRequest, PatientCreate, login, register_patient
+from app.identities import rebuild_identities
+from app.passwords import BCRYPT_ROUNDS, PasswordPool, password_pool, pwd_context
+
+@pytest.fixture(autouse=True)
+def stop_password_pool():
+    yield
+    password_pool.shutdown()
+
+def test_register_then_login(db):
+    data = PatientCreate(email="Ada@Example.com", password="s3cret", first_name="Ada", last_name="Lovelace", phone_number="+237600000000")
+    registered = asyncio.run(register_patient(data, db))
+
+    token = asyncio.run(login(LoginRequest(email="ada@example.com", password="s3cret"), db))
+    assert token["user_id"] == registered["patient_id"]
+    assert token["name"] == "Ada Lovelace"
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(login(LoginRequest(email="ada@example.com", password="wrong"), db))
+    assert error.value.status_code == 401
+
+def test_outdated_hash_is_upgraded_without_reloading_the_account(db, count_queries):
+    legacy = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS - 2).hash("s3cret")
+    db.add(Patient(id=1, email="old@example.com", password=legacy, first_name="Old", last_name="Hash"))
+    db.flush()
+    rebuild_identities(db)
+    db.commit()
+
+    with count_queries() as statements:
+        token = asyncio.run(login(LoginRequest(email="old@example.com", password="s3cret"), db))
+
+    assert token["name"] == "Old Hash"
+    # The lookup and the new hash; nothing reloads the account after the commit
+    assert [statement.split()[0] for statement in statements] == ["SELECT", "UPDATE"]
+    db.expire_all()
+    assert db.get(Patient, 1).password.startswith(f"$2b${BCRYPT_ROUNDS}$")
+
+def test_failed_password_jobs_are_counted_apart():
+    pool = PasswordPool(workers=1)
+    try:
+        assert asyncio.run(pool.verify_and_update("s3cret", pwd_context.hash("s3cret")))[0]
+        with pytest.raises(ValueError):
+            asyncio.run(pool.verify_and_update("s3cret", "not a bcrypt hash"))
+        assert pool.stats()["completed"] == 1
+        assert pool.stats()["failed"] == 1
+        assert pool.stats()["in_flight"] == 0
+    finally:
+        pool.shutdown()
@@ -0,0 +1,102 @@
+"""The availability index finds overlapping bookings and free slots
+
+The tests assume the default 30 minute slots between 08:00 and 17:00.
+"""
+from datetime import date, time, timedelta
+from db.models import Appointment
+from app.availability import AvailabilityIndex
+from conftest import seed_people
+
+DAY = date.today() + timedelta(days=7)
+
+def book(db, start, doctor_id=1, day=DAY, status="scheduled"):
+    appointment = Appointment(patient_id=1, doctor_id=doctor_id, date=day, time=start, status=status)
+    db.add(appointment)
+    db.commit()
+    return appointment
+
+def test_overlapping_slot_conflicts(db):
+    seed_people(db)
+    booked = book(db, time(9, 0))
+    index = AvailabilityIndex()
+
+    assert index.find_conflict(db, 1, DAY, time(9, 0)) == booked.id
+    assert index.find_conflict(db, 1, DAY, time(9, 29)) == booked.id
+    assert index.find_conflict(db, 1, DAY, time(8, 31)) == booked.id
+    # Back to back slots and other doctors do not conflict
+    assert index.find_conflict(db, 1, DAY, time(8, 30)) is None
+    assert index.find_conflict(db, 1, DAY, time(9, 30)) is None
+    assert index.find_conflict(db, 2, DAY, time(9, 0)) is None
+
+def test_update_does_not_conflict_with_itself(db):
+    seed_people(db)
+    booked = book(db, time(9, 0))
+    other = book(db, time(10, 0))
+    index = AvailabilityIndex()
+
+    assert index.find_conflict(db, 1, DAY, time(9, 15), exclude_id=booked.id) is None
+    assert index.find_conflict(db, 1, DAY, time(9, 45), exclude_id=booked.id) == other.id
+
+def test_batch_conflicts_with_bookings_and_itself(db):
+    seed_people(db)
+    booked = book(db, time(9, 0))
+    index = AvailabilityIndex()
+
+    conflicts = index.find_batch_conflicts(db, [
+        (1, DAY, time(9, 0)),
+        (1, DAY, time(11, 0)),
+        (1, DAY, time(11, 15)),
+        (2, DAY, time(11, 0)),
+        (1, DAY + timedelta(days=1), time(11, 0)),
+    ])
+
+    assert conflicts == [booked.id, None, -2, None, None]
+    # The batch is checked against a copy: the index itself is unchanged
+    assert index.find_conflict(db, 1, DAY, time(11, 0)) is None
+
+def test_free_slots_at_opening_and_closing(db):
+    seed_people(db)
+    book(db, time(8, 0))
+    book(db, time(16, 30))
+    index = AvailabilityIndex()
+
+    free = index.free_slots(db, [1, 2], DAY, DAY)[1][DAY.isoformat()]
+
+    assert free[0] == "08:30"
+    assert free[-1] == "16:00"
+    assert index.free_slots(db, [2], DAY, DAY)[2][DAY.isoformat()][0] == "08:00"
+
+def test_free_slots_skip_past_days(db):
+    seed_people(db)
+    index = AvailabilityIndex()
+    yesterday = date.today() - timedelta(days=1)
+
+    free = index.free_slots(db, [1], yesterday, yesterday + timedelta(days=1))[1]
+
+    assert yesterday.isoformat() not in free
+
+def test_cancelled_slot_is_free_again(db):
+    seed_people(db)
+    booked = book(db, time(9, 0))
+    index = AvailabilityIndex()
+    assert "09:00" not in index.free_slots(db, [1], DAY, DAY)[1][DAY.isoformat()]
+
+    booked.status = "cancelled"
+    db.commit()
+    # The routes drop the booking from the index once the change is committed
+    index.remove(1, DAY, booked.id)
+
+    assert "09:00" in index.free_slots(db, [1], DAY, DAY)[1][DAY.isoformat()]
+    assert index.find_conflict(db, 1, DAY, time(9, 0)) is None
+
+def test_conflict_check_reloads_the_day(db):
+    seed_people(db)
+    booked = book(db, time(9, 0))
+    index = AvailabilityIndex()
+    index.free_slots(db, [1], DAY, DAY)
+
+    # A cancel committed by another worker, whose index this one never saw
+    booked.status = "cancelled"
+    db.commit()
+
+    assert index.find_conflict(db, 1, DAY, time(9, 0)) is None
@@ -0,0 +1,17 @@
+import asyncio
+import app.dashboard as dashboard
+from conftest import seed_people
+
+def test_sections_load_concurrently_and_report_errors(db, session_factory, monkeypatch):
+    monkeypatch.setattr(dashboard, "SessionLocal", session_factory)
+    seed_people(db)
+    monkeypatch.setitem(dashboard.SECTIONS, "broken", lambda db, page: 1 / 0)
+
+    result = asyncio.run(dashboard.get_admin_dashboard(sections="hospital,doctors,broken", limit=2, debug=True))
+
+    assert set(result["sections"]) == {"hospital", "doctors"}
+    assert "generatedAt" in result["sections"]["hospital"]
+    assert len(result["sections"]["doctors"]["data"]) == 2
+    assert result["sections"]["doctors"]["nextCursor"] == "2"
+    assert "broken" in result["errors"]
+    assert set(result["timings"]) == {"hospital", "doctors", "broken", "total"}
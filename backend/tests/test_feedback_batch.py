@@ -0,0 +1,15 @@
+from app.feedback import _batch_create
+from conftest import seed_people
+
+def record(**overrides):
+    return {"client_id": "kiosk-1", "patient_id": 1, "doctor_id": 1, "category_id": 1, "rating": 5, "comment": "Great", **overrides}
+
+def test_invalid_rows_are_reported_per_row(db):
+    seed_people(db)
+
+    response = _batch_create(db, [record(), record(client_id=123), record(client_id="kiosk-3", rating="five")])
+
+    assert response.created == 1
+    assert [result.status for result in response.results] == ["created", "error", "error"]
+    assert response.results[1].client_id == "123"
+    assert response.results[2].client_id == "kiosk-3"
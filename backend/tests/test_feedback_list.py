@@ -0,0 +1,42 @@
+"""The feedback list loads its relationships with the rows and filters in SQL"""
+from datetime import datetime
+import pytest
+from fastapi import Response
+from db.models import Feedback
+from app.feedback import list_feedback
+from app.pagination import PageParams
+from conftest import seed_people
+
+def list_page(db, **filters):
+    params = {"doctor_id": None, "patient_id": None, "category_id": None, "date_from": None, "date_to": None, **filters}
+    return list_feedback(Response(), page=PageParams(limit=100, after=None, fields=None), db=db, **params)
+
+@pytest.mark.parametrize("rows", [1, 40])
+def test_feedback_list_query_count_is_constant(db, count_queries, rows):
+    seed_people(db)
+    db.add_all([
+        Feedback(patient_id=i % 3 + 1, doctor_id=i % 3 + 1, category_id=i % 2 + 1, rating=i % 5 + 1, comment="", created_at=datetime(2026, 1, 1))
+        for i in range(rows)
+    ])
+    db.commit()
+    db.expunge_all()
+
+    with count_queries() as statements:
+        items = list_page(db)
+
+    # One joined SELECT for the page and one for the doctors' rating aggregates
+    assert len(statements) == 2
+    assert len(items) == rows
+    assert items[0].doctor.name == "Doctor 1"
+    assert items[0].category.name == "Category 1"
+
+def test_feedback_list_filters_in_sql(db, count_queries):
+    seed_people(db)
+    db.add_all([Feedback(patient_id=1, doctor_id=doctor_id, category_id=1, rating=4, comment="") for doctor_id in (1, 2, 2, 3)])
+    db.commit()
+
+    with count_queries() as statements:
+        items = list_page(db, doctor_id=2)
+
+    assert [item.doctor_id for item in items] == [2, 2]
+    assert "doctor_id" in statements[0]
@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+from db.models import Admin, Identity
+from app.identities import add_identity, find_account, rebuild_identities, update_identity
+from conftest import seed_people
+
+def test_email_change_moves_the_entry(db):
+    seed_people(db)
+    rebuild_identities(db)
+    db.commit()
+
+    update_identity(db, "doctor", 1, "New.Address@Example.com")
+    db.commit()
+
+    role, doctor = find_account(db, "new.address@example.com")
+    assert (role, doctor.id) == ("doctor", 1)
+    assert db.get(Identity, "doctor1@example.com") is None
+    # Saving the same email again changes nothing
+    update_identity(db, "doctor", 1, "new.address@example.com")
+    db.commit()
+
+def test_lost_race_keeps_the_current_entry(db):
+    seed_people(db)
+    rebuild_identities(db)
+    db.commit()
+
+    # Another account registers the email between the check and the update
+    db.add(Admin(id=1, email="taken@example.com", password="x", name="Admin"))
+    db.flush()
+    add_identity(db, "admin", 1, "taken@example.com")
+    db.commit()
+    with pytest.raises(IntegrityError):
+        update_identity(db, "doctor", 1, "taken@example.com")
+    db.rollback()
+
+    role, doctor = find_account(db, "doctor1@example.com")
+    assert (role, doctor.id) == ("doctor", 1)
@@ -0,0 +1,41 @@
+"""Appointment and medication lists resolve names in the same query as the rows"""
+from datetime import date, time
+import pytest
+from fastapi import Response
+from db.models import Appointment, Medication
+from app.appointments import get_appointments
+from app.medications import get_medications
+from app.pagination import PageParams
+from conftest import seed_people
+
+def page(limit=100):
+    return PageParams(limit=limit, after=None, fields=None)
+
+@pytest.mark.parametrize("rows", [1, 40])
+def test_appointment_list_is_one_query(db, count_queries, rows):
+    seed_people(db)
+    db.add_all([Appointment(patient_id=i % 3 + 1, doctor_id=i % 3 + 1, date=date(2026, 1, 1), time=time(8 + i % 8), status="scheduled") for i in range(rows)])
+    db.commit()
+    db.expunge_all()
+
+    with count_queries() as statements:
+        items = get_appointments(Response(), None, None, None, None, None, None, page(), db, {})
+
+    assert len(statements) == 1
+    assert len(items) == rows
+    assert all(item.doctor_name and item.patient_name for item in items)
+
+@pytest.mark.parametrize("rows", [1, 40])
+def test_medication_list_is_one_query(db, count_queries, rows):
+    seed_people(db)
+    db.add_all([Medication(patient_id=i % 3 + 1, doctor_id=i % 3 + 1, medication="Paracetamol", dosage="500mg", frequency="daily") for i in range(rows)])
+    db.commit()
+    db.expunge_all()
+
+    with count_queries() as statements:
+        items = get_medications(Response(), None, None, page(), db, {})
+
+    assert len(statements) == 1
+    assert len(items) == rows
+    assert items[0].doctor_name == "Doctor 1"
+    assert items[0].patient_name == "Patient1 Test"
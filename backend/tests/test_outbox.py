@@ -0,0 +1,80 @@
+"""SMS composition and the outbox claim that combines a recipient's messages"""
+from datetime import datetime, timedelta
+import app.outbox as outbox
+import app.scheduler as scheduler
+from db.models import MedicationReminder, NotificationOutbox, Patient
+from app.sms import SIGNATURE, _split_at_segments, compose_messages, sms_segments
+from conftest import seed_people
+
+def test_short_bodies_share_one_sms():
+    bodies = [f"Take Aspirin {i}mg now.{SIGNATURE}" for i in range(3)]
+
+    messages = compose_messages(bodies, max_segments=1)
+
+    assert len(messages) == 1
+    text, indexes = messages[0]
+    assert indexes == [0, 1, 2]
+    assert text.count(SIGNATURE.strip()) == 1
+    assert sms_segments(text) == 1
+
+def test_bodies_start_a_new_sms_when_full():
+    bodies = ["x" * 100, "y" * 100, "z" * 10]
+
+    messages = compose_messages(bodies, max_segments=1)
+
+    assert [indexes for _, indexes in messages] == [[0], [1, 2]]
+    assert all(sms_segments(text) == 1 for text, _ in messages)
+
+def test_overlong_body_is_split_at_segment_boundaries():
+    body = "a" * 400
+
+    assert _split_at_segments(body, 1) == ["a" * 160, "a" * 160, "a" * 80]
+    assert _split_at_segments(body, 2) == ["a" * 306, "a" * 94]
+    # Extended characters cost two units and are never cut in half
+    assert _split_at_segments("€" * 100, 1) == ["€" * 80, "€" * 20]
+    assert compose_messages([body, "short"], max_segments=2) == [("a" * 306, [0]), ("a" * 94, [0]), ("short", [1])]
+
+def add_row(db, key, recipient, available_at, attempts=0):
+    db.add(NotificationOutbox(idempotency_key=key, recipient=recipient, body=key, status="pending", attempts=attempts, available_at=available_at))
+
+def test_claim_pulls_in_the_recipients_upcoming_rows(db, session_factory, monkeypatch):
+    monkeypatch.setattr(outbox, "SessionLocal", session_factory)
+    now = datetime.utcnow()
+    add_row(db, "due", "+1", now - timedelta(seconds=1))
+    add_row(db, "soon", "+1", now + timedelta(seconds=outbox.SMS_COALESCE_WINDOW_SECONDS - 60))
+    add_row(db, "later", "+1", now + timedelta(seconds=outbox.SMS_COALESCE_WINDOW_SECONDS + 60))
+    # Backing off after a failed attempt: not sent early
+    add_row(db, "retry", "+1", now + timedelta(seconds=30), attempts=1)
+    # Nothing is due for this recipient yet
+    add_row(db, "other", "+2", now + timedelta(seconds=60))
+    db.commit()
+
+    claimed = outbox.OutboxRelay(dispatcher=None)._claim()
+
+    assert sorted(row["body"] for row in claimed) == ["due", "soon"]
+
+def test_doses_minutes_apart_are_claimed_together(db, session_factory, monkeypatch):
+    monkeypatch.setattr(outbox, "SessionLocal", session_factory)
+    monkeypatch.setattr(scheduler, "SessionLocal", session_factory)
+    seed_people(db)
+    db.get(Patient, 1).phone_number = "+237600000001"
+    db.add_all([
+        MedicationReminder(id=1, patient_id=1, medication="Aspirin", time="08:00", frequency="daily"),
+        MedicationReminder(id=2, patient_id=1, medication="Metformin", time="08:03", frequency="daily"),
+    ])
+    db.commit()
+    reminders = scheduler.ReminderScheduler()
+    now = datetime.now()
+    first, second = now - timedelta(seconds=1), now + timedelta(minutes=3)
+    reminders._push(1, first)
+    reminders._push(2, second)
+
+    # The second dose is popped ahead of its time and held in the outbox until then
+    due = reminders._pop_due(now.timestamp() + outbox.SMS_COALESCE_WINDOW_SECONDS)
+    reminders._dispatch(due)
+    held = db.query(NotificationOutbox).filter(NotificationOutbox.reminder_id == 2).one()
+    assert abs(held.available_at - datetime.utcfromtimestamp(second.timestamp())) < timedelta(seconds=1)
+
+    claimed = outbox.OutboxRelay(dispatcher=None)._claim()
+
+    assert sorted(row["reminder_id"] for row in claimed) == [1, 2]
@@ -0,0 +1,60 @@
+"""List endpoints return everything unless a page is asked for, and project fields in SQL"""
+import json
+from datetime import datetime
+from fastapi import Response
+from db.models import Feedback, Patient
+from app.doctor import get_all_doctors
+from app.feedback import list_feedback
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, PageParams
+from app.patient import list_patients
+from conftest import seed_people
+
+def add_patients(db, count):
+    db.add_all([Patient(first_name=f"Extra{i}", last_name="Test", email=f"extra{i}@example.com", password="x") for i in range(count)])
+    db.commit()
+
+def test_unpaginated_without_limit_or_cursor(db):
+    add_patients(db, DEFAULT_PAGE_SIZE + 20)
+    response = Response()
+
+    items = list_patients(response, page=PageParams(limit=None, after=None, fields=None), db=db)
+
+    assert len(items) == DEFAULT_PAGE_SIZE + 20
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+def test_cursor_alone_pages_by_default_size(db):
+    add_patients(db, DEFAULT_PAGE_SIZE + 20)
+    response = Response()
+
+    items = list_patients(response, page=PageParams(limit=None, after=0, fields=None), db=db)
+
+    assert len(items) == DEFAULT_PAGE_SIZE
+    assert response.headers[NEXT_CURSOR_HEADER] == str(items[-1].id)
+
+def test_feedback_projection_selects_only_requested_columns(db, count_queries):
+    seed_people(db)
+    db.add_all([Feedback(patient_id=1, doctor_id=2, category_id=1, rating=4, comment="long comment", created_at=datetime(2026, 1, 1)) for _ in range(3)])
+    db.commit()
+    db.expunge_all()
+    params = {"doctor_id": None, "patient_id": None, "category_id": None, "date_from": None, "date_to": None}
+
+    with count_queries() as statements:
+        result = list_feedback(Response(), page=PageParams(limit=None, after=None, fields="id,rating"), db=db, **params)
+
+    # No joins, no aggregate lookup and no lazy loads of the skipped columns
+    assert len(statements) == 1
+    assert "comment" not in statements[0]
+    assert "doctors" not in statements[0]
+    assert json.loads(result.body) == [{"id": i, "rating": 4} for i in (1, 2, 3)]
+
+def test_doctor_projection_skips_the_aggregate_join(db, count_queries):
+    seed_people(db)
+    db.expunge_all()
+
+    with count_queries() as statements:
+        result = get_all_doctors(Response(), specialty=None, page=PageParams(limit=None, after=None, fields="id,name"), db=db)
+
+    assert len(statements) == 1
+    assert "doctor_aggregates" not in statements[0]
+    assert "email" not in statements[0]
+    assert json.loads(result.body) == [{"id": i, "name": f"Doctor {i}"} for i in (1, 2, 3)]
@@ -0,0 +1,32 @@
+from sqlalchemy import event
+from db.models import Doctor, FeedbackCategory
+from app.refcache import ReferenceCache
+from conftest import seed_people
+
+def test_load_overtaken_by_an_invalidation_is_not_kept(db, engine):
+    seed_people(db)
+    cache = ReferenceCache()
+
+    # The cache is invalidated while the load is in flight
+    def invalidate(*args):
+        cache.invalidate_categories()
+    event.listen(engine, "before_cursor_execute", invalidate)
+    try:
+        assert cache.category(db, 1).name == "Category 1"
+    finally:
+        event.remove(engine, "before_cursor_execute", invalidate)
+
+    db.query(FeedbackCategory).filter(FeedbackCategory.id == 1).update({"name": "Renamed"})
+    db.commit()
+    assert cache.category(db, 1).name == "Renamed"
+    assert cache.stats()["reloads"] == 2
+
+def test_doctor_created_elsewhere_is_looked_up_and_added(db):
+    seed_people(db, doctors=1)
+    cache = ReferenceCache()
+    assert cache.doctor(db, 1).name == "Doctor 1"
+
+    db.add(Doctor(id=2, name="Doctor 2", email="doctor2@example.com", password="x", specialty="General", is_active=True))
+    db.commit()
+    assert cache.doctor(db, 2).name == "Doctor 2"
+    assert cache.stats()["doctors_cached"] == 2
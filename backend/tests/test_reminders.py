@@ -0,0 +1,34 @@
+import asyncio
+from db.models import MedicationReminder, NotificationOutbox, Patient
+from app.reminders import create_reminder
+from app.schemas import MedicationReminderCreate
+from conftest import seed_people
+
+def create(db, patient_id, key):
+    reminder = MedicationReminderCreate(patient_id=patient_id, medication="Aspirin", time="08:00", frequency="daily")
+    return asyncio.run(create_reminder(reminder, idempotency_key=key, db=db))
+
+def test_retry_returns_the_first_reminder_without_a_phone_number(db):
+    seed_people(db)
+    db.query(Patient).filter(Patient.id == 1).update({"phone_number": None})
+    db.commit()
+
+    first = create(db, 1, "retry-me")
+    again = create(db, 1, "retry-me")
+
+    assert again.id == first.id
+    assert db.query(MedicationReminder).count() == 1
+
+def test_keys_are_scoped_to_the_patient(db):
+    seed_people(db)
+    db.query(Patient).update({"phone_number": "+237600000000"})
+    db.commit()
+
+    first = create(db, 1, "shared-key")
+    other = create(db, 2, "shared-key")
+    # A client key that looks like a reminder id does not match that reminder
+    numeric = create(db, 1, str(first.id))
+
+    assert len({first.id, other.id, numeric.id}) == 3
+    assert other.patient_id == 2
+    assert db.query(NotificationOutbox).count() == 3
@@ -0,0 +1,37 @@
+from datetime import timedelta
+import pytest
+import app.scheduler as scheduler
+from db.models import MedicationReminder
+from conftest import seed_people
+
+@pytest.mark.parametrize("frequency, interval", [
+    ("daily", timedelta(days=1)),
+    ("twice daily", timedelta(hours=12)),
+    ("3 times a day", timedelta(hours=8)),
+    ("3x daily", timedelta(hours=8)),
+    ("every 8 hours", timedelta(hours=8)),
+    ("every 2 days", timedelta(days=2)),
+    ("every other day", timedelta(days=2)),
+    ("take 2 tablets daily", timedelta(days=1)),
+    ("twice weekly", timedelta(days=3.5)),
+    ("as needed", timedelta(days=1)),
+])
+def test_reminder_interval(frequency, interval):
+    assert scheduler.reminder_interval(frequency) == interval
+
+def test_sync_picks_up_reminders_committed_out_of_order(db, session_factory, monkeypatch):
+    monkeypatch.setattr(scheduler, "SessionLocal", session_factory)
+    seed_people(db)
+    reminders = scheduler.ReminderScheduler()
+    reminders.load()
+
+    # Reminder 2 commits first; reminder 1 belongs to a transaction still in flight
+    db.add(MedicationReminder(id=2, patient_id=1, medication="Aspirin", time="08:00", frequency="daily"))
+    db.commit()
+    reminders.sync()
+    assert len(reminders) == 1
+
+    db.add(MedicationReminder(id=1, patient_id=1, medication="Aspirin", time="20:00", frequency="daily"))
+    db.commit()
+    reminders.sync()
+    assert len(reminders) == 2
@@ -0,0 +1,20 @@
+from db.models import Feedback
+from app.search import search_feedback
+from conftest import seed_people
+
+def test_search_pages_cover_every_match_once(db):
+    seed_people(db)
+    comments = ["waiting time was long", "long wait, long queue", "the wait was long but staff kind", "kind nurse"] * 5
+    db.add_all([Feedback(patient_id=1, doctor_id=1, category_id=1, rating=3, comment=comment) for comment in comments])
+    db.commit()
+
+    seen, after = [], None
+    while True:
+        rows, after = search_feedback(db, "long", None, [], 4, after)
+        seen += [feedback.id for feedback, _, _ in rows]
+        if after is None:
+            break
+
+    expected = [feedback.id for feedback in db.query(Feedback).filter(Feedback.comment.contains("long"))]
+    assert sorted(seen) == sorted(expected)
+    assert len(seen) == len(set(seen))
@@ -0,0 +1,31 @@
+from datetime import datetime
+import app.sentiment as sentiment
+from db.models import Feedback, FeedbackSentiment, PendingSentiment
+from app.feedback import _batch_create
+from conftest import seed_people
+
+def add_feedback(db, feedback_id, comment):
+    db.add(Feedback(id=feedback_id, patient_id=1, doctor_id=1, category_id=1, rating=3, comment=comment))
+    db.flush()
+    sentiment.queue_comments(db, [feedback_id])
+    db.commit()
+
+def test_backdated_and_late_feedback_is_scored(db, session_factory, monkeypatch):
+    monkeypatch.setattr(sentiment, "SessionLocal", session_factory)
+    seed_people(db)
+    add_feedback(db, 10, "Good doctor")
+    assert sentiment.process_batch() == 1
+
+    # A kiosk upload recorded a month ago, arriving now
+    _batch_create(db, [{
+        "client_id": "kiosk-2", "patient_id": 1, "doctor_id": 1, "category_id": 1, "rating": 5,
+        "comment": "Great staff", "submitted_at": datetime(2026, 1, 1).isoformat(),
+    }])
+    # A lower id committed after higher ones were scored
+    add_feedback(db, 5, "rude and dirty")
+    assert sentiment.process_batch() == 2
+    assert sentiment.process_batch() == 0
+
+    labels = dict(db.query(FeedbackSentiment.feedback_id, FeedbackSentiment.label))
+    assert labels == {5: "negative", 10: "positive", 11: "positive"}
+    assert db.query(PendingSentiment).count() == 0